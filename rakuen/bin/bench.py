@@ -0,0 +1,869 @@
+#!/usr/bin/env python3
+"""Rakuen Bench - reproducible micro-benchmarks for the Web UI backend.
+
+Runs against a throw-away workspace in a temporary directory unless
+--workspace is given, so it is safe to run next to a live system.
+
+Usage:
+    bench.py writes [--rows N] [--batch N] [--delay-ms MS]
+    bench.py profiles [--profiles safe,balanced,fast] [--writers N]
+                      [--readers N] [--seconds S] [--seed-rows N]
+    bench.py yaml [--files N] [--items N] [--rounds N] [--seed N]
+                  [--write-corpus DIR]
+    bench.py sse [--clients N] [--connect-batch N] [--events N]
+                 [--url URL]
+    bench.py http [--clients N] [--seconds S] [--paths P,...] [--url URL]
+"""
+
+import argparse
+import asyncio
+import datetime
+import http.client
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import yaml
+
+# Resolve db.py from rakuen/webui/
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_webui_dir = os.path.join(os.path.dirname(_script_dir), "webui")
+if _webui_dir not in sys.path:
+    sys.path.insert(0, _webui_dir)
+
+from db import (  # noqa: E402
+    DB_PROFILES,
+    GroupCommitWriter,
+    get_active_tasks,
+    get_activity_page,
+    get_db,
+    init_db,
+    insert_activity,
+    insert_activity_many,
+    reset_db,
+    transaction,
+    upsert_task,
+)
+import yaml_loader  # noqa: E402
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+class _Workspace:
+    """Context manager yielding a workspace dir (temporary by default)."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._tmp = None
+
+    def __enter__(self):
+        if not self.path:
+            self._tmp = tempfile.mkdtemp(prefix="rakuen-bench-")
+            self.path = self._tmp
+        init_db(self.path)
+        return self.path
+
+    def __exit__(self, *exc):
+        if self._tmp:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def _activity_rows(n, offset=0):
+    """Generate *n* realistic activity entries."""
+    return [
+        {
+            "id": f"bench_{offset + i:08d}",
+            "agent": f"kobito{(i % 8) + 1}",
+            "ts": f"2026-01-01T00:{(i // 60) % 60:02d}:{i % 60:02d}",
+            "action": f"Edited src/module_{i % 97}.py (step {i})",
+            "status": "in_progress",
+            "task_id": f"task_{i // 10:05d}",
+        }
+        for i in range(n)
+    ]
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+def _print_table(title, header, rows):
+    """Print a fixed-width result table."""
+    widths = [max(len(str(r[i])) for r in [header] + rows)
+              for i in range(len(header))]
+    print(title)
+    print("  " + "  ".join(str(h).ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  " + "  ".join(str(c).rjust(w) if isinstance(c, (int, float))
+                               else str(c).ljust(w)
+                               for c, w in zip(row, widths)))
+
+
+# ---------------------------------------------------------------------------
+# writes: per-row commit vs. batched commit
+# ---------------------------------------------------------------------------
+
+def _bench_autocommit(ws, rows):
+    db = get_db(ws)
+    try:
+        for entry in rows:
+            insert_activity(db, entry)
+    finally:
+        db.close()
+
+
+def _bench_transaction(ws, rows):
+    db = get_db(ws)
+    try:
+        with transaction(db):
+            for entry in rows:
+                insert_activity(db, entry)
+    finally:
+        db.close()
+
+
+def _bench_executemany(ws, rows):
+    db = get_db(ws)
+    try:
+        insert_activity_many(db, rows)
+    finally:
+        db.close()
+
+
+def _make_group_commit(batch, delay_ms):
+    def run(ws, rows):
+        writer = GroupCommitWriter(ws, max_rows=batch, max_delay_ms=delay_ms)
+        try:
+            for entry in rows:
+                writer.submit(insert_activity, entry)
+            writer.flush()
+        finally:
+            writer.close()
+    return run
+
+
+def cmd_writes(args):
+    """Handle writes subcommand."""
+    modes = [
+        ("autocommit (before)", _bench_autocommit),
+        ("transaction()", _bench_transaction),
+        ("insert_activity_many", _bench_executemany),
+        (f"group commit ({args.batch} rows / {args.delay_ms}ms)",
+         _make_group_commit(args.batch, args.delay_ms)),
+    ]
+    results = []
+    with _Workspace(args.workspace) as ws:
+        for label, fn in modes:
+            reset_db(ws)
+            rows = _activity_rows(args.rows)
+            start = time.perf_counter()
+            fn(ws, rows)
+            elapsed = time.perf_counter() - start
+            results.append((label, args.rows, round(elapsed, 3),
+                            int(args.rows / elapsed) if elapsed else 0))
+
+    base = results[0][3] or 1
+    _print_table(
+        f"Activity inserts ({args.rows} rows)",
+        ("mode", "rows", "seconds", "rows/sec", "speedup"),
+        [r + (f"{r[3] / base:.1f}x",) for r in results],
+    )
+
+
+# ---------------------------------------------------------------------------
+# profiles: mixed agent-write / UI-read workload per PRAGMA profile
+# ---------------------------------------------------------------------------
+
+def _writer(ws, profile, idx, stop, latencies):
+    """Agent-like writer: one autocommit row per operation (db_tool.py)."""
+    db = get_db(ws, profile=profile)
+    try:
+        n = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            if n % 10 == 0:
+                upsert_task(db, {
+                    "task_id": f"bench_w{idx}_{n // 10 % 50}",
+                    "wid": f"kobito{idx % 8 + 1}",
+                    "desc": f"Bench task {n}",
+                    "status": "working" if n % 20 else "done",
+                })
+            else:
+                entry = _activity_rows(1, offset=idx * 10**7 + n)[0]
+                insert_activity(db, entry)
+            latencies.append(time.perf_counter() - start)
+            n += 1
+    finally:
+        db.close()
+
+
+def _reader(ws, profile, idx, stop, latencies):
+    """UI-like reader: newest activity page plus the active task list."""
+    db = get_db(ws, profile=profile)
+    try:
+        n = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            get_activity_page(db, limit=200,
+                              agent=f"kobito{n % 8 + 1}" if n % 2 else None)
+            get_active_tasks(db)
+            latencies.append(time.perf_counter() - start)
+            n += 1
+    finally:
+        db.close()
+
+
+def _run_mixed(ws, profile, writers, readers, seconds):
+    """Run the mixed workload; returns {"write": [...], "read": [...]}."""
+    stop = threading.Event()
+    results = {"write": [], "read": []}
+    threads = []
+    for i in range(writers):
+        lat = []
+        results["write"].append(lat)
+        threads.append(threading.Thread(
+            target=_writer, args=(ws, profile, i, stop, lat)))
+    for i in range(readers):
+        lat = []
+        results["read"].append(lat)
+        threads.append(threading.Thread(
+            target=_reader, args=(ws, profile, i, stop, lat)))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {role: sorted(v for lat in lats for v in lat)
+            for role, lats in results.items()}
+
+
+def cmd_profiles(args):
+    """Handle profiles subcommand."""
+    profiles = [p for p in args.profiles.split(",") if p]
+    for profile in profiles:
+        if profile not in DB_PROFILES:
+            print(f"Error: unknown profile '{profile}'"
+                  f" (expected {', '.join(DB_PROFILES)})", file=sys.stderr)
+            sys.exit(1)
+
+    rows = []
+    with _Workspace(args.workspace) as ws:
+        for profile in profiles:
+            reset_db(ws)
+            db = get_db(ws, profile=profile)
+            try:
+                insert_activity_many(db, _activity_rows(args.seed_rows))
+            finally:
+                db.close()
+            lat = _run_mixed(ws, profile, args.writers, args.readers,
+                             args.seconds)
+            for role in ("write", "read"):
+                values = lat[role]
+                rows.append((
+                    profile, role, len(values),
+                    int(len(values) / args.seconds),
+                    round(_percentile(values, 50) * 1000, 2),
+                    round(_percentile(values, 99) * 1000, 2),
+                ))
+
+    _print_table(
+        f"Mixed workload ({args.writers} writers, {args.readers} readers,"
+        f" {args.seconds}s, {args.seed_rows} seed rows)",
+        ("profile", "role", "ops", "ops/sec", "p50 ms", "p99 ms"),
+        rows,
+    )
+
+
+# ---------------------------------------------------------------------------
+# yaml: queue file parse throughput per loader
+# ---------------------------------------------------------------------------
+
+_ACTIONS = (
+    "src/module_{n}.py を編集中",
+    "Running tests for module_{n}",
+    "レビュー指摘を修正 (#{n})",
+    "Refactored helper_{n}() and updated docs",
+    "依存関係を更新しました",
+)
+
+
+def _yaml_ts(rng):
+    return (f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            f"T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00")
+
+
+def _yaml_activity_file(rng, items, agent):
+    lines = ["activity:"]
+    for i in range(items):
+        n = rng.randint(1, 999)
+        lines += [
+            f"  - id: act_{agent}_{i:05d}",
+            f"    ts: \"{_yaml_ts(rng)}\"" if i % 3 else
+            f"    ts: {_yaml_ts(rng)}",
+            f"    action: {rng.choice(_ACTIONS).format(n=n)}",
+            f"    st: {rng.choice(('in_progress', 'done', 'blocked'))}",
+            f"    task_id: task_{n:05d}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _yaml_task_file(rng, worker):
+    n = rng.randint(1, 999)
+    return "\n".join([
+        "task:",
+        f"  task_id: task_{n:05d}",
+        f"  parent_cmd: cmd_{n // 10:04d}",
+        f"  desc: {rng.choice(_ACTIONS).format(n=n)}",
+        f"  target_path: /repo/src/module_{n}.py",
+        f"  st: {rng.choice(('assigned', 'working', 'idle'))}",
+        f"  ts: \"{_yaml_ts(rng)}\"",
+    ]) + "\n"
+
+
+def _yaml_report_file(rng, worker):
+    n = rng.randint(1, 999)
+    lines = [
+        f"wid: {worker}",
+        f"task_id: task_{n:05d}",
+        f"ts: \"{_yaml_ts(rng)}\"",
+        f"st: {rng.choice(('done', 'failed'))}",
+    ]
+    if rng.random() < 0.3:
+        # Multi-line results use a block scalar (full parser path).
+        lines.append("result: |")
+        lines += [f"  {rng.choice(_ACTIONS).format(n=k)}" for k in range(5)]
+    else:
+        lines.append(f"result: {rng.choice(_ACTIONS).format(n=n)}")
+    lines.append("sc: null")
+    return "\n".join(lines) + "\n"
+
+
+def _yaml_queue_file(rng, items, prefix):
+    lines = ["queue:"]
+    for i in range(items):
+        lines += [
+            f"- id: {prefix}_{i:04d}",
+            f"  ts: \"{_yaml_ts(rng)}\"",
+            f"  cmd: '{rng.choice(_ACTIONS).format(n=i)}'",
+            f"  priority: {rng.choice(('high', 'medium', 'low'))}",
+            f"  status: {rng.choice(('pending', 'done'))}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _yaml_corpus(files, items, seed):
+    """Return [(relpath, text)]: a reproducible mix of queue files."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(files):
+        worker = f"kobito{i % 8 + 1}"
+        kind = i % 10
+        if kind < 5:
+            corpus.append((f"activity/{worker}_{i}.yaml",
+                           _yaml_activity_file(rng, items, worker)))
+        elif kind < 7:
+            corpus.append((f"tasks/{worker}_{i}.yaml",
+                           _yaml_task_file(rng, worker)))
+        elif kind < 9:
+            corpus.append((f"reports/{worker}_report_{i}.yaml",
+                           _yaml_report_file(rng, worker)))
+        else:
+            corpus.append((f"uichan_to_aichan_{i}.yaml",
+                           _yaml_queue_file(rng, items, "cmd")))
+    return corpus
+
+
+def cmd_yaml(args):
+    """Handle yaml subcommand."""
+    corpus = _yaml_corpus(args.files, args.items, args.seed)
+    if args.write_corpus:
+        for rel, text in corpus:
+            path = os.path.join(args.write_corpus, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        print(f"Corpus written to {args.write_corpus}")
+    texts = [text for _, text in corpus]
+    size = sum(len(t.encode("utf-8")) for t in texts)
+
+    loaders = [("yaml.safe_load (before)", yaml.safe_load)]
+    if yaml_loader.LIBYAML:
+        loaders.append(("yaml.CSafeLoader",
+                        lambda t: yaml.load(t, Loader=yaml.CSafeLoader)))
+    loaders.append(("yaml_loader.load", yaml_loader.load))
+
+    expected = [yaml.safe_load(t) for t in texts]
+    before = yaml_loader.stats()
+    identical = [yaml_loader.load(t) for t in texts] == expected
+    after = yaml_loader.stats()
+    fast = after["fast"] - before["fast"]
+
+    results = []
+    for label, load in loaders:
+        best = None
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            for text in texts:
+                load(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append((label, round(best * 1000, 1),
+                        int(len(texts) / best),
+                        round(size / best / 1e6, 2)))
+
+    base = results[0][2] or 1
+    _print_table(
+        f"Queue file parsing ({len(texts)} files, {size / 1e6:.2f} MB,"
+        f" best of {args.rounds})",
+        ("loader", "ms", "files/sec", "MB/sec", "speedup"),
+        [r + (f"{r[2] / base:.1f}x",) for r in results],
+    )
+    print(f"fast path: {fast}/{len(texts)} files"
+          f" ({fast * 100 // len(texts)}%), results identical to"
+          f" safe_load: {'yes' if identical else 'NO'}")
+
+
+# ---------------------------------------------------------------------------
+# sse: concurrent /api/events clients held by one server process
+# ---------------------------------------------------------------------------
+
+SSE_POLLER_STARTUP = 6.0   # app.py's SSE poller starts 5 s after launch
+
+
+def _raise_nofile_limit():
+    """Raise the soft open-file limit to the hard limit; return it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+def _start_server(ws):
+    """Start app.py on *ws*; return (process, base URL)."""
+    env = dict(os.environ,
+               RAKUEN_HOME=os.path.dirname(_script_dir),
+               WORKSPACE_DIR=ws, REPO_ROOT=ws)
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(_webui_dir, "app.py")],
+        env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True,
+    )
+    for line in proc.stderr:
+        m = re.search(r"URL: (http://\S+)", line)
+        if m:
+            # Keep draining stderr so the server never blocks on it.
+            threading.Thread(target=proc.stderr.read, daemon=True).start()
+            return proc, m.group(1)
+    proc.wait()
+    raise RuntimeError("app.py exited before listening")
+
+
+def _proc_status(pid):
+    """Return (threads, RSS in MB) of process *pid* (Linux /proc)."""
+    threads, rss = None, None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return threads, rss
+
+
+async def _sse_client(host, port, arrivals, connected, ready):
+    """Hold one /api/events stream, recording activity arrival times."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b"GET /api/events HTTP/1.1\r\nHost: bench\r\n"
+                     b"Accept: text/event-stream\r\n\r\n")
+        await writer.drain()
+        status = await reader.readline()
+        if b" 200 " not in status:
+            raise ConnectionError(status.decode("latin-1").strip())
+        await reader.readuntil(b"\r\n\r\n")
+    except (OSError, asyncio.IncompleteReadError) as e:
+        connected.append(e)
+        ready.release()
+        return
+    connected.append(None)
+    ready.release()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"data: "):
+                now = time.perf_counter()
+                data = json.loads(line[6:])
+                if data.get("type") == "activity":
+                    for entry in data.get("entries", []):
+                        arrivals.append((entry["id"], now))
+    except (OSError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+def _insert_event(ws, idx):
+    db = get_db(ws)
+    try:
+        insert_activity(db, {
+            "id": f"bench_sse_{idx:06d}",
+            "agent": "kobito1",
+            "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+            "action": f"SSE fan-out probe {idx}",
+            "status": "in_progress",
+            "task_id": None,
+        })
+    finally:
+        db.close()
+
+
+async def _run_sse(url, ws, pid, clients, batch, events, started):
+    parts = urllib.parse.urlsplit(url)
+    arrivals, connected = [], []
+    ready = asyncio.Semaphore(0)
+    tasks = []
+    await asyncio.sleep(1.0)   # let the server start its background threads
+    idle = _proc_status(pid) if pid else (None, None)
+
+    start = time.perf_counter()
+    for i in range(0, clients, batch):
+        n = min(batch, clients - i)
+        for _ in range(n):
+            tasks.append(asyncio.create_task(_sse_client(
+                parts.hostname, parts.port, arrivals, connected, ready)))
+        for _ in range(n):
+            await ready.acquire()
+    connect_time = time.perf_counter() - start
+    held = _proc_status(pid) if pid else (None, None)
+    failures = [e for e in connected if e is not None]
+
+    # Fan-out: one activity row per event, delivered to every client.
+    sent = {}
+    if ws and events:
+        await asyncio.sleep(max(0.0, started + SSE_POLLER_STARTUP
+                                - time.monotonic()))
+        loop = asyncio.get_running_loop()
+        for idx in range(events):
+            sent[f"bench_sse_{idx:06d}"] = time.perf_counter()
+            await loop.run_in_executor(None, _insert_event, ws, idx)
+            await asyncio.sleep(1.0)
+        await asyncio.sleep(2.0)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "connected": len(connected) - len(failures),
+        "failures": failures,
+        "connect_time": connect_time,
+        "idle": idle,
+        "held": held,
+        "latencies": sorted(t - sent[aid] for aid, t in arrivals
+                            if aid in sent),
+        "expected": len(sent) * (len(connected) - len(failures)),
+    }
+
+
+def cmd_sse(args):
+    """Handle sse subcommand."""
+    limit = _raise_nofile_limit()
+    if limit and args.clients + 64 > limit // 2 and not args.url:
+        print(f"Warning: open-file limit {limit} may be too low for"
+              f" {args.clients} clients (client and server share it)",
+              file=sys.stderr)
+
+    proc = None
+    with _Workspace(args.workspace) as ws:
+        try:
+            if args.url:
+                url, pid = args.url, None
+                ws = args.workspace   # events only with a known workspace
+            else:
+                proc, url = _start_server(ws)
+                pid = proc.pid
+            started = time.monotonic()
+            result = asyncio.run(_run_sse(
+                url, ws, pid, args.clients, args.connect_batch,
+                args.events, started))
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+
+    lat = result["latencies"]
+    rows = [
+        ("clients connected", f"{result['connected']}/{args.clients}"),
+        ("connect time", f"{result['connect_time']:.2f} s"),
+    ]
+    if pid:
+        rows += [
+            ("server threads (idle -> held)",
+             f"{result['idle'][0]} -> {result['held'][0]}"),
+            ("server RSS MB (idle -> held)",
+             f"{result['idle'][1]} -> {result['held'][1]}"),
+        ]
+    if result["expected"]:
+        rows += [
+            ("events delivered", f"{len(lat)}/{result['expected']}"),
+            ("fan-out p50 / p99 / max",
+             f"{_percentile(lat, 50) * 1000:.1f} / "
+             f"{_percentile(lat, 99) * 1000:.1f} / "
+             f"{(lat[-1] if lat else 0) * 1000:.1f} ms"),
+        ]
+    _print_table(f"SSE clients on {url}", ("metric", "value"), rows)
+    if result["failures"]:
+        print(f"first failure: {result['failures'][0]!r}")
+
+
+# ---------------------------------------------------------------------------
+# http: request rate of the frontend polling mix, keep-alive vs. not
+# ---------------------------------------------------------------------------
+
+# (path, weight): activity tab polls activity + dashboard every
+# pollInterval, the tmux tab polls panes, status / health every 30 s.
+HTTP_POLL_MIX = (
+    ("/api/activity", 3),
+    ("/api/dashboard", 3),
+    ("/api/panes?lines=300", 1),
+    ("/api/status", 1),
+    ("/api/agents/health", 1),
+)
+
+
+def _http_client(host, port, paths, keep_alive, stop, latencies, errors,
+                 seed):
+    """Issue requests for *paths* with If-None-Match revalidation (as api.js)."""
+    rng = random.Random(seed)
+    etags = {}
+    conn = None
+    while not stop.is_set():
+        path = rng.choice(paths)
+        headers = {"Accept-Encoding": "gzip"}
+        if path in etags:
+            headers["If-None-Match"] = etags[path]
+        if not keep_alive:
+            headers["Connection"] = "close"
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.getheader("ETag"):
+                etags[path] = resp.getheader("ETag")
+            if not keep_alive or resp.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            if conn:
+                conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+    if conn:
+        conn.close()
+
+
+def _server_metrics(url):
+    try:
+        with urllib.request.urlopen(url + "/api/metrics", timeout=10) as r:
+            return json.load(r).get("http_server") or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def cmd_http(args):
+    """Handle http subcommand."""
+    if args.paths:
+        paths = [p for p in args.paths.split(",") if p]
+    else:
+        paths = [p for p, w in HTTP_POLL_MIX for _ in range(w)]
+    proc = None
+    rows = []
+    with _Workspace(args.workspace) as ws:
+        try:
+            if args.url:
+                url = args.url
+            else:
+                db = get_db(ws)
+                try:
+                    insert_activity_many(db, _activity_rows(args.seed_rows))
+                finally:
+                    db.close()
+                proc, url = _start_server(ws)
+            parts = urllib.parse.urlsplit(url)
+            for label, keep_alive in (("connection per request", False),
+                                      ("keep-alive (HTTP/1.1)", True)):
+                before = _server_metrics(url)
+                stop = threading.Event()
+                lats, errors, threads = [], [], []
+                for i in range(args.clients):
+                    lat = []
+                    lats.append(lat)
+                    threads.append(threading.Thread(
+                        target=_http_client,
+                        args=(parts.hostname, parts.port, paths, keep_alive,
+                              stop, lat, errors, i)))
+                for t in threads:
+                    t.start()
+                time.sleep(args.seconds)
+                stop.set()
+                for t in threads:
+                    t.join()
+                after = _server_metrics(url)
+                values = sorted(v for lat in lats for v in lat)
+                conns = (after.get("connections_accepted", 0)
+                         - before.get("connections_accepted", 0) - 1)
+                rows.append((
+                    label, len(values), int(len(values) / args.seconds),
+                    round(_percentile(values, 50) * 1000, 2),
+                    round(_percentile(values, 99) * 1000, 2),
+                    max(conns, 0) if after else "-", len(errors),
+                ))
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+
+    base = rows[0][2] or 1
+    _print_table(
+        f"{'Requests' if args.paths else 'Frontend polling mix'}"
+        f" ({args.clients} clients, {args.seconds}s per mode,"
+        f" If-None-Match + gzip)",
+        ("mode", "requests", "req/sec", "p50 ms", "p99 ms", "connections",
+         "errors", "speedup"),
+        [r + (f"{r[2] / base:.1f}x",) for r in rows],
+    )
+
+
+# ---------------------------------------------------------------------------
+# Argument parser
+# ---------------------------------------------------------------------------
+
+def build_parser():
+    """Build the argument parser with all subcommands."""
+    parser = argparse.ArgumentParser(
+        prog="bench.py",
+        description="Rakuen Bench - backend micro-benchmarks",
+    )
+    parser.add_argument("--workspace", default=None,
+                        help="Workspace dir (default: temporary)")
+    sub = parser.add_subparsers(dest="command", help="Available benchmarks")
+
+    # writes
+    p = sub.add_parser("writes", help="Row insert throughput by commit mode")
+    p.add_argument("--rows", type=int, default=2000, help="Rows per mode")
+    p.add_argument("--batch", type=int, default=200,
+                   help="Group commit: max rows per commit")
+    p.add_argument("--delay-ms", type=int, default=20,
+                   help="Group commit: max delay per commit (ms)")
+    p.set_defaults(func=cmd_writes)
+
+    # profiles
+    p = sub.add_parser("profiles",
+                       help="Mixed write/read latency per PRAGMA profile")
+    p.add_argument("--profiles", default=",".join(DB_PROFILES),
+                   help="Comma list of profiles (default: all)")
+    p.add_argument("--writers", type=int, default=4,
+                   help="Concurrent agent-like writers")
+    p.add_argument("--readers", type=int, default=2,
+                   help="Concurrent UI-like readers")
+    p.add_argument("--seconds", type=float, default=5.0,
+                   help="Duration per profile")
+    p.add_argument("--seed-rows", type=int, default=20000,
+                   help="Activity rows inserted before each run")
+    p.set_defaults(func=cmd_profiles)
+
+    # yaml
+    p = sub.add_parser("yaml", help="Queue YAML parse throughput per loader")
+    p.add_argument("--files", type=int, default=200,
+                   help="Files in the generated corpus")
+    p.add_argument("--items", type=int, default=50,
+                   help="Entries per activity / queue file")
+    p.add_argument("--rounds", type=int, default=3,
+                   help="Timed passes per loader (best is reported)")
+    p.add_argument("--seed", type=int, default=1, help="Corpus seed")
+    p.add_argument("--write-corpus", default=None, metavar="DIR",
+                   help="Also write the corpus files under DIR")
+    p.set_defaults(func=cmd_yaml)
+
+    # sse
+    p = sub.add_parser("sse",
+                       help="Concurrent SSE clients held by one server")
+    p.add_argument("--clients", type=int, default=1000,
+                   help="SSE connections to open")
+    p.add_argument("--connect-batch", type=int, default=100,
+                   help="Connections opened concurrently")
+    p.add_argument("--events", type=int, default=5,
+                   help="Activity rows inserted to measure fan-out")
+    p.add_argument("--url", default=None,
+                   help="Existing server (default: start app.py on the"
+                        " workspace); events need --workspace")
+    p.set_defaults(func=cmd_sse)
+
+    # http
+    p = sub.add_parser("http",
+                       help="Polling request rate, keep-alive vs. not")
+    p.add_argument("--clients", type=int, default=8,
+                   help="Concurrent polling clients")
+    p.add_argument("--seconds", type=float, default=5.0,
+                   help="Duration per mode")
+    p.add_argument("--seed-rows", type=int, default=2000,
+                   help="Activity rows in the scratch workspace")
+    p.add_argument("--paths", default=None,
+                   help="Comma list of paths to request instead of the"
+                        " polling mix (e.g. /api/activity,/api/dashboard)")
+    p.add_argument("--url", default=None,
+                   help="Existing server (default: start app.py on the"
+                        " workspace)")
+    p.set_defaults(func=cmd_http)
+
+    return parser
+
+
+def main():
+    """Entry point."""
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        sys.exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,12 @@ Usage:
     db_tool.py get-report --wid WID
     db_tool.py kv-set --key KEY --value VALUE
     db_tool.py kv-get --key KEY
+    db_tool.py migrate [--verify]
+    db_tool.py maintain [--no-vacuum]
+    db_tool.py history [--agent NAME] [--task-id ID] [--limit N]
+    db_tool.py search --query TEXT [--source activity,task,report] [--limit N]
+    db_tool.py changes [--since SEQ] [--limit N]
+    db_tool.py pragmas
 """
 
 import argparse
@@ -40,7 +46,15 @@ from db import (
     get_report_by_worker,
     kv_get,
     kv_set,
+    get_schema_version,
+    verify_query_plans,
+    search,
+    get_changes_since,
+    get_db_pragmas,
+    load_db_settings,
+    SCHEMA_VERSION,
 )
+from retention import open_with_archives, run_maintenance
 
 
 def _get_workspace():
@@ -214,6 +228,99 @@ def cmd_kv_get(args):
         db.close()
 
 
+def cmd_migrate(args):
+    """Handle migrate subcommand."""
+    ws = _get_workspace()
+    init_db(ws)  # applies pending migrations
+    db = get_db(ws)
+    try:
+        result = {
+            "schema_version": get_schema_version(db),
+            "latest_version": SCHEMA_VERSION,
+        }
+        if args.verify:
+            failures = verify_query_plans(db)
+            result["query_plans_ok"] = not failures
+            if failures:
+                result["query_plan_failures"] = failures
+        _output_yaml(result)
+        if args.verify and failures:
+            sys.exit(2)
+    finally:
+        db.close()
+
+
+def cmd_pragmas(args):
+    """Handle pragmas subcommand (effective database profile)."""
+    ws = _get_workspace()
+    init_db(ws)
+    db = get_db(ws)
+    try:
+        _output_yaml({
+            "profile": load_db_settings(ws)["profile"],
+            "pragmas": get_db_pragmas(db),
+        })
+    finally:
+        db.close()
+
+
+def cmd_maintain(args):
+    """Handle maintain subcommand."""
+    ws = _get_workspace()
+    init_db(ws)
+    summary = run_maintenance(ws, vacuum=not args.no_vacuum)
+    _output_yaml(summary)
+
+
+def cmd_history(args):
+    """Handle history subcommand (activity incl. archived months)."""
+    ws = _get_workspace()
+    init_db(ws)
+    where = []
+    params = []
+    if args.agent:
+        where.append("agent = ?")
+        params.append(args.agent)
+    if args.task_id:
+        where.append("task_id = ?")
+        params.append(args.task_id)
+    sql = "SELECT * FROM activity_all"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts DESC LIMIT ?"
+    params.append(args.limit)
+    with open_with_archives(ws) as db:
+        rows = [dict(row) for row in db.execute(sql, params).fetchall()]
+    rows.reverse()
+    _output_yaml(rows)
+
+
+def cmd_search(args):
+    """Handle search subcommand."""
+    ws = _get_workspace()
+    init_db(ws)
+    db = get_db(ws)
+    try:
+        sources = [s for s in args.source.split(",") if s] if args.source \
+            else None
+        result = search(db, args.query, limit=args.limit,
+                        offset=args.offset, sources=sources)
+        _output_yaml(result["results"])
+    finally:
+        db.close()
+
+
+def cmd_changes(args):
+    """Handle changes subcommand."""
+    ws = _get_workspace()
+    init_db(ws)
+    db = get_db(ws)
+    try:
+        _output_yaml(get_changes_since(db, args.since, args.limit))
+    finally:
+        db.close()
+
+
 # ---------------------------------------------------------------------------
 # Argument parser
 # ---------------------------------------------------------------------------
@@ -277,6 +384,50 @@ def build_parser():
     p.add_argument("--key", required=True, help="Key name")
     p.set_defaults(func=cmd_kv_get)
 
+    # migrate
+    p = sub.add_parser("migrate", help="Apply pending schema migrations")
+    p.add_argument("--verify", action="store_true",
+                   help="Assert EXPLAIN QUERY PLAN uses the expected indexes")
+    p.set_defaults(func=cmd_migrate)
+
+    # maintain
+    p = sub.add_parser("maintain",
+                       help="Archive old rows, vacuum and checkpoint now")
+    p.add_argument("--no-vacuum", action="store_true",
+                   help="Skip incremental vacuum")
+    p.set_defaults(func=cmd_maintain)
+
+    # history
+    p = sub.add_parser("history",
+                       help="Query activity including archived months")
+    p.add_argument("--agent", default=None, help="Agent name")
+    p.add_argument("--task-id", default=None, help="Related task ID")
+    p.add_argument("--limit", type=int, default=50, help="Max entries")
+    p.set_defaults(func=cmd_history)
+
+    # search
+    p = sub.add_parser("search",
+                       help="Full-text search over activity, tasks, reports")
+    p.add_argument("--query", required=True,
+                   help="Search text (AND-ed terms, at least one of 3+ characters)")
+    p.add_argument("--source", default=None,
+                   help="Comma list of activity,task,report (default: all)")
+    p.add_argument("--limit", type=int, default=20, help="Max results")
+    p.add_argument("--offset", type=int, default=0, help="Skip N results")
+    p.set_defaults(func=cmd_search)
+
+    # changes
+    p = sub.add_parser("changes", help="Tail the changelog after a seq")
+    p.add_argument("--since", type=int, default=0,
+                   help="Last seq already seen (default: 0)")
+    p.add_argument("--limit", type=int, default=100, help="Max entries")
+    p.set_defaults(func=cmd_changes)
+
+    # pragmas
+    p = sub.add_parser("pragmas",
+                       help="Show the database profile and its PRAGMAs")
+    p.set_defaults(func=cmd_pragmas)
+
     return parser
 
 
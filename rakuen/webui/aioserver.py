@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Rakuen asyncio HTTP server core (stdlib only).
+
+One event loop accepts connections and parses requests.  Long-lived
+streams (Server-Sent Events) are coroutines on the loop, so an idle
+client costs a socket and a small task instead of an OS thread.  Every
+other request is dispatched to the existing synchronous
+BaseHTTPRequestHandler methods (do_GET / do_POST) on a bounded thread
+pool; tmux and SQLite calls therefore never block the loop, and at most
+``workers`` of them run at once.
+
+The handler's wfile writes to the connection through the loop with
+backpressure (each write waits for the transport to drain), so
+streamed responses still go out piecewise.
+
+Connections are persistent for HTTP/1.1 clients: requests on one
+connection (pipelined ones included) are answered in order until the
+client sends ``Connection: close``, the connection has served
+KEEPALIVE_MAX_REQUESTS requests (the last response says
+``Connection: close``) or it stays idle for KEEPALIVE_TIMEOUT seconds.
+Every response must therefore be framed by Content-Length or chunked
+transfer coding; a handler that streams without either sends
+``Connection: close`` (BaseHTTPRequestHandler then sets
+close_connection).  HTTP/1.0 requests get one response per connection.
+
+Usage:
+    server = AsyncHTTPServer((host, port), RakuenHandler,
+                             async_routes={"/api/events": handle_events})
+    server.serve_forever()
+"""
+
+import asyncio
+import email.utils
+import http.client
+import io
+import socket
+import sys
+import threading
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+
+HTTP_WORKERS = 16                 # threads running synchronous handlers
+MAX_HEADER_BYTES = 64 * 1024      # request line + headers
+MAX_BODY_BYTES = 1024 * 1024      # request bodies (POST)
+HEADER_TIMEOUT = 30               # seconds to receive the request head
+WRITE_TIMEOUT = 60                # seconds a handler write may block
+KEEPALIVE_TIMEOUT = 15            # idle seconds before a connection closes
+KEEPALIVE_MAX_REQUESTS = 1000     # requests served per connection
+
+
+class Request:
+    """A request routed to an async handler."""
+
+    def __init__(self, server, method, target, version, headers, body,
+                 writer):
+        self.server = server
+        self.command = method
+        self.path = target
+        self.request_version = version
+        self.headers = headers
+        self.body = body
+        self.writer = writer
+        self.status = None
+        # The body is sent with chunked transfer coding (HTTP/1.1), so the
+        # connection stays reusable however long the stream runs.
+        self.chunked = version == "HTTP/1.1"
+
+    async def send_head(self, status, headers=()):
+        """Write the status line and *headers* (list of (name, value))."""
+        self.status = status
+        lines = [f"HTTP/1.1 {status} {_reason(status)}",
+                 f"Server: {self.server.server_version}",
+                 f"Date: {email.utils.formatdate(usegmt=True)}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if self.chunked:
+            lines.append("Transfer-Encoding: chunked")
+        else:
+            lines.append("Connection: close")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self.writer.drain()
+
+    async def write(self, data):
+        """Write *data* (bytes) and wait until the transport drains."""
+        if not data:
+            return
+        if self.chunked:
+            data = b"%x\r\n%s\r\n" % (len(data), data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def finish(self):
+        """End the response body."""
+        if self.chunked:
+            self.writer.write(b"0\r\n\r\n")
+            await self.writer.drain()
+
+    def run_sync(self, func, *args):
+        """Run *func* on the server's executor (returns an awaitable)."""
+        return asyncio.get_running_loop().run_in_executor(
+            self.server.executor, func, *args)
+
+
+class _LoopWriter(io.RawIOBase):
+    """File-like wfile for handler threads writing to an asyncio stream."""
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self.written = 0
+
+    def writable(self):
+        return True
+
+    async def _write(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def write(self, data):
+        if self._writer.is_closing():
+            raise BrokenPipeError("connection closed")
+        data = bytes(data)
+        future = asyncio.run_coroutine_threadsafe(self._write(data), self._loop)
+        try:
+            future.result(WRITE_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise BrokenPipeError("write timed out") from None
+        self.written += len(data)
+        return len(data)
+
+
+class _KeepAliveHandler:
+    """Mixin announcing ``Connection: close`` on a connection's last response.
+
+    close_connection is decided before dispatch (client asked to close,
+    request limit reached); HTTP/1.1 clients must be told explicitly.
+    """
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if self.close_connection and self.request_version == "HTTP/1.1":
+            self.send_header("Connection", "close")
+
+
+def _reason(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+class AsyncHTTPServer:
+    """asyncio HTTP/1.1 server dispatching to a BaseHTTPRequestHandler.
+
+    The listening socket is bound in the constructor (OSError if the
+    port is taken), so callers can probe a port range as before.
+    """
+
+    def __init__(self, server_address, handler_class, async_routes=None,
+                 workers=HTTP_WORKERS):
+        self.server_address = server_address
+        self.handler_class = type(
+            handler_class.__name__, (_KeepAliveHandler, handler_class), {})
+        self.server_version = getattr(handler_class, "server_version",
+                                      "Python")
+        self.async_routes = dict(async_routes or {})
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="http")
+        self.workers = workers
+        self.socket = socket.create_server(server_address, backlog=128)
+        self.loop = None
+        self._stopped = None
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._accepted = 0
+        self._requests = 0
+        self._streams = 0
+        self._sync_active = 0
+        self._sync_peak = 0
+        self._errors = 0
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def serve_forever(self):
+        """Run the event loop until shutdown() (or KeyboardInterrupt)."""
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(
+            self._client, sock=self.socket, limit=MAX_HEADER_BYTES)
+        async with server:
+            await self._stopped.wait()
+
+    def shutdown(self):
+        """Stop serving (callable from any thread)."""
+        # After Ctrl+C asyncio.run() has already closed the loop.
+        if self.loop and self._stopped and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stopped.set)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # -- connections --------------------------------------------------------
+
+    async def _client(self, reader, writer):
+        with self._lock:
+            self._connections += 1
+            self._accepted += 1
+        try:
+            served = 0
+            while served < KEEPALIVE_MAX_REQUESTS:
+                served += 1
+                keep_alive = await self._handle(
+                    reader, writer, served == KEEPALIVE_MAX_REQUESTS,
+                    HEADER_TIMEOUT if served == 1 else KEEPALIVE_TIMEOUT)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError):
+            pass
+        except Exception:
+            self._handle_error(writer.get_extra_info("peername"))
+        finally:
+            with self._lock:
+                self._connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _simple_response(self, writer, status, message):
+        """Send an error response and close (request framing is unknown)."""
+        body = f'{{"error": "{message}"}}'.encode("utf-8")
+        writer.write((
+            f"HTTP/1.1 {status} {_reason(status)}\r\n"
+            f"Server: {self.server_version}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("latin-1") + body)
+        await writer.drain()
+        return False
+
+    async def _handle(self, reader, writer, last, timeout):
+        """Serve one request; return True if the connection may be reused."""
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.LimitOverrunError:
+            return await self._simple_response(
+                writer, 431, "Headers too large")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise
+            return False        # client closed between requests
+        # Tolerate blank lines before a request line (RFC 9112 2.2).
+        head = head.lstrip(b"\r\n")
+        request_line, _, header_bytes = head.partition(b"\r\n")
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3 or parts[2] not in ("HTTP/1.0", "HTTP/1.1"):
+            return await self._simple_response(writer, 400, "Bad request")
+        method, target, version = parts
+        try:
+            headers = http.client.parse_headers(io.BytesIO(header_bytes))
+        except http.client.HTTPException:
+            return await self._simple_response(writer, 400, "Bad request")
+
+        if headers.get("Transfer-Encoding"):
+            return await self._simple_response(
+                writer, 411, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            return await self._simple_response(
+                writer, 413, "Invalid request body")
+        if (length and version == "HTTP/1.1"
+                and headers.get("Expect", "").lower() == "100-continue"):
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        body = await reader.readexactly(length) if length else b""
+        with self._lock:
+            self._requests += 1
+
+        tokens = {t.strip().lower()
+                  for t in headers.get("Connection", "").split(",")}
+        close = last or version != "HTTP/1.1" or "close" in tokens
+
+        route = self.async_routes.get(urllib.parse.urlsplit(target).path)
+        if route is not None and method == "GET":
+            request = Request(self, method, target, version, headers, body,
+                              writer)
+            with self._lock:
+                self._streams += 1
+            try:
+                await route(request)
+                await request.finish()
+            finally:
+                with self._lock:
+                    self._streams -= 1
+            return request.chunked and not close
+        if not hasattr(self.handler_class, "do_" + method):
+            return await self._simple_response(
+                writer, 501, "Unsupported method")
+
+        return await self.loop.run_in_executor(
+            self.executor, self._run_handler, method, target, version,
+            head, headers, body, writer, writer.get_extra_info("peername"),
+            close)
+
+    def _run_handler(self, method, target, version, head, headers, body,
+                     writer, peer, close):
+        """Run the synchronous handler for one request (executor thread).
+
+        Returns True if the connection may serve another request.
+        """
+        with self._lock:
+            self._sync_active += 1
+            self._sync_peak = max(self._sync_peak, self._sync_active)
+        handler = None
+        try:
+            handler = self.handler_class.__new__(self.handler_class)
+            handler.server = self
+            handler.client_address = peer or ("", 0)
+            handler.request = None
+            handler.raw_requestline = head.split(b"\r\n", 1)[0] + b"\r\n"
+            handler.requestline = handler.raw_requestline.decode(
+                "latin-1").rstrip("\r\n")
+            handler.command = method
+            handler.path = target
+            handler.request_version = version
+            handler.headers = headers
+            handler.close_connection = close
+            handler.rfile = io.BytesIO(body)
+            handler.wfile = _LoopWriter(self.loop, writer)
+            getattr(handler, "do_" + method)()
+            # A response was sent, completely framed, and not ended by
+            # "Connection: close".
+            return not handler.close_connection and handler.wfile.written > 0
+        except (BrokenPipeError, ConnectionError):
+            return False
+        except Exception:
+            self._handle_error(peer)
+            return False
+        finally:
+            with self._lock:
+                self._sync_active -= 1
+
+    def _handle_error(self, peer):
+        """Count and print an unexpected handler error (as socketserver does)."""
+        with self._lock:
+            self._errors += 1
+        sys.stderr.write(f"Exception occurred during processing of request"
+                         f" from {peer}\n")
+        traceback.print_exc()
+
+    # -- metrics ------------------------------------------------------------
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            return {
+                "connections": self._connections,
+                "connections_accepted": self._accepted,
+                "requests": self._requests,
+                "streams": self._streams,
+                "workers": self.workers,
+                "workers_busy": self._sync_active,
+                "workers_peak": self._sync_peak,
+                "errors": self._errors,
+            }
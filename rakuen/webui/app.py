@@ -7,26 +7,32 @@ Provides API endpoints for:
 - Pane log retrieval (all agents)
 - Command sending (uichan only)
 - Preset command listing
+- Full-text search (activity, tasks, reports)
+- Per-agent summary statistics
+- Server metrics (DB connection pool, parse cache, file watcher, gzip)
 
 Binds to 127.0.0.1 with auto-incrementing port (8080-8099).
+Served by aioserver.AsyncHTTPServer: SSE streams run on the event loop,
+all other requests on a bounded handler thread pool.
 Requires: PyYAML
 """
 
+import asyncio
+import collections
 import datetime
+import hashlib
+import heapq
 import http.server
 import json
 import os
-import queue as queue_module
 import re
+import sqlite3
 import subprocess
 import sys
 import threading
 import time
 import urllib.parse
 from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
-
-import yaml
 
 # Local imports (db, command_validator)
 _webui_dir = os.path.dirname(os.path.abspath(__file__))
@@ -34,9 +40,28 @@ if _webui_dir not in sys.path:
     sys.path.insert(0, _webui_dir)
 
 from db import (  # noqa: E402
-    init_db, get_db, get_all_activity, get_all_tasks, get_all_reports,
-    get_all_user_inputs, get_all_commands, get_max_activity_rowid,
-    get_activity_since_rowid,
+    init_db, get_pool, close_pools, get_activity_page_json, get_all_tasks,
+    get_all_reports, get_all_user_inputs, get_all_commands,
+    get_activity_by_ids, get_changes_since, get_changelog_range,
+    parse_cursor, load_db_settings, search, get_stats,
+)
+from retention import checkpoint, run_maintenance  # noqa: E402
+from fswatch import (  # noqa: E402
+    KIND_DASHBOARD, KIND_DB, KIND_PANE_LOG, KIND_QUEUE, WorkspaceWatcher,
+)
+from timeline import TimelineStore  # noqa: E402
+from aioserver import AsyncHTTPServer  # noqa: E402
+from compress import (  # noqa: E402
+    GZIP_MIN_SIZE, GzipStats, GzipStream, accepts_gzip, compress, gzip_etag,
+    strip_gzip_etag,
+)
+from static_assets import IMMUTABLE_CACHE_CONTROL, StaticAssets  # noqa: E402
+from ingest import YamlIngester  # noqa: E402
+from tmux_client import TmuxClient  # noqa: E402
+from pane_stream import PaneStreams  # noqa: E402
+from capture_cache import CaptureCache  # noqa: E402
+from yaml_loader import (  # noqa: E402
+    extract_items, stats as yaml_loader_stats,
 )
 from command_validator import validate_command  # noqa: E402
 
@@ -62,6 +87,18 @@ MIN_LINES = 50
 MAX_LINES = 1000
 MAX_SEND_BYTES = 8192  # 8KB
 
+ACTIVITY_DEFAULT_LIMIT = 200
+ACTIVITY_MAX_LIMIT = 1000
+
+JSON_STREAM_CHUNK = 64 * 1024   # bytes buffered per streamed write
+
+# Mixed into version-stamp ETags so stamps from an earlier server process
+# (e.g. an in-memory counter that restarted from 0) never match.
+_ETAG_NONCE = os.urandom(8).hex()
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
 BIND_HOST = "127.0.0.1"
 PORT_RANGE_START = 8080
 PORT_RANGE_END = 8099
@@ -89,107 +126,108 @@ AGENT_LABELS = {
     "kobito8": "Kobito 8",
 }
 
+
+def _sql_str(value):
+    """Quote *value* as an SQL string literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+# /api/activity entry shape for SQLite rows, built by SQLite's
+# json_object() (see get_activity_page_json).
+_ACTIVITY_JSON_FIELDS = (
+    ("timestamp", "ts"),
+    ("from", "agent"),
+    ("from_label",
+     "CASE agent "
+     + " ".join(f"WHEN {_sql_str(k)} THEN {_sql_str(v)}"
+                for k, v in AGENT_LABELS.items())
+     + " ELSE agent END"),
+    ("to", "NULL"),
+    ("to_label", "NULL"),
+    ("action", "action"),
+    ("task_id", "task_id"),
+    ("type", "'progress'"),
+    ("status", "status"),
+)
+
 # Thread pool for parallel tmux commands
 _TMUX_EXECUTOR = ThreadPoolExecutor(max_workers=10)
 
+# Persistent tmux control-mode connection shared by every tmux call
+_TMUX = TmuxClient()
+
+# Recent capture-pane results (panes not served from the pipe-pane buffers)
+_CAPTURE_CACHE = CaptureCache(_TMUX)
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
 
-def _capture_pane_worker(agent, target, lines):
-    """Worker function for parallel pane capture."""
-    try:
-        result = subprocess.run(
-            ["tmux", "capture-pane", "-t", target, "-p", "-S", f"-{lines}"],
-            capture_output=True,
-            text=True,
-            timeout=3,
-        )
-        text = result.stdout
-    except subprocess.TimeoutExpired:
-        text = "[ERROR: tmux capture-pane timed out]"
-    except FileNotFoundError:
-        text = "[ERROR: tmux not found]"
-    return agent, {"agent": agent, "lines": lines, "text": text}
+def _capture_pane(agent, lines, timeout=5):
+    """Return the last *lines* of *agent*'s pane (plus its screen).
 
+    Served from the pipe-pane buffer when the pane is streamed, else
+    captured with tmux through the capture cache ("" if the pane does
+    not exist).  Raises TimeoutError / FileNotFoundError from the tmux
+    call.
+    """
+    if _pane_streams:
+        text = _pane_streams.capture(agent, lines)
+        if text is not None:
+            return text
+    return _tmux_capture(agent, lines, timeout)
 
-# ---------------------------------------------------------------------------
-# YAML parsing helpers (PyYAML-based)
-# ---------------------------------------------------------------------------
 
-# Short key -> full key mapping for token-reduced YAML
-_SHORT_KEY_MAP = {
-    "ts": "timestamp",
-    "cmd": "command",
-    "wid": "worker_id",
-    "desc": "description",
-    "sc": "skill_candidate",
-    "st": "status",
-}
+def _tmux_capture(agent, lines, timeout):
+    """Capture *agent*'s pane with tmux ("" if the pane does not exist).
 
+    Concurrent and repeated captures share one capture-pane (see
+    capture_cache.CaptureCache).
+    """
+    return _CAPTURE_CACHE.get(AGENT_MAP[agent], lines, timeout)
 
-def _normalize_keys(item):
-    """Apply short-key to full-key mapping on a dict.
 
-    Short keys take priority; full keys serve as fallback.
-    """
-    if not isinstance(item, dict):
-        return item
-    result = {}
-    for k, v in item.items():
-        full_key = _SHORT_KEY_MAP.get(k, k)
-        if full_key not in result:
-            result[full_key] = v
-    return result
+def _pane_entry(agent, lines, since=None, timeout=5):
+    """Return the /api/pane(s) entry of *agent*'s pane.
 
+    The full text ("text") unless *since* -- the "seq" of an earlier
+    entry -- is given and the pane is streamed: then a delta
+    (PaneStreams.delta: "reset", "append", "screen") from "since" to
+    "seq".  "seq" is None when the pane is not streamed.
+    """
+    delta = _pane_streams.delta(agent, lines, since) if _pane_streams else None
+    if delta is None:
+        try:
+            text = _tmux_capture(agent, lines, timeout)
+        except TimeoutError:
+            text = "[ERROR: tmux capture-pane timed out]"
+        except FileNotFoundError:
+            text = "[ERROR: tmux not found]"
+        return {"agent": agent, "lines": lines, "seq": None, "text": text}
+    if since is None:
+        rows = delta["append"] + delta["screen"]
+        return {"agent": agent, "lines": lines, "seq": delta["seq"],
+                "text": "".join(row + "\n" for row in rows)}
+    return {"agent": agent, "lines": lines, "since": since, **delta}
 
-def _extract_yaml_items(text):
-    """Parse YAML text and return a flat list of dicts.
 
-    Handles three structures written by agents:
-      1. List-of-dicts under a key:  queue:\\n  - id: ...
-      2. Single dict under a key:    task:\\n  task_id: ...
-      3. Flat dict (no nesting):     worker_id: ...\\ntask_id: ...
+def _capture_pane_worker(agent, lines, since=None):
+    """Worker function for parallel pane capture."""
+    return agent, _pane_entry(agent, lines, since, timeout=3)
 
-    Returns a list of dicts with short keys normalized to full keys.
-    """
-    if not text or not text.strip():
-        return []
 
+def _parse_seq(value):
+    """Parse a ?since= pane seq (0, which no pane has, if invalid)."""
     try:
-        data = yaml.safe_load(text)
-    except yaml.YAMLError:
-        return []
-
-    if data is None:
-        return []
-
-    items = []
-
-    if isinstance(data, list):
-        # Top-level list
-        for item in data:
-            if isinstance(item, dict):
-                items.append(_normalize_keys(item))
-    elif isinstance(data, dict):
-        if len(data) == 1:
-            # Single top-level key: unwrap container (queue: [...], task: {...})
-            value = next(iter(data.values()))
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        items.append(_normalize_keys(item))
-            elif isinstance(value, dict):
-                items.append(_normalize_keys(value))
-            else:
-                items.append(_normalize_keys(data))
-        else:
-            # Multiple top-level keys: flat dict
-            items.append(_normalize_keys(data))
+        return int(value)
+    except ValueError:
+        return 0
 
-    return items
 
+# ---------------------------------------------------------------------------
+# YAML / Markdown parsing helpers
+# ---------------------------------------------------------------------------
 
 def _extract_md_section(text, heading_keyword):
     """Extract body text under a ## heading containing *heading_keyword*.
@@ -215,11 +253,141 @@ def _extract_md_section(text, heading_keyword):
     return "\n".join(body_lines).strip()
 
 
+# ---------------------------------------------------------------------------
+# Response ETags
+# ---------------------------------------------------------------------------
+
+
+def _content_etag(body):
+    """Return a strong ETag for the response bytes *body*."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _version_etag(*parts):
+    """Return a strong ETag for a response identified by version *parts*.
+
+    Used where a cheap version stamp (changelog seq, file mtime) is known
+    before the body is built, so a 304 skips building it at all.
+    """
+    key = "|".join(str(p) for p in (_ETAG_NONCE,) + parts)
+    return '"v' + hashlib.blake2b(key.encode("utf-8"),
+                                  digest_size=16).hexdigest() + '"'
+
+
+# ---------------------------------------------------------------------------
+# Parse cache (YAML / dashboard fallback for /api/activity)
+# ---------------------------------------------------------------------------
+
+PARSE_CACHE_MAX_ENTRIES = 128
+PARSE_CACHE_MAX_BYTES = 16 * 1024 * 1024  # sum of cached source file sizes
+
+
+class ParseCache:
+    """LRU cache of parsed files validated by (st_mtime_ns, st_size).
+
+    get() costs one stat() when the file is unchanged.  Values are
+    shared between requests and must be treated as read-only.  Memory is
+    bounded by entry count and by the total size of the source files.
+    """
+
+    def __init__(self, max_entries=PARSE_CACHE_MAX_ENTRIES,
+                 max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # key -> (sig, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, path, parse):
+        """Return parse(text) of *path*, cached under *key*.
+
+        A missing or undecodable file yields an empty list.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._discard(key)
+            return []
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] == sig:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return cached[2]
+            self._misses += 1
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = parse(f.read())
+        except (OSError, UnicodeDecodeError):
+            value = []
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+            if st.st_size <= self.max_bytes:
+                self._entries[key] = (sig, st.st_size, value)
+                self._bytes += st.st_size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._evictions += 1
+        return value
+
+    def _discard(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+
+    def invalidate(self, path):
+        """Drop every cached value parsed from *path*."""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == path]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / total, 3) if total else None,
+            }
+
+
+_PARSE_CACHE = ParseCache()
+
+# Merged activity timeline (newest DB rows + YAML fallback index)
+_TIMELINE = TimelineStore(_ACTIVITY_JSON_FIELDS)
+
+# HTTP response counters (/api/metrics)
+_HTTP_STATS = {"not_modified": 0}
+_GZIP_STATS = GzipStats()
+
+# Preloaded webui/static (set in main())
+_static_assets = None
+
+
 # ---------------------------------------------------------------------------
 # Watchdog constants
 # ---------------------------------------------------------------------------
 
 DEAD_COMMANDS = {"bash", "zsh", "sh", ""}
+HEALTH_PROBE_TTL = 2            # seconds a health probe is shared
+HEALTH_PROBE_TIMEOUT = 5        # seconds to wait for tmux list-panes
 WATCHDOG_INTERVAL = 30          # seconds between health checks
 WATCHDOG_INITIAL_DELAY = 120    # seconds to wait after startup
 MAX_RESTARTS_PER_WINDOW = 3     # max restarts per agent within window
@@ -241,14 +409,23 @@ _restart_lock = threading.Lock()
 _agent_restart_locks = {}       # {agent: Lock} prevents concurrent restart of same agent
 _last_health = {}               # cached health check results
 _last_health_lock = threading.Lock()
+_health_probe = (0.0, None)     # (monotonic time, {agent: health}) last probe
+_health_probe_lock = threading.Lock()
+_HEALTH_STATS = {"probes": 0, "shared": 0, "last_probe_ms": None}
 _watchdog_enabled = True
 _LOG_FILE = None
 
 # SSE state
-_sse_clients = []               # list of queue.Queue instances
+_sse_clients = []               # list of _SSEClient
 _sse_clients_lock = threading.Lock()
-_last_activity_rowid = 0
-_last_dashboard_mtime = 0.0
+_last_change_seq = None         # changelog cursor (None until first poll)
+_sse_wake = threading.Event()   # set by the workspace watcher
+_sse_pending = {}               # {kind: set(paths)} not yet pushed
+_sse_pending_lock = threading.Lock()
+_watcher = None                 # fswatch.WorkspaceWatcher (set in main)
+_pane_streams = None            # pane_stream.PaneStreams (set in main)
+_pane_sse_seqs = {}             # agent -> seq of the last SSE pane event
+_ingester = None                # ingest.YamlIngester (database.ingest_yaml)
 
 # Enhanced watchdog state (Phase 3.2)
 _agent_output_history = {}      # {agent: [last_outputs]}
@@ -331,37 +508,75 @@ def _get_agent_lock(agent_name):
         return _agent_restart_locks[agent_name]
 
 
-def _check_agent_health(agent_name):
-    """Check health of a single agent via tmux.
+# Command last: it is the only field that may contain spaces.
+_HEALTH_FORMAT = ("#{session_name}:#{window_index}.#{pane_index}"
+                  " #{pane_pid} #{pane_dead} #{window_activity}"
+                  " #{pane_current_command}")
 
-    Returns {"status": "alive"|"dead"|"session_missing", "command": "..."}.
+
+def _parse_health(text):
+    """Parse list-panes -F _HEALTH_FORMAT output into {agent: health}.
+
+    Each health is {"status": "alive"|"dead"|"session_missing",
+    "command": ..., "pid": int|None, "activity": unix time|None}.
     """
-    target = AGENT_MAP.get(agent_name)
-    if not target:
-        return {"status": "unknown", "command": ""}
-    try:
-        result = subprocess.run(
-            ["tmux", "display-message", "-t", target, "-p", "#{pane_current_command}"],
-            capture_output=True, text=True, timeout=5,
-        )
-        cmd = result.stdout.strip()
-        if result.returncode != 0 or not cmd:
-            return {"status": "session_missing", "command": ""}
-        if cmd in DEAD_COMMANDS:
-            return {"status": "dead", "command": cmd}
-        return {"status": "alive", "command": cmd}
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        return {"status": "session_missing", "command": ""}
-
-
-def _check_all_health():
-    """Check health of all agents. Returns {agent_name: {status, command}}."""
+    panes = {}
+    for line in text.splitlines():
+        parts = line.split(" ", 4)
+        if len(parts) == 5:
+            panes[parts[0]] = parts[1:]
     result = {}
-    for agent_name in AGENT_MAP:
-        result[agent_name] = _check_agent_health(agent_name)
+    for agent_name, target in AGENT_MAP.items():
+        info = panes.get(target)
+        if info is None:
+            result[agent_name] = {"status": "session_missing", "command": "",
+                                  "pid": None, "activity": None}
+            continue
+        pid, dead, activity, cmd = info
+        cmd = cmd.strip()
+        if not cmd and dead != "1":
+            status = "session_missing"
+        elif dead == "1" or cmd in DEAD_COMMANDS:
+            status = "dead"
+        else:
+            status = "alive"
+        result[agent_name] = {
+            "status": status,
+            "command": cmd,
+            "pid": int(pid) if pid.isdigit() else None,
+            "activity": int(activity) if activity.isdigit() else None,
+        }
     return result
 
 
+def _check_all_health(max_age=HEALTH_PROBE_TTL):
+    """Check health of all agents. Returns {agent_name: {status, command}}.
+
+    One ``tmux list-panes -a`` call covers every agent.  A probe younger
+    than *max_age* seconds is shared, and concurrent callers wait for the
+    same probe.
+    """
+    global _health_probe
+    with _health_probe_lock:
+        probed_at, health = _health_probe
+        if health is not None and time.monotonic() - probed_at < max_age:
+            _HEALTH_STATS["shared"] += 1
+            return health
+        start = time.monotonic()
+        try:
+            ok, text = _TMUX.run(["list-panes", "-a", "-F", _HEALTH_FORMAT],
+                                 timeout=HEALTH_PROBE_TIMEOUT)
+        except (TimeoutError, FileNotFoundError):
+            ok, text = False, ""
+        # No tmux server: every agent is session_missing.
+        health = _parse_health(text if ok else "")
+        now = time.monotonic()
+        _health_probe = (now, health)
+        _HEALTH_STATS["probes"] += 1
+        _HEALTH_STATS["last_probe_ms"] = round((now - start) * 1000, 1)
+        return health
+
+
 def _restart_agent(agent_name):
     """Restart a single agent via rakuen-launch --restart-agent.
 
@@ -477,16 +692,11 @@ def _record_intervention(agent_name):
 
 def _capture_pane_output(agent_name, lines=30):
     """Capture recent pane output for an agent."""
-    target = AGENT_MAP.get(agent_name)
-    if not target:
+    if agent_name not in AGENT_MAP:
         return ""
     try:
-        result = subprocess.run(
-            ["tmux", "capture-pane", "-t", target, "-p", "-S", f"-{lines}"],
-            capture_output=True, text=True, timeout=5,
-        )
-        return result.stdout.strip()
-    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return _capture_pane(agent_name, lines).strip()
+    except (TimeoutError, FileNotFoundError):
         return ""
 
 
@@ -537,12 +747,10 @@ def _send_ctrl_c(agent_name):
     if not target:
         return
     try:
-        subprocess.run(
-            ["tmux", "send-keys", "-t", target, "C-c"],
-            timeout=5,
-        )
-    except (subprocess.TimeoutExpired, FileNotFoundError):
+        _TMUX.run(["send-keys", "-t", target, "C-c"])
+    except (TimeoutError, FileNotFoundError):
         pass
+    _CAPTURE_CACHE.invalidate(target)
 
 
 def _start_watchdog():
@@ -552,67 +760,364 @@ def _start_watchdog():
     _log("INFO", "Watchdog thread started.")
 
 
+# ---------------------------------------------------------------------------
+# DB maintenance (retention, incremental vacuum, WAL checkpoints)
+# ---------------------------------------------------------------------------
+
+MAINTENANCE_INITIAL_DELAY = 60  # seconds to wait after startup
+
+
+def _maintenance_loop():
+    """Background loop applying retention policies and WAL checkpoints.
+
+    Intervals come from settings.yaml (database.checkpoint_interval /
+    database.maintenance_interval) and are re-read every cycle.
+    """
+    time.sleep(MAINTENANCE_INITIAL_DELAY)
+    _log("INFO", "DB maintenance: started.")
+
+    now = time.monotonic()
+    next_checkpoint = now
+    next_maintenance = now
+
+    while True:
+        settings = load_db_settings(WORKSPACE_DIR)
+        now = time.monotonic()
+
+        if now >= next_maintenance:
+            next_maintenance = now + settings["maintenance_interval"]
+            try:
+                summary = run_maintenance(WORKSPACE_DIR)
+                if summary["archived"]:
+                    _log("INFO", f"DB maintenance: archived {summary['archived']}")
+            except Exception as e:
+                _log("ERROR", f"DB maintenance: retention failed: {e}")
+            next_checkpoint = now + settings["checkpoint_interval"]
+        elif now >= next_checkpoint:
+            next_checkpoint = now + settings["checkpoint_interval"]
+            try:
+                checkpoint(get_pool(WORKSPACE_DIR).dedicated("maintenance"))
+            except Exception as e:
+                _log("ERROR", f"DB maintenance: checkpoint failed: {e}")
+
+        time.sleep(max(1.0, min(next_checkpoint, next_maintenance)
+                       - time.monotonic()))
+
+
+def _start_maintenance():
+    """Start the DB maintenance daemon thread."""
+    thread = threading.Thread(
+        target=_maintenance_loop, daemon=True, name="db-maintenance",
+    )
+    thread.start()
+    _log("INFO", "DB maintenance thread started.")
+
+
 # ---------------------------------------------------------------------------
 # SSE poller
 # ---------------------------------------------------------------------------
 
-def _sse_push(event_data):
-    """Push event data to all connected SSE clients."""
+SSE_CHANGES_BATCH = 500         # changelog entries read per query
+SSE_CLIENT_QUEUE = 100          # events buffered per client
+SSE_KEEPALIVE = 15              # seconds between keepalive comments
+
+
+class _SSEClient:
+    """Event queue of one /api/events stream (lives on the server loop).
+
+    push() may be called from any thread.  A client that falls more than
+    SSE_CLIENT_QUEUE events behind is marked overflowed; its stream then
+    ends and the browser reconnects with Last-Event-ID to replay.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SSE_CLIENT_QUEUE)
+        self.overflowed = False
+
+    def push(self, item):
+        self.loop.call_soon_threadsafe(self._put, item)
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+def _sse_push(event_data, event_id=None):
+    """Push event data to all connected SSE clients.
+
+    *event_id* (a changelog seq) is sent as the SSE ``id:`` so clients
+    resume from it via Last-Event-ID.
+    """
+    with _sse_clients_lock:
+        clients = list(_sse_clients)
+    for client in clients:
+        try:
+            client.push((event_id, event_data))
+        except RuntimeError:
+            pass        # loop closed (shutting down)
+
+
+def _sse_replay(last_id):
+    """Return ([(seq, json)], newest seq) to resend after *last_id*."""
+    with get_pool(WORKSPACE_DIR).connection() as db:
+        oldest, newest = get_changelog_range(db)
+        if last_id > newest or (oldest and last_id < oldest - 1):
+            # Entries were pruned (or the database reset): the client
+            # must refetch.
+            return [(newest, json.dumps({"type": "resync"}))], newest
+        events, _ = _change_events(db, last_id, newest)
+        return events, newest
+
+
+async def _sse_stream(request):
+    """Yield the Server-Sent Events of one /api/events client (bytes)."""
+    # Register this client first so nothing is lost between the
+    # Last-Event-ID replay and the live stream.
+    client = _SSEClient(asyncio.get_running_loop())
     with _sse_clients_lock:
-        dead = []
-        for i, q in enumerate(_sse_clients):
+        _sse_clients.append(client)
+    try:
+        # Support Last-Event-ID (a changelog seq) for reconnection
+        replayed = 0
+        last_id = request.headers.get("Last-Event-ID")
+        if last_id:
             try:
-                q.put_nowait(event_data)
-            except queue_module.Full:
-                dead.append(i)
-        for i in reversed(dead):
-            _sse_clients.pop(i)
+                events, replayed = await request.run_sync(
+                    _sse_replay, int(last_id))
+                for seq, data in events:
+                    yield f"id: {seq}\ndata: {data}\n\n".encode("utf-8")
+            except Exception:
+                replayed = 0
+
+        while not client.overflowed:
+            try:
+                event_id, data = await asyncio.wait_for(
+                    client.queue.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if event_id is not None and event_id <= replayed:
+                continue  # already sent by the replay
+            if event_id is not None:
+                yield f"id: {event_id}\ndata: {data}\n\n".encode("utf-8")
+            else:
+                yield f"data: {data}\n\n".encode("utf-8")
+    finally:
+        with _sse_clients_lock:
+            try:
+                _sse_clients.remove(client)
+            except ValueError:
+                pass
+
+
+async def _handle_events(request):
+    """GET /api/events -> Server-Sent Events stream (runs on the loop)."""
+    await request.send_head(200, [
+        ("Content-Type", "text/event-stream"),
+        ("Cache-Control", "no-cache"),
+        ("Access-Control-Allow-Origin", "*"),
+    ])
+    stream = _sse_stream(request)
+    try:
+        async for chunk in stream:
+            await request.write(chunk)
+    finally:
+        await stream.aclose()
+
+
+def _change_events(db, since_seq, until_seq=None):
+    """Build SSE events for changelog entries after *since_seq*.
+
+    Returns (events, last_seq) where events is a list of (seq, json).
+    Activity inserts/updates become an "activity" event carrying the
+    rows; changes to any other table become a "change" event listing the
+    affected keys per table so clients can refetch.
+    """
+    events = []
+    while until_seq is None or since_seq < until_seq:
+        changes = get_changes_since(db, since_seq, SSE_CHANGES_BATCH)
+        if until_seq is not None:
+            changes = [c for c in changes if c["seq"] <= until_seq]
+        if not changes:
+            break
+        since_seq = changes[-1]["seq"]
+
+        activity_ids = []
+        tables = {}
+        for change in changes:
+            if change["tbl"] == "activity" and change["op"] != "delete":
+                if change["row_key"] not in activity_ids:
+                    activity_ids.append(change["row_key"])
+            else:
+                keys = tables.setdefault(change["tbl"], [])
+                if change["row_key"] not in keys:
+                    keys.append(change["row_key"])
+
+        entries = get_activity_by_ids(db, activity_ids)
+        if entries:
+            events.append((since_seq, json.dumps({
+                "type": "activity",
+                "entries": entries,
+            })))
+        if tables:
+            events.append((since_seq, json.dumps({
+                "type": "change",
+                "seq": since_seq,
+                "tables": tables,
+            })))
+    return events, since_seq
+
+
+SSE_HEALTH_INTERVAL = 30        # seconds between agent_health pushes
+SSE_FALLBACK_INTERVAL = 30      # changelog re-check without watcher events
+
+
+def _on_workspace_change(changes):
+    """WorkspaceWatcher callback: invalidate caches and wake the poller."""
+    for kind in (KIND_QUEUE, KIND_DASHBOARD):
+        for path in changes.get(kind, ()):
+            _PARSE_CACHE.invalidate(path)
+    if _ingester:
+        _ingester.notify(changes.get(KIND_QUEUE))
+    if _pane_streams:
+        _pane_streams.notify(changes.get(KIND_PANE_LOG))
+    changes = {k: v for k, v in changes.items() if k != KIND_PANE_LOG}
+    if not changes:
+        return
+    with _sse_pending_lock:
+        for kind, paths in changes.items():
+            _sse_pending.setdefault(kind, set()).update(paths)
+    _sse_wake.set()
+
+
+def _on_pane_update(seqs):
+    """PaneStreams callback: push pane deltas to the SSE clients.
+
+    Each event carries the seq it applies to ("since"); a client holding
+    another seq ignores it and refetches the pane.  Resets are announced
+    without contents (the client refetches with its own line count).
+    """
+    with _sse_clients_lock:
+        listening = bool(_sse_clients)
+    if not listening:
+        _pane_sse_seqs.update(seqs)
+        return
+    for agent in seqs:
+        since = _pane_sse_seqs.get(agent)
+        delta = _pane_streams.delta(agent, MAX_LINES, since)
+        if delta is None or delta["seq"] == since:
+            continue
+        _pane_sse_seqs[agent] = delta["seq"]
+        if delta["reset"]:
+            event = {"type": "pane", "agent": agent, "since": since,
+                     "seq": delta["seq"], "reset": True}
+        else:
+            event = {"type": "pane", "agent": agent, "since": since, **delta}
+        _sse_push(json.dumps(event, ensure_ascii=False))
+
+
+def _start_watcher():
+    """Start the workspace file watcher (inotify, polling fallback)."""
+    global _watcher
+    _watcher = WorkspaceWatcher(WORKSPACE_DIR, _on_workspace_change)
+    _watcher.start()
+    _log("INFO", f"Workspace watcher started ({_watcher.backend}).")
+
+
+def _start_pane_streams():
+    """Start tailing the agents' pipe-pane logs into memory."""
+    global _pane_streams
+    _pane_streams = PaneStreams(
+        AGENT_MAP, os.path.join(WORKSPACE_DIR, "logs"), _TMUX,
+        history_lines=MAX_LINES, on_update=_on_pane_update,
+    )
+    _pane_streams.start()
+    _log("INFO", "Pane streams started.")
+
+
+def _start_ingester():
+    """Start the YAML -> SQLite ingester if database.ingest_yaml is set."""
+    global _ingester
+    if not load_db_settings(WORKSPACE_DIR).get("ingest_yaml"):
+        return
+
+    def report(summary):
+        if "error" in summary:
+            _log("WARN", f"YAML ingest failed: {summary['error']}")
+
+    _ingester = YamlIngester(WORKSPACE_DIR)
+    _ingester.start(report=report)
+    _log("INFO", "YAML ingester started.")
 
 
 def _sse_poller_loop():
-    """Background poller that pushes SSE events on data changes."""
-    global _last_activity_rowid, _last_dashboard_mtime
+    """Background loop that pushes SSE events on data changes.
+
+    Sleeps until the workspace watcher reports a change (or the next
+    health push / fallback re-check is due), then tails the changelog
+    and pushes dashboard / queue events.
+    """
+    global _last_change_seq
 
     time.sleep(5)  # Wait for server startup
     _log("INFO", "SSE poller: started.")
 
-    health_counter = 0
+    now = time.monotonic()
+    next_health = now + SSE_HEALTH_INTERVAL
+    next_fallback = now
 
     while True:
         try:
-            # Check activity changes
-            try:
-                db = get_db(WORKSPACE_DIR)
-                current_rowid = get_max_activity_rowid(db)
-                if current_rowid > _last_activity_rowid:
-                    new_entries = get_activity_since_rowid(db, _last_activity_rowid)
-                    if new_entries:
-                        _sse_push(json.dumps({
-                            "type": "activity",
-                            "entries": new_entries,
-                        }))
-                    _last_activity_rowid = current_rowid
-                db.close()
-            except Exception:
-                pass
+            now = time.monotonic()
+            _sse_wake.wait(max(0.0, min(next_health, next_fallback) - now))
+            _sse_wake.clear()
+            with _sse_pending_lock:
+                changes = dict(_sse_pending)
+                _sse_pending.clear()
+            now = time.monotonic()
+
+            # Tail the changelog (dedicated long-lived connection)
+            if KIND_DB in changes or now >= next_fallback:
+                next_fallback = now + SSE_FALLBACK_INTERVAL
+                try:
+                    db = get_pool(WORKSPACE_DIR).dedicated("sse-poller")
+                    if _last_change_seq is None:
+                        _last_change_seq = get_changelog_range(db)[1]
+                    events, _last_change_seq = _change_events(
+                        db, _last_change_seq)
+                    for seq, data in events:
+                        _sse_push(data, seq)
+                except Exception:
+                    pass
 
-            # Check dashboard.md changes
-            dashboard_path = os.path.join(WORKSPACE_DIR, "dashboard.md")
-            try:
-                mtime = os.path.getmtime(dashboard_path)
-                if mtime > _last_dashboard_mtime:
-                    _last_dashboard_mtime = mtime
-                    _sse_push(json.dumps({
-                        "type": "dashboard",
-                        "mtime": mtime,
-                    }))
-            except OSError:
-                pass
+            # dashboard.md changes
+            if KIND_DASHBOARD in changes:
+                dashboard_path = os.path.join(WORKSPACE_DIR, "dashboard.md")
+                try:
+                    mtime = os.path.getmtime(dashboard_path)
+                except OSError:
+                    mtime = None
+                _sse_push(json.dumps({
+                    "type": "dashboard",
+                    "mtime": mtime,
+                }))
+
+            # YAML queue files (fallback data for /api/activity)
+            if KIND_QUEUE in changes:
+                _sse_push(json.dumps({
+                    "type": "queue",
+                    "paths": sorted(
+                        os.path.relpath(p, WORKSPACE_DIR)
+                        for p in changes[KIND_QUEUE]
+                    ),
+                }))
 
-            # Push agent health periodically (every ~30s)
-            health_counter += 1
-            if health_counter >= 30:
-                health_counter = 0
+            # Push agent health periodically
+            if now >= next_health:
+                next_health = now + SSE_HEALTH_INTERVAL
                 with _last_health_lock:
                     health = dict(_last_health)
                 if health:
@@ -623,8 +1128,7 @@ def _sse_poller_loop():
 
         except Exception as e:
             _log("ERROR", f"SSE poller error: {e}")
-
-        time.sleep(1)
+            time.sleep(1)
 
 
 def _start_sse_poller():
@@ -642,6 +1146,9 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
     """HTTP request handler for the Rakuen Web UI."""
 
     server_version = "RakuenWebUI/1.0"
+    # Persistent connections: every response is framed by Content-Length
+    # or chunked transfer coding (see _send_json_stream).
+    protocol_version = "HTTP/1.1"
 
     def do_GET(self):
         """Route GET requests."""
@@ -664,14 +1171,14 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
             self._handle_dashboard()
         elif path == "/api/agents/health":
             self._handle_agents_health()
-        elif path == "/api/events":
-            self._handle_events()
-        elif path == "/" or path == "/index.html":
-            self._serve_static("index.html")
-        elif path.startswith("/static/"):
-            # Strip /static/ prefix
-            file_path = path[len("/static/"):]
-            self._serve_static(file_path)
+        elif path == "/api/search":
+            self._handle_search(parsed.query)
+        elif path == "/api/stats":
+            self._handle_stats()
+        elif path == "/api/metrics":
+            self._handle_metrics()
+        elif path in ("/", "/index.html") or path.startswith("/static/"):
+            self._serve_static(path)
         else:
             self._send_error(404, "Not found")
 
@@ -730,11 +1237,20 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
                 "pane_meta": {},
             }
 
+        health = _check_all_health()
+        status["agent_health"] = health
+        # Some agent pane exists (the header's "Tmux OK").
+        status["tmux_running"] = any(
+            h["status"] != "session_missing" for h in health.values())
         self._send_json(status)
 
     def _handle_pane(self, query_string):
-        """GET /api/pane?agent=<name>&lines=<N> -> pane log text."""
-        params = urllib.parse.parse_qs(query_string)
+        """GET /api/pane?agent=<name>&lines=<N>[&since=<seq>] -> pane text.
+
+        With since: only the changes after that seq (see _pane_entry);
+        an empty or unknown seq gets a reset.
+        """
+        params = urllib.parse.parse_qs(query_string, keep_blank_values=True)
 
         # Validate agent parameter
         agent = params.get("agent", [None])[0]
@@ -751,25 +1267,9 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
         except (ValueError, IndexError):
             lines = DEFAULT_LINES
         lines = max(MIN_LINES, min(MAX_LINES, lines))
+        since = _parse_seq(params["since"][0]) if "since" in params else None
 
-        # Get tmux target
-        target = AGENT_MAP[agent]
-
-        # Capture pane content
-        try:
-            result = subprocess.run(
-                ["tmux", "capture-pane", "-t", target, "-p", "-S", f"-{lines}"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            text = result.stdout
-        except subprocess.TimeoutExpired:
-            text = "[ERROR: tmux capture-pane timed out]"
-        except FileNotFoundError:
-            text = "[ERROR: tmux not found]"
-
-        self._send_json({"agent": agent, "lines": lines, "text": text})
+        self._send_json(_pane_entry(agent, lines, since))
 
     def _handle_send(self):
         """POST /api/send -> send text to rakuen:0.0."""
@@ -810,40 +1310,37 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
         # Send to uichan (always rakuen:0.0)
         # Use 2-bash-call pattern: text first, then Enter separately
         try:
-            subprocess.run(
-                ["tmux", "send-keys", "-t", "rakuen:0.0", "--", text],
-                check=True,
-                timeout=5,
-            )
-            time.sleep(1)
-            subprocess.run(
-                ["tmux", "send-keys", "-t", "rakuen:0.0", "Enter"],
-                check=True,
-                timeout=5,
-            )
-            self._send_json({"ok": True})
-        except subprocess.CalledProcessError as e:
-            self._send_error(500, f"tmux send-keys failed: {e}")
-        except subprocess.TimeoutExpired:
+            ok, err = _TMUX.run(["send-keys", "-t", "rakuen:0.0", "--", text])
+            if ok:
+                time.sleep(1)
+                ok, err = _TMUX.run(["send-keys", "-t", "rakuen:0.0", "Enter"])
+            _CAPTURE_CACHE.invalidate("rakuen:0.0")
+        except TimeoutError:
             self._send_error(500, "tmux send-keys timed out")
+            return
         except FileNotFoundError:
             self._send_error(500, "tmux not found")
+            return
+        if ok:
+            self._send_json({"ok": True})
+        else:
+            self._send_error(500, f"tmux send-keys failed: {err}")
 
     def _handle_send_escape(self):
         """POST /api/send-escape -> send Escape key to rakuen:0.0."""
         try:
-            subprocess.run(
-                ["tmux", "send-keys", "-t", "rakuen:0.0", "Escape"],
-                check=True,
-                timeout=5,
-            )
-            self._send_json({"ok": True})
-        except subprocess.CalledProcessError as e:
-            self._send_error(500, f"tmux send-keys failed: {e}")
-        except subprocess.TimeoutExpired:
+            ok, err = _TMUX.run(["send-keys", "-t", "rakuen:0.0", "Escape"])
+            _CAPTURE_CACHE.invalidate("rakuen:0.0")
+        except TimeoutError:
             self._send_error(500, "tmux send-keys timed out")
+            return
         except FileNotFoundError:
             self._send_error(500, "tmux not found")
+            return
+        if ok:
+            self._send_json({"ok": True})
+        else:
+            self._send_error(500, f"tmux send-keys failed: {err}")
 
     def _handle_presets(self):
         """GET /api/presets -> preset definitions from presets.json."""
@@ -858,188 +1355,199 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
             self._send_json({"presets": [], "error": "Invalid presets.json"})
 
     def _handle_activity(self):
-        """GET /api/activity -> activity timeline entries.
+        """GET /api/activity -> one page of activity timeline entries.
 
         Reads from SQLite first, falls back to YAML files.
-        Supports ?since=ISO8601 for differential fetch.
+        Query parameters (all optional):
+          before=<cursor>  page of entries older than the cursor
+          after=<cursor>   page of entries newer than the cursor
+          since=ISO8601    legacy alias for after=<ts>
+          limit=N          page size (default 200, max 1000)
+          agent=<name>     only entries from this agent
+          task_id=<id>     only entries for this task
+        Without a cursor the newest page is returned.  The response
+        carries "cursor": {"before", "after"} for the next request and
+        "has_more" for the scan direction.
         """
         parsed = urllib.parse.urlparse(self.path)
         params = urllib.parse.parse_qs(parsed.query)
-        since = params.get("since", [None])[0]
+        before = params.get("before", [None])[0]
+        after = params.get("after", [None])[0] or params.get("since", [None])[0]
+        agent = params.get("agent", [None])[0]
+        task_id = params.get("task_id", [None])[0]
+        try:
+            limit = int(params.get("limit", [str(ACTIVITY_DEFAULT_LIMIT)])[0])
+        except (ValueError, IndexError):
+            limit = ACTIVITY_DEFAULT_LIMIT
+        limit = max(1, min(ACTIVITY_MAX_LIMIT, limit))
 
-        entries = []
+        try:
+            before_key = parse_cursor(before, after=False) if before else None
+            after_key = parse_cursor(after, after=True) if after else None
+        except ValueError:
+            self._send_error(400, "Invalid cursor")
+            return
+
+        pool = get_pool(WORKSPACE_DIR)
 
-        # --- SQLite path ---
+        # Bring the timeline up to date.  Its version (changelog seq + YAML
+        # index) identifies every response, so an unchanged poll is
+        # answered with 304 before any page is built.
         try:
-            db = get_db(WORKSPACE_DIR)
-            db_entries = get_all_activity(db, since=since)
-            for item in db_entries:
-                entries.append({
-                    "timestamp": item.get("ts"),
-                    "from": item.get("agent", ""),
-                    "from_label": AGENT_LABELS.get(
-                        item.get("agent", ""), item.get("agent", "")
-                    ),
-                    "to": None,
-                    "to_label": None,
-                    "action": item.get("action", ""),
-                    "task_id": item.get("task_id"),
-                    "type": "progress",
-                    "status": item.get("status", ""),
-                })
-            db.close()
+            with pool.connection() as db:
+                _TIMELINE.refresh(db)
+            refreshed = True
         except Exception:
-            pass
+            refreshed = False
+        _TIMELINE.set_side_sources(self._yaml_sources())
+        etag = None
+        if refreshed:
+            etag = _version_etag("activity", *_TIMELINE.version(),
+                                 parsed.query)
+            if self._not_modified(etag):
+                return
+
+        # --- In-memory timeline (newest page and after=/since= polls) ---
+        page = None
+        if refreshed and not before and not agent and not task_id:
+            page = _TIMELINE.page(after, after_key, limit)
+
+        # --- SQLite path (entries rendered to JSON by SQLite) ---
+        if page is None:
+            page = {"has_more": False, "before": before, "after": after,
+                    "rows": []}
+            try:
+                with pool.connection() as db:
+                    page = get_activity_page_json(
+                        db, _ACTIVITY_JSON_FIELDS, before=before, after=after,
+                        limit=limit, agent=agent, task_id=task_id,
+                    )
+            except Exception:
+                pass
+        rows = page["rows"]
+
+        # The YAML entries shown with this page are those inside the time
+        # window the SQLite page covers, so paging never skips or repeats
+        # them: an open end of the window extends to the cursor (or to
+        # infinity) when the scan direction has no more rows.
+        lo = (after_key[0], False) if after_key else None
+        hi = (before_key[0], False) if before_key else None
+        if page["has_more"] and rows:
+            if after_key:
+                hi = (rows[-1][0], True)
+            else:
+                lo = (rows[0][0], True)
 
         # --- YAML fallback (migration period) ---
-        seen_ids = {e.get("task_id") for e in entries if e.get("task_id")}
-        yaml_entries = []
+        # Entries not already in the SQLite page; undated (dashboard
+        # attention) items belong to the tail page.
+        side = _TIMELINE.side_window(
+            lo, hi, include_undated=not before, agent=agent,
+            task_id=task_id, seen={row[1] for row in rows if row[1]},
+        )
+
+        # Both lists are sorted (null timestamps last), so merge them
+        # while serializing (SQLite rows first on equal timestamps).
+        merged = heapq.merge(
+            ((False, row[0], row[2]) for row in rows),
+            ((ts is None, ts or "",
+              json.dumps(e, ensure_ascii=False, default=str))
+             for ts, e in side),
+            key=lambda item: item[:2],
+        )
+
+        def body():
+            yield '{"entries": ['
+            for i, (_, _, text) in enumerate(merged):
+                yield text if i == 0 else ", " + text
+            yield '], "cursor": ' + json.dumps(
+                {"before": page["before"], "after": page["after"]},
+                ensure_ascii=False,
+            )
+            yield ', "has_more": ' + json.dumps(page["has_more"]) + "}"
+
+        self._send_json_stream(body(), etag=etag)
+
+    def _yaml_sources(self):
+        """Return the YAML fallback entry lists in dedupe priority order.
+
+        The lists come from the parse cache and are shared: callers must
+        not modify them.
+        """
+        queue_dir = os.path.join(WORKSPACE_DIR, "queue")
+        sources = []
 
         # 0. User -> UI-chan inputs
-        self._parse_yaml_entries(
-            os.path.join(WORKSPACE_DIR, "queue", "user_to_uichan.yaml"),
+        sources.append(self._parse_yaml_entries(
+            os.path.join(queue_dir, "user_to_uichan.yaml"),
             entry_type="user_input",
             from_agent="user",
             to_agent="uichan",
-            entries=yaml_entries,
-        )
+        ))
 
         # 1. UI-chan -> AI-chan commands
-        self._parse_yaml_entries(
-            os.path.join(WORKSPACE_DIR, "queue", "uichan_to_aichan.yaml"),
+        sources.append(self._parse_yaml_entries(
+            os.path.join(queue_dir, "uichan_to_aichan.yaml"),
             entry_type="command",
             from_agent="uichan",
             to_agent="aichan",
-            entries=yaml_entries,
-        )
+        ))
 
         # 2. AI-chan -> Kobito N task assignments
         for n in range(1, 9):
-            self._parse_yaml_entries(
-                os.path.join(WORKSPACE_DIR, "queue", "tasks", f"kobito{n}.yaml"),
+            sources.append(self._parse_yaml_entries(
+                os.path.join(queue_dir, "tasks", f"kobito{n}.yaml"),
                 entry_type="assignment",
                 from_agent="aichan",
                 to_agent=f"kobito{n}",
-                entries=yaml_entries,
-            )
+            ))
 
         # 3. Kobito N reports
         for n in range(1, 9):
-            self._parse_yaml_entries(
-                os.path.join(WORKSPACE_DIR, "queue", "reports", f"kobito{n}_report.yaml"),
+            sources.append(self._parse_yaml_entries(
+                os.path.join(queue_dir, "reports", f"kobito{n}_report.yaml"),
                 entry_type="report",
                 from_agent=f"kobito{n}",
                 to_agent=None,
-                entries=yaml_entries,
-            )
+            ))
 
         # 4. Dashboard attention items (要対応 / 伺い事項)
-        self._parse_dashboard_attention(yaml_entries)
+        sources.append(self._parse_dashboard_attention())
+
+        # 5-6. Activity logs: already in SQLite when the ingester runs
+        if _ingester:
+            return sources
 
         # 5. AI-chan activity log
-        self._parse_yaml_entries(
-            os.path.join(WORKSPACE_DIR, "queue", "activity", "aichan.yaml"),
+        sources.append(self._parse_yaml_entries(
+            os.path.join(queue_dir, "activity", "aichan.yaml"),
             entry_type="progress",
             from_agent="aichan",
             to_agent=None,
-            entries=yaml_entries,
-        )
+        ))
 
         # 6. Kobito N activity logs
         for n in range(1, 9):
-            self._parse_yaml_entries(
-                os.path.join(
-                    WORKSPACE_DIR, "queue", "activity", f"kobito{n}.yaml",
-                ),
+            sources.append(self._parse_yaml_entries(
+                os.path.join(queue_dir, "activity", f"kobito{n}.yaml"),
                 entry_type="progress",
                 from_agent=f"kobito{n}",
                 to_agent=None,
-                entries=yaml_entries,
-            )
-
-        # Merge: add YAML entries not already in SQLite results
-        for e in yaml_entries:
-            tid = e.get("task_id")
-            if tid and tid in seen_ids:
-                continue
-            # Apply since filter to YAML entries too
-            if since and e.get("timestamp") and e["timestamp"] <= since:
-                continue
-            entries.append(e)
-            if tid:
-                seen_ids.add(tid)
-
-        # Sort by timestamp ascending; null timestamps go to end
-        entries.sort(key=lambda e: (
-            e["timestamp"] is None,
-            e["timestamp"] or "",
-        ))
-
-        self._send_json({"entries": entries})
-
-    def _handle_events(self):
-        """GET /api/events -> Server-Sent Events stream."""
-        self.send_response(200)
-        self.send_header("Content-Type", "text/event-stream")
-        self.send_header("Cache-Control", "no-cache")
-        self.send_header("Connection", "keep-alive")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.end_headers()
-
-        # Support Last-Event-ID for reconnection
-        last_id = self.headers.get("Last-Event-ID")
-        if last_id:
-            try:
-                # Send missed events since last_id
-                db = get_db(WORKSPACE_DIR)
-                entries = get_activity_since_rowid(db, int(last_id))
-                db.close()
-                if entries:
-                    data = json.dumps({
-                        "type": "activity",
-                        "entries": entries,
-                    })
-                    self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
-                    self.wfile.flush()
-            except Exception:
-                pass
-
-        # Register this client
-        client_queue = queue_module.Queue(maxsize=100)
-        with _sse_clients_lock:
-            _sse_clients.append(client_queue)
-
-        try:
-            event_id = 0
-            while True:
-                try:
-                    data = client_queue.get(timeout=15)
-                    event_id += 1
-                    msg = f"id: {event_id}\ndata: {data}\n\n"
-                    self.wfile.write(msg.encode("utf-8"))
-                    self.wfile.flush()
-                except queue_module.Empty:
-                    # Send keepalive comment
-                    self.wfile.write(b": keepalive\n\n")
-                    self.wfile.flush()
-        except (BrokenPipeError, ConnectionResetError, OSError):
-            pass
-        finally:
-            with _sse_clients_lock:
-                try:
-                    _sse_clients.remove(client_queue)
-                except ValueError:
-                    pass
-
-    def _parse_yaml_entries(self, filepath, entry_type, from_agent, to_agent, entries):
-        """Parse a YAML file and append activity entries."""
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                text = f.read()
-        except (FileNotFoundError, UnicodeDecodeError):
-            return
+            ))
+        return sources
+
+    def _parse_yaml_entries(self, filepath, entry_type, from_agent, to_agent):
+        """Return the activity entries of a YAML file (cached by mtime/size)."""
+        return _PARSE_CACHE.get(
+            ("yaml", filepath, entry_type, from_agent, to_agent), filepath,
+            lambda text: self._yaml_to_entries(
+                text, entry_type, from_agent, to_agent),
+        )
 
-        items = _extract_yaml_items(text)
+    def _yaml_to_entries(self, text, entry_type, from_agent, to_agent):
+        """Normalize the items of one YAML file into activity entries."""
+        entries = []
+        items = extract_items(text)
         for item in items:
             # Skip idle / empty entries
             task_id = item.get("task_id") or item.get("id")
@@ -1076,16 +1584,18 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
                 "type": entry_type,
                 "status": str(status),
             })
+        return entries
 
-    def _parse_dashboard_attention(self, entries):
-        """Parse dashboard.md for attention / inquiry sections."""
+    def _parse_dashboard_attention(self):
+        """Return dashboard.md (cached) attention / inquiry entries."""
         path = os.path.join(WORKSPACE_DIR, "dashboard.md")
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
-        except (FileNotFoundError, UnicodeDecodeError):
-            return
+        return _PARSE_CACHE.get(
+            ("dashboard", path), path, self._dashboard_to_entries,
+        )
 
+    def _dashboard_to_entries(self, text):
+        """Return attention entries for the dashboard.md sections."""
+        entries = []
         for section in ("要対応", "伺い事項"):
             content = _extract_md_section(text, section)
             if content and content.strip() != "なし":
@@ -1101,22 +1611,33 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
                     "status": "attention",
                     "section": section,
                 })
+        return entries
 
     def _handle_panes(self, query_string):
-        """GET /api/panes -> all 10 pane outputs in PARALLEL."""
-        params = urllib.parse.parse_qs(query_string)
+        """GET /api/panes -> all 10 pane outputs in PARALLEL.
+
+        ?since=<agent>:<seq>,... asks for deltas; panes it does not list
+        (all of them for an empty ``since=``) get a reset.
+        """
+        params = urllib.parse.parse_qs(query_string, keep_blank_values=True)
 
         try:
             lines = int(params.get("lines", [str(DEFAULT_LINES)])[0])
         except (ValueError, IndexError):
             lines = DEFAULT_LINES
         lines = max(MIN_LINES, min(MAX_LINES, lines))
+        since = None
+        if "since" in params:
+            since = {}
+            for item in params["since"][0].split(","):
+                agent, _, seq = item.partition(":")
+                since[agent] = _parse_seq(seq)
 
         futures = []
-        for agent, target in AGENT_MAP.items():
-            futures.append(
-                _TMUX_EXECUTOR.submit(_capture_pane_worker, agent, target, lines)
-            )
+        for agent in AGENT_MAP:
+            futures.append(_TMUX_EXECUTOR.submit(
+                _capture_pane_worker, agent, lines,
+                None if since is None else since.get(agent, 0)))
 
         panes = {}
         for f in futures:
@@ -1128,13 +1649,20 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
     def _handle_dashboard(self):
         """GET /api/dashboard -> dashboard.md content."""
         dashboard_path = os.path.join(WORKSPACE_DIR, "dashboard.md")
+        try:
+            st = os.stat(dashboard_path)
+            etag = _version_etag("dashboard", st.st_mtime_ns, st.st_size)
+        except OSError:
+            etag = _version_etag("dashboard", None)
+        if self._not_modified(etag):
+            return
         try:
             with open(dashboard_path, "r", encoding="utf-8") as f:
                 content = f.read()
         except (FileNotFoundError, UnicodeDecodeError):
             content = ""
 
-        self._send_json({"content": content})
+        self._send_json({"content": content}, etag=etag)
 
     def _handle_agents_health(self):
         """GET /api/agents/health -> per-agent health + circuit breaker status."""
@@ -1159,6 +1687,71 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
 
         self._send_json({"agents": result, "watchdog_active": _watchdog_enabled})
 
+    def _handle_search(self, query_string):
+        """GET /api/search?q=<text>&limit=N&offset=N&source=a,b -> ranked hits.
+
+        source is a comma list of activity, task, report (default: all).
+        Matches are marked with [[...]] inside each result's snippet.
+        """
+        params = urllib.parse.parse_qs(query_string)
+        text = params.get("q", [""])[0].strip()
+        if not text:
+            self._send_error(400, "Missing q parameter")
+            return
+        try:
+            limit = int(params.get("limit", [str(SEARCH_DEFAULT_LIMIT)])[0])
+            offset = int(params.get("offset", ["0"])[0])
+        except (ValueError, IndexError):
+            self._send_error(400, "Invalid limit/offset")
+            return
+        limit = max(1, min(SEARCH_MAX_LIMIT, limit))
+        offset = max(0, offset)
+        source = params.get("source", [None])[0]
+        sources = [s for s in source.split(",") if s] if source else None
+
+        try:
+            with get_pool(WORKSPACE_DIR).connection() as db:
+                result = search(db, text, limit=limit, offset=offset,
+                                sources=sources)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except sqlite3.Error as e:
+            self._send_error(500, f"Database error: {e}")
+            return
+        result.update({"q": text, "limit": limit, "offset": offset})
+        self._send_json(result)
+
+    def _handle_stats(self):
+        """GET /api/stats -> per-agent task/activity/report counters."""
+        try:
+            with get_pool(WORKSPACE_DIR).connection() as db:
+                stats = get_stats(db)
+        except sqlite3.Error as e:
+            self._send_error(500, f"Database error: {e}")
+            return
+        self._send_json(stats)
+
+    def _handle_metrics(self):
+        """GET /api/metrics -> internal counters (DB pool, caches, watcher)."""
+        self._send_json({
+            "db_pool": get_pool(WORKSPACE_DIR).stats(),
+            "parse_cache": _PARSE_CACHE.stats(),
+            "timeline": _TIMELINE.stats(),
+            "fswatch": _watcher.stats() if _watcher else None,
+            "ingest": _ingester.stats() if _ingester else None,
+            "yaml_loader": yaml_loader_stats(),
+            "http": dict(_HTTP_STATS),
+            "http_server": self.server.stats(),
+            "sse_clients": len(_sse_clients),
+            "gzip": _GZIP_STATS.stats(),
+            "static": _static_assets.stats() if _static_assets else None,
+            "tmux": _TMUX.stats(),
+            "health_probe": dict(_HEALTH_STATS),
+            "pane_streams": _pane_streams.stats() if _pane_streams else None,
+            "capture_cache": _CAPTURE_CACHE.stats(),
+        })
+
     def _handle_restart(self):
         """POST /api/restart -> restart a specific agent."""
         content_length = int(self.headers.get("Content-Length", 0))
@@ -1212,49 +1805,165 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
 
     # -- Static file serving ------------------------------------------------
 
-    def _serve_static(self, file_path):
-        """Serve a static file from STATIC_DIR."""
-        # Security: prevent path traversal
-        safe_path = Path(STATIC_DIR) / file_path
-        try:
-            safe_path = safe_path.resolve()
-            if not str(safe_path).startswith(str(Path(STATIC_DIR).resolve())):
-                self._send_error(403, "Forbidden")
-                return
-        except (ValueError, OSError):
-            self._send_error(400, "Invalid path")
-            return
+    def _serve_static(self, url_path):
+        """Serve a preloaded static asset.
 
-        if not safe_path.is_file():
+        Content-hashed URLs are immutable; plain URLs (index.html, which
+        references the hashed ones) are revalidated with their ETag.
+        """
+        found = _static_assets.lookup(url_path) if _static_assets else None
+        if found is None:
             self._send_error(404, "File not found")
             return
+        asset, immutable = found
+        if not immutable and self._not_modified(asset.etag):
+            return
 
-        # Determine content type
-        suffix = safe_path.suffix.lower()
-        content_type = MIME_TYPES.get(suffix, "application/octet-stream")
-
-        try:
-            with open(safe_path, "rb") as f:
-                content = f.read()
-            self.send_response(200)
-            self.send_header("Content-Type", content_type)
-            self.send_header("Content-Length", str(len(content)))
-            self.end_headers()
-            self.wfile.write(content)
-        except OSError:
-            self._send_error(500, "Failed to read file")
+        body, etag = asset.body, asset.etag
+        if asset.gzip is not None and self._accepts_gzip():
+            _GZIP_STATS.record(len(body), len(asset.gzip), static=True)
+            body, etag = asset.gzip, gzip_etag(etag)
+        self.send_response(200)
+        self.send_header("Content-Type", asset.content_type)
+        if asset.gzip is not None:
+            self.send_header("Vary", "Accept-Encoding")
+            if body is asset.gzip:
+                self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control",
+                         IMMUTABLE_CACHE_CONTROL if immutable else "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
 
     # -- Response helpers ---------------------------------------------------
 
-    def _send_json(self, data, status=200):
-        """Send a JSON response."""
+    def _accepts_gzip(self):
+        return accepts_gzip(self.headers.get("Accept-Encoding"))
+
+    def _not_modified(self, etag):
+        """Answer 304 if If-None-Match matches *etag*. Returns True if sent.
+
+        The gzip variant of *etag* matches as well.
+        """
+        header = self.headers.get("If-None-Match")
+        if not header or not etag:
+            return False
+        # If-None-Match uses the weak comparison (RFC 9110 13.1.2).
+        matched = None
+        for tag in header.split(","):
+            tag = tag.strip()
+            opaque = tag[2:] if tag.startswith("W/") else tag
+            if tag == "*" or strip_gzip_etag(opaque) == etag:
+                matched = etag if tag == "*" else opaque
+                break
+        if matched is None:
+            return False
+        _HTTP_STATS["not_modified"] += 1
+        self.send_response(304)
+        self.send_header("ETag", matched)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        return True
+
+    def _send_json(self, data, status=200, etag=None):
+        """Send a JSON response.
+
+        Successful GET responses carry a strong ETag (the given version
+        stamp, else a hash of the body) and are revalidated by clients
+        with If-None-Match; a match is answered with 304 and no body.
+        Bodies of GZIP_MIN_SIZE bytes or more are gzip-encoded when the
+        client accepts it.
+        """
         body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        if self.command == "GET" and status == 200:
+            etag = etag or _content_etag(body)
+            if self._not_modified(etag):
+                return
+        else:
+            etag = None
+        gzipped = len(body) >= GZIP_MIN_SIZE and self._accepts_gzip()
+        if gzipped:
+            body = compress(body, _GZIP_STATS)
         self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
         self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", gzip_etag(etag) if gzipped else etag)
+            self.send_header("Cache-Control", "no-cache")
         self.end_headers()
         self.wfile.write(body)
 
+    def _send_json_stream(self, chunks, status=200, etag=None):
+        """Send a JSON response produced piecewise by *chunks* (str).
+
+        The body is written in JSON_STREAM_CHUNK-sized pieces as it is
+        produced instead of being built in memory first.  There is no
+        Content-Length: HTTP/1.1 clients get chunked transfer coding (the
+        connection stays open), HTTP/1.0 clients the connection close.
+        *etag* must be a version stamp known before the body is built.
+        Headers are sent with the first piece, once it is known whether
+        the body reaches GZIP_MIN_SIZE (and so is gzip-encoded).
+        """
+        stream = None
+        chunked = self.request_version == "HTTP/1.1"
+
+        def send_headers(size):
+            nonlocal stream
+            if size >= GZIP_MIN_SIZE and self._accepts_gzip():
+                stream = GzipStream(_GZIP_STATS)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Vary", "Accept-Encoding")
+            if stream:
+                self.send_header("Content-Encoding", "gzip")
+            if etag:
+                self.send_header("ETag", gzip_etag(etag) if stream else etag)
+                self.send_header("Cache-Control", "no-cache")
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            else:
+                self.send_header("Connection", "close")
+            self.end_headers()
+
+        def write(data):
+            if stream:
+                data = stream.compress(data)
+            if not data:
+                return
+            if chunked:
+                data = b"%x\r\n%s\r\n" % (len(data), data)
+            self.wfile.write(data)
+
+        started = False
+        buf = []
+        size = 0
+        for chunk in chunks:
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= JSON_STREAM_CHUNK:
+                if not started:
+                    send_headers(size)
+                    started = True
+                write("".join(buf).encode("utf-8"))
+                buf = []
+                size = 0
+        data = "".join(buf).encode("utf-8")
+        if not started:
+            send_headers(len(data))
+        if data:
+            write(data)
+        if stream:
+            tail = stream.finish()
+            stream = None           # the gzip trailer is already encoded
+            write(tail)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
     def _send_error(self, status, message):
         """Send a JSON error response."""
         self._send_json({"error": message}, status=status)
@@ -1270,6 +1979,7 @@ class RakuenHandler(http.server.BaseHTTPRequestHandler):
 
 def main():
     global RAKUEN_HOME, REPO_ROOT, WORKSPACE_DIR, STATIC_DIR, _LOG_FILE
+    global _static_assets
 
     RAKUEN_HOME = os.environ.get(
         "RAKUEN_HOME",
@@ -1284,6 +1994,13 @@ def main():
     )
     STATIC_DIR = os.path.join(RAKUEN_HOME, "webui", "static")
 
+    # Preload static assets (RAKUEN_WEBUI_DEV=1: reload on file change)
+    _static_assets = StaticAssets(
+        STATIC_DIR, MIME_TYPES,
+        dev=os.environ.get("RAKUEN_WEBUI_DEV", "") not in ("", "0"),
+        stats=_GZIP_STATS,
+    )
+
     # Setup watchdog log file
     log_dir = os.path.join(WORKSPACE_DIR, "logs")
     os.makedirs(log_dir, exist_ok=True)
@@ -1299,17 +2016,17 @@ def main():
     # Determine starting port
     port_start = int(os.environ.get("PORT_START", str(PORT_RANGE_START)))
 
-    # Try ports in range (use ThreadingHTTPServer for SSE support)
+    # Try ports in range (asyncio core: SSE streams on the event loop,
+    # other requests on a bounded handler thread pool)
     server = None
     actual_port = None
 
-    class ThreadingServer(http.server.ThreadingHTTPServer):
-        """Threaded HTTP server for concurrent SSE + API requests."""
-        daemon_threads = True
-
     for port in range(port_start, PORT_RANGE_END + 1):
         try:
-            server = ThreadingServer((BIND_HOST, port), RakuenHandler)
+            server = AsyncHTTPServer(
+                (BIND_HOST, port), RakuenHandler,
+                async_routes={"/api/events": _handle_events},
+            )
             actual_port = port
             break
         except OSError:
@@ -1332,14 +2049,34 @@ def main():
     # Start watchdog thread
     _start_watchdog()
 
-    # Start SSE poller thread
+    # Start workspace watcher and SSE poller threads
+    _start_ingester()
+    _start_pane_streams()
+    _start_watcher()
     _start_sse_poller()
 
+    # Start DB maintenance thread
+    _start_maintenance()
+
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         sys.stderr.write("\n[RakuenWebUI] Shutting down...\n")
-        server.shutdown()
+    finally:
+        # Each step runs even if an earlier one fails.
+        steps = [server.shutdown]
+        if _watcher:
+            steps.append(_watcher.stop)
+        if _ingester:
+            steps.append(_ingester.stop)
+        if _pane_streams:
+            steps.append(_pane_streams.stop)
+        steps += [_TMUX.close, close_pools]
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                _log("WARN", f"Shutdown step {step.__qualname__} failed: {e}")
 
 
 if __name__ == "__main__":
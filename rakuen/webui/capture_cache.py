@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Rakuen short-lived cache of tmux pane captures.
+
+CaptureCache keeps the latest ``capture-pane -p -S -<lines>`` of each
+pane for CAPTURE_TTL seconds.  A request is answered from it when the
+cached capture has at least as many lines; fewer lines are cut from it
+(the capture is taken together with the pane height, so the history
+part and the screen can be told apart).  Concurrent requests for the
+same pane wait for one in-flight capture (single flight) instead of
+each running their own.
+
+Usage:
+    cache = CaptureCache(tmux_client)
+    text = cache.get("multiagent:0.1", 300)
+    cache.invalidate("multiagent:0.1")     # after send-keys
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+CAPTURE_TTL = 1.0             # seconds a capture is reused
+CAPTURE_TIMEOUT = 5           # seconds to wait for tmux
+
+
+class _Capture:
+    """One capture of a pane."""
+
+    __slots__ = ("lines", "rows", "height", "taken_at")
+
+    def __init__(self, lines, text, height, taken_at):
+        self.lines = lines            # history lines asked for (-S -<lines>)
+        self.rows = text.split("\n")[:-1] if text else []
+        self.height = height          # screen rows at the end of rows
+        self.taken_at = taken_at
+
+    def text(self, lines):
+        """Return the capture as if taken with *lines* (<= self.lines)."""
+        history = max(0, len(self.rows) - self.height)
+        keep = min(history, lines) + len(self.rows) - history
+        return "".join(row + "\n" for row in self.rows[len(self.rows) - keep:])
+
+
+class CaptureCache:
+    """Thread-safe, single-flight TTL cache of pane captures."""
+
+    def __init__(self, tmux, ttl=CAPTURE_TTL):
+        self.tmux = tmux
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._captures = {}           # target -> _Capture
+        self._flights = {}            # target -> (lines, Future)
+        self._hits = 0
+        self._coalesced = 0
+        self._misses = 0
+
+    def get(self, target, lines, timeout=CAPTURE_TIMEOUT):
+        """Return the last *lines* of pane *target* like capture-pane.
+
+        "" if the pane does not exist.  Raises TimeoutError /
+        FileNotFoundError from the tmux call.
+        """
+        with self._lock:
+            cached = self._captures.get(target)
+            if (cached is not None and cached.lines >= lines
+                    and time.monotonic() - cached.taken_at < self.ttl):
+                self._hits += 1
+                return cached.text(lines)
+            flight = self._flights.get(target)
+            if flight is not None and flight[0] >= lines:
+                self._coalesced += 1
+                future = flight[1]
+                owner = False
+            else:
+                self._misses += 1
+                future = Future()
+                self._flights[target] = (lines, future)
+                owner = True
+        if owner:
+            self._load(target, lines, future, timeout)
+        try:
+            return future.result(timeout).text(lines)
+        except FutureTimeout:
+            raise TimeoutError(f"capture of {target} timed out") from None
+
+    def _load(self, target, lines, future, timeout):
+        """Capture *target* and complete *future* (with the result or error)."""
+        try:
+            (ok_height, height), (ok, text) = self.tmux.run_many([
+                ["display-message", "-p", "-t", target, "#{pane_height}"],
+                ["capture-pane", "-p", "-t", target, "-S", f"-{lines}"],
+            ], timeout=timeout)
+        except Exception as e:
+            with self._lock:
+                if self._flights.get(target, (None, None))[1] is future:
+                    del self._flights[target]
+            future.set_exception(e)
+            return
+        height = height.strip()
+        if not (ok and ok_height and height.isdigit()):
+            text, height = "", "0"    # no such pane
+        capture = _Capture(lines, text, int(height), time.monotonic())
+        with self._lock:
+            if self._flights.get(target, (None, None))[1] is future:
+                del self._flights[target]
+                self._captures[target] = capture
+        future.set_result(capture)
+
+    def invalidate(self, target):
+        """Forget the capture of *target* (its contents are about to change)."""
+        with self._lock:
+            self._captures.pop(target, None)
+            self._flights.pop(target, None)   # its result is not cached
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            requests = self._hits + self._coalesced + self._misses
+            return {
+                "entries": len(self._captures),
+                "in_flight": len(self._flights),
+                "hits": self._hits,
+                "coalesced": self._coalesced,
+                "misses": self._misses,
+                "hit_rate": (round((self._hits + self._coalesced) / requests, 3)
+                             if requests else None),
+            }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Rakuen HTTP response compression (gzip).
+
+JSON responses of at least GZIP_MIN_SIZE bytes are gzip-encoded for
+clients that send ``Accept-Encoding: gzip``; streamed responses are
+compressed incrementally with one zlib stream.  Static assets are
+compressed once, at GZIP_STATIC_LEVEL, when static_assets.StaticAssets
+loads them.
+
+GzipStats counts the bytes before and after compression and the CPU
+time spent compressing (time.thread_time, so other request threads are
+not charged) for /api/metrics.
+"""
+
+import gzip
+import threading
+import time
+import zlib
+
+
+GZIP_MIN_SIZE = 1024          # smaller bodies are sent uncompressed
+GZIP_LEVEL = 6                # per-response (JSON) compression level
+GZIP_STATIC_LEVEL = 9         # static assets are compressed only once
+
+# Content types worth compressing (images are already compressed).
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+
+
+def accepts_gzip(header):
+    """Return True if an Accept-Encoding *header* allows gzip."""
+    if not header:
+        return False
+    allowed = None
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if coding not in ("gzip", "x-gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == "*":
+            if allowed is None:
+                allowed = q > 0
+        else:
+            return q > 0        # an explicit gzip entry wins over "*"
+    return bool(allowed)
+
+
+def is_compressible(content_type):
+    """Return True if responses of *content_type* should be compressed."""
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def gzip_etag(etag):
+    """Return the ETag of the gzip-encoded variant of *etag*.
+
+    A strong ETag must differ between content codings; the suffix is
+    stripped again by strip_gzip_etag() when revalidating.
+    """
+    return etag[:-1] + '-gzip"' if etag else etag
+
+
+def strip_gzip_etag(etag):
+    """Map a gzip variant ETag back to the identity ETag."""
+    if etag.endswith('-gzip"'):
+        return etag[:-len('-gzip"')] + '"'
+    return etag
+
+
+class GzipStats:
+    """Thread-safe compression counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._cpu = 0.0
+        self._static_hits = 0
+
+    def record(self, bytes_in, bytes_out, cpu=0.0, static=False):
+        """Count one gzip response of *bytes_in* sent as *bytes_out*.
+
+        *cpu* is the compression time spent for this response (0 when it
+        was served from a precompressed cache).
+        """
+        with self._lock:
+            self._responses += 1
+            self._bytes_in += bytes_in
+            self._bytes_out += bytes_out
+            self._cpu += cpu
+            if static:
+                self._static_hits += 1
+
+    def add_cpu(self, cpu):
+        """Charge compression time not tied to one response."""
+        with self._lock:
+            self._cpu += cpu
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            return {
+                "responses": self._responses,
+                "static_responses": self._static_hits,
+                "bytes_in": self._bytes_in,
+                "bytes_out": self._bytes_out,
+                "bytes_saved": self._bytes_in - self._bytes_out,
+                "ratio": (round(self._bytes_out / self._bytes_in, 3)
+                          if self._bytes_in else None),
+                "cpu_ms": round(self._cpu * 1000, 1),
+            }
+
+
+def compress(data, stats, level=GZIP_LEVEL):
+    """gzip *data* (bytes) and record it in *stats*."""
+    start = time.thread_time()
+    out = gzip.compress(data, compresslevel=level, mtime=0)
+    stats.record(len(data), len(out), time.thread_time() - start)
+    return out
+
+
+class GzipStream:
+    """Incremental gzip encoder for a streamed response body.
+
+    Usage:
+        stream = GzipStream(stats)
+        write(stream.compress(chunk)) ...
+        write(stream.finish())
+    """
+
+    def __init__(self, stats, level=GZIP_LEVEL):
+        self._stats = stats
+        self._zobj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._in = 0
+        self._out = 0
+        self._cpu = 0.0
+
+    def compress(self, data):
+        """Compress *data* and return the bytes ready to be sent."""
+        start = time.thread_time()
+        # Z_SYNC_FLUSH: every chunk is decodable on arrival, so a
+        # streamed page renders progressively just as it did uncompressed.
+        out = self._zobj.compress(data) + self._zobj.flush(zlib.Z_SYNC_FLUSH)
+        self._cpu += time.thread_time() - start
+        self._in += len(data)
+        self._out += len(out)
+        return out
+
+    def finish(self):
+        """Return the end of the gzip stream and record the response."""
+        start = time.thread_time()
+        out = self._zobj.flush()
+        self._cpu += time.thread_time() - start
+        self._out += len(out)
+        self._stats.record(self._in, self._out, self._cpu)
+        return out
+
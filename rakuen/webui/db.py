@@ -5,11 +5,19 @@ Provides schema initialization and CRUD operations for the Rakuen system.
 Uses WAL mode for concurrent read/write access by multiple agents.
 """
 
+import contextlib
 import datetime
 import os
 import sqlite3
+import threading
+import time
 import uuid
 
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
 
 # ---------------------------------------------------------------------------
 # Schema
@@ -70,38 +78,851 @@ CREATE TABLE IF NOT EXISTS kv_store (
 );
 
 CREATE INDEX IF NOT EXISTS idx_activity_ts ON activity(ts);
-CREATE INDEX IF NOT EXISTS idx_activity_agent ON activity(agent);
-CREATE INDEX IF NOT EXISTS idx_tasks_wid ON tasks(wid);
 CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
-CREATE INDEX IF NOT EXISTS idx_reports_wid ON reports(wid);
 """
 
+# Task statuses that mean "still being worked on".  Everything else
+# (done, failed, idle, ...) is terminal and eligible for archival.
+ACTIVE_TASK_STATUSES = ("assigned", "working", "in_progress", "blocked")
+
+# SQL literal list of ACTIVE_TASK_STATUSES.  Queries that should use the
+# partial index idx_tasks_active must spell the predicate with these
+# literals (bound parameters do not match a partial index).
+_ACTIVE_STATUS_SQL = ", ".join(f"'{s}'" for s in ACTIVE_TASK_STATUSES)
+
+# Tables tracked by the changelog and the SQL expression of their row
+# key ({r} is "new" or "old" inside the trigger body).
+CHANGELOG_KEYS = {
+    "user_inputs": "{r}.id",
+    "commands": "{r}.id",
+    "tasks": "{r}.task_id",
+    "reports": "{r}.wid || ':' || ifnull({r}.task_id, '')",
+    "activity": "{r}.id",
+    "kv_store": "{r}.key",
+}
+
+
+def _changelog_sql():
+    """Return the changelog table and its per-table capture triggers."""
+    parts = ["""
+        CREATE TABLE IF NOT EXISTS changelog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            ts TEXT NOT NULL
+        );
+    """]
+    now = "strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')"
+    for table, key in CHANGELOG_KEYS.items():
+        for op, event, ref in (("insert", "INSERT", "new"),
+                               ("update", "UPDATE", "new"),
+                               ("delete", "DELETE", "old")):
+            parts.append(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changelog_{op}
+        AFTER {event} ON {table} BEGIN
+            INSERT INTO changelog (tbl, op, row_key, ts)
+            VALUES ('{table}', '{op}', {key.format(r=ref)}, {now});
+        END;
+    """)
+    return "".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+# Schema changes on top of _SCHEMA_SQL, keyed on PRAGMA user_version.
+# migrate() applies every migration newer than the database's
+# user_version, each in its own transaction together with the version
+# bump, so existing workspaces evolve in place.  Never edit a released
+# migration; append a new one instead.
+#
+# "plans" lists (query, params, index) triples: EXPLAIN QUERY PLAN of
+# the query must use the named index once the migration is applied.
+# verify_query_plans() checks them (db_tool.py migrate --verify).
+_MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "composite (wid, ts) indexes for per-worker lookups",
+        "sql": """
+            CREATE INDEX IF NOT EXISTS idx_tasks_wid_ts ON tasks(wid, ts);
+            CREATE INDEX IF NOT EXISTS idx_reports_wid_ts ON reports(wid, ts);
+            DROP INDEX IF EXISTS idx_tasks_wid;
+            DROP INDEX IF EXISTS idx_reports_wid;
+        """,
+        "plans": [
+            ("SELECT * FROM tasks WHERE wid = ? ORDER BY ts ASC",
+             ("kobito1",), "idx_tasks_wid_ts"),
+            ("SELECT * FROM reports WHERE wid = ? ORDER BY ts DESC LIMIT 1",
+             ("kobito1",), "idx_reports_wid_ts"),
+        ],
+    },
+    {
+        "version": 2,
+        "description": "activity (agent, ts) and (task_id, ts) indexes",
+        "sql": """
+            CREATE INDEX IF NOT EXISTS idx_activity_agent_ts
+                ON activity(agent, ts);
+            CREATE INDEX IF NOT EXISTS idx_activity_task_ts
+                ON activity(task_id, ts);
+            DROP INDEX IF EXISTS idx_activity_agent;
+        """,
+        "plans": [
+            ("SELECT rowid, * FROM activity WHERE agent = ?"
+             " ORDER BY ts DESC, rowid DESC LIMIT 100",
+             ("kobito1",), "idx_activity_agent_ts"),
+            ("SELECT rowid, * FROM activity WHERE task_id = ?"
+             " ORDER BY ts DESC, rowid DESC LIMIT 100",
+             ("task_1",), "idx_activity_task_ts"),
+        ],
+    },
+    {
+        "version": 3,
+        "description": "partial index on active task statuses",
+        "sql": f"""
+            CREATE INDEX IF NOT EXISTS idx_tasks_active ON tasks(wid, ts)
+                WHERE status IN ({_ACTIVE_STATUS_SQL});
+        """,
+        "plans": [
+            (f"SELECT * FROM tasks WHERE status IN ({_ACTIVE_STATUS_SQL})"
+             " AND wid = ? ORDER BY wid, ts",
+             ("kobito1",), "idx_tasks_active"),
+        ],
+    },
+    {
+        "version": 4,
+        "description": "FTS5 indexes over activity, tasks and reports text",
+        # External-content tables (the text lives only in the base table)
+        # kept in sync by triggers.  The trigram tokenizer gives substring
+        # matches for Japanese text, file paths and error messages alike.
+        "sql": """
+            CREATE VIRTUAL TABLE IF NOT EXISTS activity_fts USING fts5(
+                action, content='activity', content_rowid='rowid',
+                tokenize='trigram');
+            CREATE TRIGGER IF NOT EXISTS activity_fts_ai
+            AFTER INSERT ON activity BEGIN
+                INSERT INTO activity_fts(rowid, action)
+                VALUES (new.rowid, new.action);
+            END;
+            CREATE TRIGGER IF NOT EXISTS activity_fts_ad
+            AFTER DELETE ON activity BEGIN
+                INSERT INTO activity_fts(activity_fts, rowid, action)
+                VALUES ('delete', old.rowid, old.action);
+            END;
+            CREATE TRIGGER IF NOT EXISTS activity_fts_au
+            AFTER UPDATE ON activity BEGIN
+                INSERT INTO activity_fts(activity_fts, rowid, action)
+                VALUES ('delete', old.rowid, old.action);
+                INSERT INTO activity_fts(rowid, action)
+                VALUES (new.rowid, new.action);
+            END;
+            INSERT INTO activity_fts(activity_fts) VALUES ('rebuild');
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                desc, target_path, content='tasks', content_rowid='rowid',
+                tokenize='trigram');
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ai
+            AFTER INSERT ON tasks BEGIN
+                INSERT INTO tasks_fts(rowid, desc, target_path)
+                VALUES (new.rowid, new.desc, new.target_path);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ad
+            AFTER DELETE ON tasks BEGIN
+                INSERT INTO tasks_fts(tasks_fts, rowid, desc, target_path)
+                VALUES ('delete', old.rowid, old.desc, old.target_path);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_au
+            AFTER UPDATE ON tasks BEGIN
+                INSERT INTO tasks_fts(tasks_fts, rowid, desc, target_path)
+                VALUES ('delete', old.rowid, old.desc, old.target_path);
+                INSERT INTO tasks_fts(rowid, desc, target_path)
+                VALUES (new.rowid, new.desc, new.target_path);
+            END;
+            INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild');
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+                result, content='reports', content_rowid='rowid',
+                tokenize='trigram');
+            CREATE TRIGGER IF NOT EXISTS reports_fts_ai
+            AFTER INSERT ON reports BEGIN
+                INSERT INTO reports_fts(rowid, result)
+                VALUES (new.rowid, new.result);
+            END;
+            CREATE TRIGGER IF NOT EXISTS reports_fts_ad
+            AFTER DELETE ON reports BEGIN
+                INSERT INTO reports_fts(reports_fts, rowid, result)
+                VALUES ('delete', old.rowid, old.result);
+            END;
+            CREATE TRIGGER IF NOT EXISTS reports_fts_au
+            AFTER UPDATE ON reports BEGIN
+                INSERT INTO reports_fts(reports_fts, rowid, result)
+                VALUES ('delete', old.rowid, old.result);
+                INSERT INTO reports_fts(rowid, result)
+                VALUES (new.rowid, new.result);
+            END;
+            INSERT INTO reports_fts(reports_fts) VALUES ('rebuild');
+        """,
+        "plans": [
+            ("SELECT rowid FROM activity_fts WHERE activity_fts MATCH ?",
+             ('"error"',), "activity_fts"),
+        ],
+    },
+    {
+        "version": 5,
+        "description": "changelog table fed by triggers on every table",
+        # AUTOINCREMENT: seq is never reused, even after pruning, so a
+        # consumer's cursor stays valid across maintenance runs.
+        "sql": _changelog_sql(),
+    },
+    {
+        "version": 6,
+        "description": "trigger-maintained per-agent summary tables",
+        # agent_stats: task count and newest task ts per (worker, status).
+        # agent_summary: per-agent activity/report counts and the newest
+        # activity ts / report.  Counts move incrementally; the "newest"
+        # columns are re-read through the (wid|agent, ts) indexes when a
+        # row goes away, so deletes and archival keep them exact.
+        "sql": """
+            CREATE TABLE IF NOT EXISTS agent_stats (
+                agent TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                last_ts TEXT,
+                PRIMARY KEY (agent, status)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS agent_summary (
+                agent TEXT PRIMARY KEY,
+                activity_count INTEGER NOT NULL DEFAULT 0,
+                last_activity_ts TEXT,
+                report_count INTEGER NOT NULL DEFAULT 0,
+                last_report_ts TEXT,
+                last_report_status TEXT
+            ) WITHOUT ROWID;
+
+            CREATE TRIGGER IF NOT EXISTS tasks_stats_ai
+            AFTER INSERT ON tasks BEGIN
+                INSERT INTO agent_stats (agent, status, count, last_ts)
+                VALUES (new.wid, ifnull(new.status, ''), 1, new.ts)
+                ON CONFLICT(agent, status) DO UPDATE SET
+                    count = count + 1,
+                    last_ts = max(ifnull(last_ts, ''), excluded.last_ts);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_stats_ad
+            AFTER DELETE ON tasks BEGIN
+                UPDATE agent_stats SET
+                    count = count - 1,
+                    last_ts = (SELECT MAX(ts) FROM tasks
+                                WHERE wid = old.wid
+                                  AND ifnull(status, '') = agent_stats.status)
+                 WHERE agent = old.wid AND status = ifnull(old.status, '');
+                DELETE FROM agent_stats
+                 WHERE agent = old.wid AND status = ifnull(old.status, '')
+                   AND count <= 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_stats_au
+            AFTER UPDATE OF wid, status, ts ON tasks BEGIN
+                UPDATE agent_stats SET
+                    count = count - 1,
+                    last_ts = (SELECT MAX(ts) FROM tasks
+                                WHERE wid = old.wid
+                                  AND ifnull(status, '') = agent_stats.status
+                                  AND rowid != new.rowid)
+                 WHERE agent = old.wid AND status = ifnull(old.status, '');
+                DELETE FROM agent_stats
+                 WHERE agent = old.wid AND status = ifnull(old.status, '')
+                   AND count <= 0;
+                INSERT INTO agent_stats (agent, status, count, last_ts)
+                VALUES (new.wid, ifnull(new.status, ''), 1, new.ts)
+                ON CONFLICT(agent, status) DO UPDATE SET
+                    count = count + 1,
+                    last_ts = max(ifnull(last_ts, ''), excluded.last_ts);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS activity_summary_ai
+            AFTER INSERT ON activity BEGIN
+                INSERT INTO agent_summary (agent, activity_count,
+                                           last_activity_ts)
+                VALUES (new.agent, 1, new.ts)
+                ON CONFLICT(agent) DO UPDATE SET
+                    activity_count = activity_count + 1,
+                    last_activity_ts = max(ifnull(last_activity_ts, ''),
+                                           excluded.last_activity_ts);
+            END;
+            CREATE TRIGGER IF NOT EXISTS activity_summary_ad
+            AFTER DELETE ON activity BEGIN
+                UPDATE agent_summary SET
+                    activity_count = activity_count - 1,
+                    last_activity_ts = (SELECT MAX(ts) FROM activity
+                                         WHERE agent = old.agent)
+                 WHERE agent = old.agent;
+            END;
+            CREATE TRIGGER IF NOT EXISTS activity_summary_au
+            AFTER UPDATE OF agent, ts ON activity BEGIN
+                UPDATE agent_summary SET
+                    activity_count = activity_count - 1,
+                    last_activity_ts = (SELECT MAX(ts) FROM activity
+                                         WHERE agent = old.agent
+                                           AND rowid != new.rowid)
+                 WHERE agent = old.agent;
+                INSERT INTO agent_summary (agent, activity_count,
+                                           last_activity_ts)
+                VALUES (new.agent, 1, new.ts)
+                ON CONFLICT(agent) DO UPDATE SET
+                    activity_count = activity_count + 1,
+                    last_activity_ts = max(ifnull(last_activity_ts, ''),
+                                           excluded.last_activity_ts);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS reports_summary_ai
+            AFTER INSERT ON reports BEGIN
+                INSERT INTO agent_summary (agent, report_count)
+                VALUES (new.wid, 1)
+                ON CONFLICT(agent) DO UPDATE SET
+                    report_count = report_count + 1;
+                UPDATE agent_summary SET
+                    (last_report_ts, last_report_status) = (
+                        SELECT ts, status FROM reports WHERE wid = new.wid
+                         ORDER BY ts DESC LIMIT 1)
+                 WHERE agent = new.wid;
+            END;
+            CREATE TRIGGER IF NOT EXISTS reports_summary_ad
+            AFTER DELETE ON reports BEGIN
+                UPDATE agent_summary SET
+                    report_count = report_count - 1,
+                    (last_report_ts, last_report_status) = (
+                        SELECT ts, status FROM reports WHERE wid = old.wid
+                         ORDER BY ts DESC LIMIT 1)
+                 WHERE agent = old.wid;
+            END;
+            CREATE TRIGGER IF NOT EXISTS reports_summary_au
+            AFTER UPDATE OF wid, ts, status ON reports BEGIN
+                UPDATE agent_summary SET report_count = report_count - 1
+                 WHERE agent = old.wid;
+                INSERT INTO agent_summary (agent, report_count)
+                VALUES (new.wid, 1)
+                ON CONFLICT(agent) DO UPDATE SET
+                    report_count = report_count + 1;
+                UPDATE agent_summary SET
+                    (last_report_ts, last_report_status) = (
+                        SELECT ts, status FROM reports
+                         WHERE wid = agent_summary.agent
+                         ORDER BY ts DESC LIMIT 1)
+                 WHERE agent IN (old.wid, new.wid);
+            END;
+
+            DELETE FROM agent_stats;
+            INSERT INTO agent_stats (agent, status, count, last_ts)
+                SELECT wid, ifnull(status, ''), COUNT(*), MAX(ts)
+                  FROM tasks GROUP BY wid, ifnull(status, '');
+            DELETE FROM agent_summary;
+            INSERT INTO agent_summary (agent, activity_count,
+                                       last_activity_ts)
+                SELECT agent, COUNT(*), MAX(ts) FROM activity GROUP BY agent;
+            INSERT INTO agent_summary (agent, report_count)
+                SELECT wid, COUNT(*) FROM reports WHERE true GROUP BY wid
+                ON CONFLICT(agent) DO UPDATE SET
+                    report_count = excluded.report_count;
+            UPDATE agent_summary SET
+                (last_report_ts, last_report_status) = (
+                    SELECT ts, status FROM reports
+                     WHERE wid = agent_summary.agent
+                     ORDER BY ts DESC LIMIT 1);
+        """,
+    },
+]
+
+SCHEMA_VERSION = _MIGRATIONS[-1]["version"]
+
+
+def _split_sql(script):
+    """Split a SQL script into complete statements (trigger-safe)."""
+    statements = []
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                statements.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements
+
+
+def get_schema_version(db):
+    """Return the database's PRAGMA user_version."""
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db):
+    """Apply pending migrations. Returns the list of versions applied.
+
+    Safe to run concurrently from several processes: the version is
+    re-read under the write lock, so each migration is applied once.
+    """
+    applied = []
+    for migration in _MIGRATIONS:
+        version = migration["version"]
+        if get_schema_version(db) >= version:
+            continue
+        with transaction(db):
+            if get_schema_version(db) >= version:
+                continue
+            for statement in _split_sql(migration["sql"]):
+                db.execute(statement)
+            db.execute(f"PRAGMA user_version = {int(version)}")
+        applied.append(version)
+    return applied
+
+
+def explain_query_plan(db, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for *sql*."""
+    rows = db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [row[3] for row in rows]
+
+
+def verify_query_plans(db):
+    """Check every applied migration's expected query plans.
+
+    Returns a list of failure dicts (empty when all plans use the
+    expected index).
+    """
+    failures = []
+    version = get_schema_version(db)
+    for migration in _MIGRATIONS:
+        if migration["version"] > version:
+            continue
+        for sql, params, index in migration.get("plans", []):
+            plan = explain_query_plan(db, sql, params)
+            # B-tree indexes show as "INDEX <name>", FTS5 tables as
+            # "VIRTUAL TABLE INDEX <n>:M..." on a scan of <name>.
+            if not any(f"INDEX {index}" in line
+                       or (f"SCAN {index} VIRTUAL TABLE INDEX" in line
+                           and ":M" in line)
+                       for line in plan):
+                failures.append({
+                    "version": migration["version"],
+                    "query": sql,
+                    "expected_index": index,
+                    "plan": plan,
+                })
+    return failures
+
+
+# ---------------------------------------------------------------------------
+# Settings
+# ---------------------------------------------------------------------------
+
+_DEFAULT_DB_SETTINGS = {
+    "retention": {
+        "activity": {"max_age_days": 30, "max_rows": 50000},
+        "tasks": {"max_age_days": 90, "max_rows": None},
+        "reports": {"max_age_days": 90, "max_rows": None},
+    },
+    "archive_dir": "archive",
+    "maintenance_interval": 3600,
+    "checkpoint_interval": 300,
+    "vacuum_pages": 1000,
+    "changelog_max_rows": 100000,
+    "profile": "safe",
+    "ingest_yaml": False,
+}
+
+# Named PRAGMA profiles (settings.yaml database.profile), applied by
+# _connect() on every connection.  WAL and busy_timeout are always on.
+#   safe      SQLite defaults: fsync on every commit.
+#   balanced  synchronous=NORMAL: WAL is fsynced only at checkpoints, so
+#             a power loss may drop the last commits but never corrupts.
+#   fast      synchronous=OFF plus a large cache and mmap: an OS crash or
+#             power loss may corrupt the database.  Only for disposable
+#             workspaces on fast local disks.
+DB_PROFILES = {
+    "safe": {
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    "balanced": {
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+    },
+    "fast": {
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+
+_settings_cache = {}     # {path: (mtime_ns, settings)}
+
+
+def _merge(base, override):
+    """Recursively merge *override* into a copy of *base*."""
+    result = dict(base)
+    for k, v in (override or {}).items():
+        if isinstance(v, dict) and isinstance(result.get(k), dict):
+            result[k] = _merge(result[k], v)
+        else:
+            result[k] = v
+    return result
+
+
+def load_db_settings(workspace_dir):
+    """Return the ``database:`` section of settings.yaml over defaults.
+
+    Looks in <workspace>/config/settings.yaml first, then
+    $RAKUEN_HOME/config/settings.yaml.  Parsed files are cached by mtime.
+    Without PyYAML (or without either file) the defaults are returned.
+    """
+    candidates = [os.path.join(workspace_dir, "config", "settings.yaml")]
+    rakuen_home = os.environ.get("RAKUEN_HOME")
+    if rakuen_home:
+        candidates.append(os.path.join(rakuen_home, "config", "settings.yaml"))
+
+    for path in candidates:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        cached = _settings_cache.get(path)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        data = {}
+        if yaml is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = yaml.safe_load(f) or {}
+            except (OSError, yaml.YAMLError):
+                data = {}
+        section = data.get("database") if isinstance(data, dict) else None
+        settings = _merge(_DEFAULT_DB_SETTINGS,
+                          section if isinstance(section, dict) else {})
+        _settings_cache[path] = (mtime_ns, settings)
+        return settings
+    return _merge(_DEFAULT_DB_SETTINGS, {})
+
 
 # ---------------------------------------------------------------------------
 # Connection management
 # ---------------------------------------------------------------------------
 
-def get_db(workspace_dir):
-    """Return a sqlite3.Connection to the workspace database.
+class RakuenConnection(sqlite3.Connection):
+    """sqlite3.Connection that tracks explicit transaction() nesting.
 
-    Enables WAL mode and sets busy_timeout to 5000ms for
-    concurrent access by multiple agents.
+    While tx_depth > 0 the CRUD helpers below skip their per-row commit,
+    so a whole batch shares one COMMIT (and one WAL fsync).
     """
+
+    tx_depth = 0
+
+
+def _connect(workspace_dir, check_same_thread=True, profile=None):
+    """Open a new connection with the standard Rakuen PRAGMAs applied.
+
+    *profile* names an entry of DB_PROFILES; by default it comes from
+    settings.yaml (database.profile).  Raises ValueError for unknown
+    profiles.
+    """
+    profile = profile or load_db_settings(workspace_dir)["profile"]
+    if profile not in DB_PROFILES:
+        raise ValueError(
+            f"Unknown database profile: {profile}"
+            f" (expected one of {', '.join(DB_PROFILES)})"
+        )
     db_path = os.path.join(workspace_dir, "rakuen.db")
-    conn = sqlite3.connect(db_path, timeout=10)
+    is_new = not os.path.exists(db_path) or os.path.getsize(db_path) == 0
+    conn = sqlite3.connect(
+        db_path, timeout=10, check_same_thread=check_same_thread,
+        factory=RakuenConnection,
+    )
     conn.row_factory = sqlite3.Row
+    if is_new:
+        # Must precede journal_mode on a brand-new file.  On an existing
+        # database the PRAGMA needs the write lock, so it is skipped there;
+        # retention.ensure_incremental_vacuum converts old workspaces.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA busy_timeout=5000")
+    # INSERT OR REPLACE deletes the conflicting row; without this the
+    # delete does not fire the triggers that keep derived tables in sync.
+    conn.execute("PRAGMA recursive_triggers=ON")
+    for pragma, value in DB_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma}={value}")
     return conn
 
 
+def get_db(workspace_dir, profile=None):
+    """Return a sqlite3.Connection to the workspace database.
+
+    Enables WAL mode and sets busy_timeout to 5000ms for
+    concurrent access by multiple agents, then applies the configured
+    PRAGMA profile (or *profile*, see DB_PROFILES).  Each call opens a
+    new connection; long-running processes should use get_pool() instead.
+    """
+    return _connect(workspace_dir, profile=profile)
+
+
+def get_db_pragmas(db):
+    """Return the effective values of the profile PRAGMAs on *db*."""
+    return {
+        pragma: db.execute(f"PRAGMA {pragma}").fetchone()[0]
+        for pragma in ("journal_mode", "synchronous", "cache_size",
+                       "mmap_size", "temp_store", "busy_timeout")
+    }
+
+
+class ConnectionPool:
+    """Bounded pool of reusable connections to one workspace database.
+
+    Connections are opened with check_same_thread=False and handed out
+    to one thread at a time.  A thread that re-enters connection() while
+    already holding a connection gets the same one back (thread-local
+    reuse), so nested helpers never open a second connection.  Idle
+    connections are kept on a LIFO stack and health-checked with
+    ``SELECT 1`` when they have been idle longer than
+    *health_check_interval* seconds.
+
+    At most *max_size* pooled connections exist at once; further
+    checkouts wait up to *acquire_timeout* seconds for one to be
+    returned.  Dedicated connections (see dedicated()) are long-lived,
+    owned by a single background thread and not counted against
+    max_size.
+    """
+
+    def __init__(self, workspace_dir, max_size=8, health_check_interval=30.0,
+                 acquire_timeout=10.0):
+        self.workspace_dir = workspace_dir
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []                 # [(conn, last_used_monotonic)]
+        self._open = 0                  # pooled connections alive
+        self._local = threading.local()
+        self._dedicated = {}            # {name: conn}
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "closed": 0,
+            "health_check_failures": 0,
+            "waits": 0,
+        }
+
+    # -- Pooled connections -------------------------------------------------
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection.
+
+        The connection is returned to the pool on exit; any transaction
+        left open by the caller is rolled back first.
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._checkin(conn)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    stale = (time.monotonic() - last_used
+                             > self.health_check_interval)
+                    if stale and not self._is_healthy(conn):
+                        self._stats["health_check_failures"] += 1
+                        self._discard(conn)
+                        continue
+                    self._stats["reused"] += 1
+                    return conn
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Connection pool exhausted ({self.max_size} in use)"
+                    )
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+        # Open outside the lock: connect + PRAGMAs may block on busy_timeout.
+        try:
+            conn = _connect(self.workspace_dir, check_same_thread=False)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _checkin(self, conn):
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+        with self._cond:
+            if healthy and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        """Close a pooled connection. Caller must hold self._cond."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._open -= 1
+        self._stats["closed"] += 1
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    # -- Dedicated connections ----------------------------------------------
+
+    def dedicated(self, name):
+        """Return the long-lived connection reserved for *name*.
+
+        Intended for background loops (e.g. the SSE poller) that query
+        every second: they keep one connection for their whole lifetime
+        instead of checking one out per tick.  The connection is
+        health-checked on every call and transparently reopened if it
+        has gone bad.
+        """
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            conn = self._dedicated.get(name)
+        if conn is not None:
+            if self._is_healthy(conn):
+                return conn
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+                self._stats["closed"] += 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        conn = _connect(self.workspace_dir, check_same_thread=False)
+        with self._cond:
+            self._dedicated[name] = conn
+            self._stats["created"] += 1
+        return conn
+
+    # -- Introspection / shutdown -------------------------------------------
+
+    def stats(self):
+        """Return a snapshot of pool counters as a plain dict."""
+        with self._cond:
+            data = dict(self._stats)
+            data["max_size"] = self.max_size
+            data["open"] = self._open
+            data["idle"] = len(self._idle)
+            data["in_use"] = self._open - len(self._idle)
+            data["dedicated"] = sorted(self._dedicated)
+        return data
+
+    def close(self):
+        """Close every idle and dedicated connection.
+
+        Connections currently checked out are closed when returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            dedicated, self._dedicated = self._dedicated, {}
+            for conn, _ in idle:
+                self._discard(conn)
+            for conn in dedicated.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                self._stats["closed"] += 1
+            self._cond.notify_all()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workspace_dir, **kwargs):
+    """Return the process-wide ConnectionPool for *workspace_dir*.
+
+    The pool is created on first use; *kwargs* are passed to
+    ConnectionPool and ignored on subsequent calls.
+    """
+    key = os.path.abspath(workspace_dir)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(workspace_dir, **kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def close_pools():
+    """Close and forget all pools created by get_pool()."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
 def init_db(workspace_dir):
     """Initialize all tables in the workspace database.
 
-    Idempotent: uses CREATE TABLE IF NOT EXISTS for every table.
+    Idempotent: uses CREATE TABLE IF NOT EXISTS for every table, then
+    applies any pending migrations.
     """
     os.makedirs(workspace_dir, exist_ok=True)
     conn = get_db(workspace_dir)
+    try:
+        conn.executescript(_SCHEMA_SQL)
+        conn.commit()
+        migrate(conn)
+    finally:
+        conn.close()
+
+
+def init_archive_db(path):
+    """Create (if needed) an archive database with the base table schema."""
+    conn = sqlite3.connect(path, timeout=10)
     try:
         conn.executescript(_SCHEMA_SQL)
         conn.commit()
@@ -116,11 +937,15 @@ def reset_db(workspace_dir):
     """
     conn = get_db(workspace_dir)
     try:
-        for table in ("user_inputs", "commands", "tasks", "reports",
-                       "activity", "kv_store"):
+        for table in ("activity_fts", "tasks_fts", "reports_fts", "changelog",
+                      "agent_stats", "agent_summary",
+                      "user_inputs", "commands", "tasks", "reports",
+                      "activity", "kv_store"):
             conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute("PRAGMA user_version = 0")
         conn.executescript(_SCHEMA_SQL)
         conn.commit()
+        migrate(conn)
     finally:
         conn.close()
 
@@ -139,16 +964,77 @@ def _now_iso():
     return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
 
 
+def _commit(db):
+    """Commit unless the caller has an explicit transaction() open."""
+    if not getattr(db, "tx_depth", 0):
+        db.commit()
+
+
+# ---------------------------------------------------------------------------
+# Transactions
+# ---------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def transaction(db):
+    """Run a block of writes as one transaction.
+
+    Takes the write lock up front (BEGIN IMMEDIATE) so concurrent agents
+    wait on busy_timeout instead of failing mid-batch.  Commits on normal
+    exit and rolls back on exception.  Nested transaction() blocks join
+    the outermost one.
+
+    Usage:
+        with transaction(db):
+            for entry in entries:
+                upsert_task(db, entry)
+    """
+    depth = getattr(db, "tx_depth", 0)
+    if depth:
+        db.tx_depth = depth + 1
+        try:
+            yield db
+        finally:
+            db.tx_depth = depth
+        return
+
+    if db.in_transaction:
+        # Flush an implicit transaction left open by the caller.
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    db.tx_depth = 1
+    try:
+        yield db
+    except BaseException:
+        db.tx_depth = 0
+        db.rollback()
+        raise
+    db.tx_depth = 0
+    db.commit()
+
+
 # ---------------------------------------------------------------------------
 # CRUD operations
 # ---------------------------------------------------------------------------
 
+# Upserts use ON CONFLICT DO UPDATE rather than INSERT OR REPLACE: the row
+# keeps its rowid (stable keyset cursors and FTS rowids) and the changelog
+# records a single "update" instead of a delete followed by an insert.
+# The WHERE ... IS NOT guard turns re-writing an unchanged row (e.g. the
+# YAML ingester re-reading a file) into a no-op: no write, no changelog.
+
 def upsert_user_input(db, entry):
     """Insert or update a user input entry."""
     db.execute(
-        """INSERT OR REPLACE INTO user_inputs
+        """INSERT INTO user_inputs
            (id, ts, command, project, priority, status)
-           VALUES (:id, :ts, :command, :project, :priority, :status)""",
+           VALUES (:id, :ts, :command, :project, :priority, :status)
+           ON CONFLICT(id) DO UPDATE SET
+               ts = excluded.ts, command = excluded.command,
+               project = excluded.project, priority = excluded.priority,
+               status = excluded.status
+           WHERE (ts, command, project, priority, status) IS NOT
+                 (excluded.ts, excluded.command, excluded.project,
+                  excluded.priority, excluded.status)""",
         {
             "id": entry.get("id", _gen_id("ui_")),
             "ts": entry.get("ts", _now_iso()),
@@ -158,15 +1044,22 @@ def upsert_user_input(db, entry):
             "status": entry.get("status", "pending"),
         },
     )
-    db.commit()
+    _commit(db)
 
 
 def upsert_command(db, entry):
     """Insert or update a command entry."""
     db.execute(
-        """INSERT OR REPLACE INTO commands
+        """INSERT INTO commands
            (id, ts, command, project, priority, status)
-           VALUES (:id, :ts, :command, :project, :priority, :status)""",
+           VALUES (:id, :ts, :command, :project, :priority, :status)
+           ON CONFLICT(id) DO UPDATE SET
+               ts = excluded.ts, command = excluded.command,
+               project = excluded.project, priority = excluded.priority,
+               status = excluded.status
+           WHERE (ts, command, project, priority, status) IS NOT
+                 (excluded.ts, excluded.command, excluded.project,
+                  excluded.priority, excluded.status)""",
         {
             "id": entry.get("id", _gen_id("cmd_")),
             "ts": entry.get("ts", _now_iso()),
@@ -176,35 +1069,63 @@ def upsert_command(db, entry):
             "status": entry.get("status", "pending"),
         },
     )
-    db.commit()
+    _commit(db)
 
 
-def upsert_task(db, entry):
-    """Insert or update a task assignment entry."""
-    db.execute(
-        """INSERT OR REPLACE INTO tasks
+_UPSERT_TASK_SQL = """INSERT INTO tasks
            (task_id, parent_cmd, wid, desc, target_path, status, ts)
            VALUES (:task_id, :parent_cmd, :wid, :desc,
-                   :target_path, :status, :ts)""",
-        {
-            "task_id": entry.get("task_id", _gen_id("task_")),
-            "parent_cmd": entry.get("parent_cmd"),
-            "wid": entry.get("wid", ""),
-            "desc": entry.get("desc"),
-            "target_path": entry.get("target_path"),
-            "status": entry.get("status", "idle"),
-            "ts": entry.get("ts", _now_iso()),
-        },
-    )
-    db.commit()
+                   :target_path, :status, :ts)
+           ON CONFLICT(task_id) DO UPDATE SET
+               parent_cmd = excluded.parent_cmd, wid = excluded.wid,
+               desc = excluded.desc, target_path = excluded.target_path,
+               status = excluded.status, ts = excluded.ts
+           WHERE (parent_cmd, wid, desc, target_path, status, ts) IS NOT
+                 (excluded.parent_cmd, excluded.wid, excluded.desc,
+                  excluded.target_path, excluded.status, excluded.ts)"""
+
+
+def _task_params(entry):
+    return {
+        "task_id": entry.get("task_id", _gen_id("task_")),
+        "parent_cmd": entry.get("parent_cmd"),
+        "wid": entry.get("wid", ""),
+        "desc": entry.get("desc"),
+        "target_path": entry.get("target_path"),
+        "status": entry.get("status", "idle"),
+        "ts": entry.get("ts", _now_iso()),
+    }
+
+
+def upsert_task(db, entry):
+    """Insert or update a task assignment entry."""
+    db.execute(_UPSERT_TASK_SQL, _task_params(entry))
+    _commit(db)
+
+
+def upsert_tasks_many(db, entries):
+    """Insert or update many task entries in one transaction.
+
+    Returns the number of rows written.
+    """
+    params = [_task_params(e) for e in entries]
+    with transaction(db):
+        db.executemany(_UPSERT_TASK_SQL, params)
+    return len(params)
 
 
 def upsert_report(db, entry):
     """Insert or update a kobito report entry."""
     db.execute(
-        """INSERT OR REPLACE INTO reports
+        """INSERT INTO reports
            (wid, task_id, ts, status, result, sc)
-           VALUES (:wid, :task_id, :ts, :status, :result, :sc)""",
+           VALUES (:wid, :task_id, :ts, :status, :result, :sc)
+           ON CONFLICT(wid, task_id) DO UPDATE SET
+               ts = excluded.ts, status = excluded.status,
+               result = excluded.result, sc = excluded.sc
+           WHERE (ts, status, result, sc) IS NOT
+                 (excluded.ts, excluded.status, excluded.result,
+                  excluded.sc)""",
         {
             "wid": entry.get("wid", ""),
             "task_id": entry.get("task_id", ""),
@@ -214,25 +1135,47 @@ def upsert_report(db, entry):
             "sc": entry.get("sc"),
         },
     )
-    db.commit()
+    _commit(db)
+
+
+_INSERT_ACTIVITY_SQL = """INSERT INTO activity
+           (id, agent, ts, action, status, task_id)
+           VALUES (:id, :agent, :ts, :action, :status, :task_id)
+           ON CONFLICT(id) DO UPDATE SET
+               agent = excluded.agent, ts = excluded.ts,
+               action = excluded.action, status = excluded.status,
+               task_id = excluded.task_id
+           WHERE (agent, ts, action, status, task_id) IS NOT
+                 (excluded.agent, excluded.ts, excluded.action,
+                  excluded.status, excluded.task_id)"""
+
+
+def _activity_params(entry):
+    return {
+        "id": entry.get("id", _gen_id("act_")),
+        "agent": entry.get("agent", ""),
+        "ts": entry.get("ts", _now_iso()),
+        "action": entry.get("action", ""),
+        "status": entry.get("status"),
+        "task_id": entry.get("task_id"),
+    }
 
 
 def insert_activity(db, entry):
     """Insert an activity log entry."""
-    db.execute(
-        """INSERT OR REPLACE INTO activity
-           (id, agent, ts, action, status, task_id)
-           VALUES (:id, :agent, :ts, :action, :status, :task_id)""",
-        {
-            "id": entry.get("id", _gen_id("act_")),
-            "agent": entry.get("agent", ""),
-            "ts": entry.get("ts", _now_iso()),
-            "action": entry.get("action", ""),
-            "status": entry.get("status"),
-            "task_id": entry.get("task_id"),
-        },
-    )
-    db.commit()
+    db.execute(_INSERT_ACTIVITY_SQL, _activity_params(entry))
+    _commit(db)
+
+
+def insert_activity_many(db, entries):
+    """Insert many activity log entries in one transaction.
+
+    Returns the number of rows written.
+    """
+    params = [_activity_params(e) for e in entries]
+    with transaction(db):
+        db.executemany(_INSERT_ACTIVITY_SQL, params)
+    return len(params)
 
 
 def get_all_activity(db, since=None):
@@ -253,6 +1196,166 @@ def get_all_activity(db, since=None):
     return [dict(row) for row in rows]
 
 
+# Keyset pagination over activity on the (ts, rowid) key.  Cursors are
+# opaque strings "<ts>|<rowid>"; a bare "<ts>" (e.g. the legacy ?since=)
+# is also accepted and means "strictly before/after that timestamp".
+_CURSOR_SEP = "|"
+_ROWID_MAX = 2 ** 63 - 1
+
+
+def encode_cursor(ts, rowid):
+    """Return the opaque pagination cursor for an activity row."""
+    return f"{ts}{_CURSOR_SEP}{rowid}"
+
+
+def parse_cursor(cursor, after):
+    """Parse a cursor into a (ts, rowid) key.
+
+    A bare timestamp is widened so that every row with that exact ts is
+    excluded: rowid MAX for an "after" bound, -1 for a "before" bound.
+    Raises ValueError on a malformed rowid.
+    """
+    ts, sep, rowid = cursor.rpartition(_CURSOR_SEP)
+    if not sep:
+        return cursor, (_ROWID_MAX if after else -1)
+    return ts, int(rowid)
+
+
+def _activity_page_query(select, before, after, limit, agent, task_id):
+    """Build the keyset page query. Returns (sql, params, forward)."""
+    where = []
+    params = []
+    if agent:
+        where.append("agent = ?")
+        params.append(agent)
+    if task_id:
+        where.append("task_id = ?")
+        params.append(task_id)
+    if after:
+        where.append("(ts, rowid) > (?, ?)")
+        params.extend(parse_cursor(after, after=True))
+    if before:
+        where.append("(ts, rowid) < (?, ?)")
+        params.extend(parse_cursor(before, after=False))
+
+    forward = bool(after)
+    order = "ASC" if forward else "DESC"
+    sql = f"SELECT {select} FROM activity"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY ts {order}, rowid {order} LIMIT ?"
+    params.append(limit + 1)
+    return sql, params, forward
+
+
+def get_activity_page(db, before=None, after=None, limit=100,
+                      agent=None, task_id=None):
+    """Return one page of activity entries using keyset pagination.
+
+    - after only:    the *limit* oldest rows newer than the cursor.
+    - before only:   the *limit* newest rows older than the cursor.
+    - neither:       the *limit* newest rows (the tail of the timeline).
+    - both:          rows strictly between the cursors, oldest first.
+
+    Optional *agent* / *task_id* filters are served by the
+    (agent, ts) / (task_id, ts) indexes.
+
+    Returns {"entries": [...], "has_more": bool, "before": cursor|None,
+    "after": cursor|None}.  Entries are always in ascending (ts, rowid)
+    order and carry their rowid.  has_more reports whether further rows
+    exist in the scan direction; before/after are the cursors of the
+    first/last entry (or the inputs when the page is empty).
+    """
+    sql, params, forward = _activity_page_query(
+        "rowid, *", before, after, limit, agent, task_id,
+    )
+    rows = db.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    entries = [dict(row) for row in rows[:limit]]
+    if not forward:
+        entries.reverse()
+
+    if entries:
+        first, last = entries[0], entries[-1]
+        before_cursor = encode_cursor(first["ts"], first["rowid"])
+        after_cursor = encode_cursor(last["ts"], last["rowid"])
+    else:
+        before_cursor, after_cursor = before, after
+    return {
+        "entries": entries,
+        "has_more": has_more,
+        "before": before_cursor,
+        "after": after_cursor,
+    }
+
+
+def get_activity_page_json(db, fields, before=None, after=None, limit=100,
+                           agent=None, task_id=None, field_params=()):
+    """Like get_activity_page(), but SQLite renders each entry as JSON.
+
+    *fields* is a sequence of (key, sql_expr) pairs over the activity
+    columns; each row is returned as the JSON text of
+    json_object(key, expr, ...), so no per-row dict is built in Python.
+    *field_params* binds any "?" placeholders used in the expressions.
+
+    Returns {"rows": [(ts, task_id, json_text), ...], "has_more",
+    "before", "after"} with rows in ascending (ts, rowid) order.
+    """
+    obj = ", ".join(f"'{key}', {expr}" for key, expr in fields)
+    sql, params, forward = _activity_page_query(
+        f"rowid, ts, task_id, json_object({obj})",
+        before, after, limit, agent, task_id,
+    )
+    cur = db.execute(sql, list(field_params) + params)
+    cur.row_factory = None   # plain tuples
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    del rows[limit:]
+    if not forward:
+        rows.reverse()
+
+    if rows:
+        before_cursor = encode_cursor(rows[0][1], rows[0][0])
+        after_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    else:
+        before_cursor, after_cursor = before, after
+    return {
+        "rows": [row[1:] for row in rows],
+        "has_more": has_more,
+        "before": before_cursor,
+        "after": after_cursor,
+    }
+
+
+def get_activity_json_rows(db, fields, ids=None, limit=None,
+                           field_params=()):
+    """Return activity rows rendered as in get_activity_page_json().
+
+    Selects the rows whose id is in *ids*, or else the newest *limit*
+    rows.  Returns [(id, rowid, ts, task_id, json_text), ...] in
+    ascending (ts, rowid) order.
+    """
+    obj = ", ".join(f"'{key}', {expr}" for key, expr in fields)
+    select = f"SELECT id, rowid, ts, task_id, json_object({obj}) FROM activity"
+    params = list(field_params)
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return []
+        marks = ", ".join("?" for _ in ids)
+        sql = f"{select} WHERE id IN ({marks}) ORDER BY ts ASC, rowid ASC"
+        params += ids
+    else:
+        sql = f"{select} ORDER BY ts DESC, rowid DESC LIMIT ?"
+        params.append(int(limit))
+    cur = db.execute(sql, params)
+    cur.row_factory = None   # plain tuples
+    rows = cur.fetchall()
+    if ids is None:
+        rows.reverse()
+    return rows
+
+
 def get_all_tasks(db):
     """Return all task entries ordered by timestamp ascending."""
     rows = db.execute(
@@ -294,6 +1397,17 @@ def get_tasks_by_worker(db, wid):
     return [dict(row) for row in rows]
 
 
+def get_active_tasks(db, wid=None):
+    """Return tasks still being worked on (served by idx_tasks_active)."""
+    sql = f"SELECT * FROM tasks WHERE status IN ({_ACTIVE_STATUS_SQL})"
+    params = ()
+    if wid:
+        sql += " AND wid = ?"
+        params = (wid,)
+    rows = db.execute(sql + " ORDER BY wid, ts", params).fetchall()
+    return [dict(row) for row in rows]
+
+
 def get_report_by_worker(db, wid):
     """Return the latest report for a specific worker."""
     row = db.execute(
@@ -318,6 +1432,205 @@ def get_activity_since_rowid(db, rowid):
     return [dict(row) for row in rows]
 
 
+def get_activity_by_ids(db, ids):
+    """Return activity entries (with rowid) for *ids*, ordered by ts."""
+    ids = list(ids)
+    if not ids:
+        return []
+    marks = ", ".join("?" for _ in ids)
+    rows = db.execute(
+        f"SELECT *, rowid FROM activity WHERE id IN ({marks})"
+        " ORDER BY ts ASC, rowid ASC",
+        ids,
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+# ---------------------------------------------------------------------------
+# Summary statistics
+# ---------------------------------------------------------------------------
+
+def get_stats(db):
+    """Return per-agent counters from the trigger-maintained summaries.
+
+    Reads only agent_stats and agent_summary, so the cost grows with the
+    number of agents, not with history.  Returns:
+        {"agents": {agent: {"tasks": {status: count}, "tasks_last_ts",
+                            "activity_count", "last_activity_ts",
+                            "report_count", "last_report_ts",
+                            "last_report_status"}},
+         "totals": {"tasks": {status: count}, "open": n, "closed": n}}
+    "open" counts ACTIVE_TASK_STATUSES; "closed" everything else.
+    """
+    agents = {}
+    totals = {}
+
+    def agent_entry(agent):
+        return agents.setdefault(agent, {
+            "tasks": {},
+            "tasks_last_ts": None,
+            "activity_count": 0,
+            "last_activity_ts": None,
+            "report_count": 0,
+            "last_report_ts": None,
+            "last_report_status": None,
+        })
+
+    for row in db.execute(
+        "SELECT agent, status, count, last_ts FROM agent_stats"
+        " WHERE count > 0 ORDER BY agent, status"
+    ):
+        entry = agent_entry(row["agent"])
+        entry["tasks"][row["status"]] = row["count"]
+        if row["last_ts"] and (entry["tasks_last_ts"] or "") < row["last_ts"]:
+            entry["tasks_last_ts"] = row["last_ts"]
+        totals[row["status"]] = totals.get(row["status"], 0) + row["count"]
+
+    for row in db.execute("SELECT * FROM agent_summary ORDER BY agent"):
+        if not (row["activity_count"] or row["report_count"]):
+            continue
+        entry = agent_entry(row["agent"])
+        for key in ("activity_count", "last_activity_ts", "report_count",
+                    "last_report_ts", "last_report_status"):
+            entry[key] = row[key]
+
+    open_count = sum(n for s, n in totals.items()
+                     if s in ACTIVE_TASK_STATUSES)
+    return {
+        "agents": agents,
+        "totals": {
+            "tasks": totals,
+            "open": open_count,
+            "closed": sum(totals.values()) - open_count,
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Change data capture
+# ---------------------------------------------------------------------------
+
+def get_changes_since(db, seq, limit=500):
+    """Return up to *limit* changelog entries with seq greater than *seq*.
+
+    Each entry is {"seq", "tbl", "op", "row_key", "ts"}, oldest first.
+    op is "insert", "update" or "delete"; row_key identifies the row as
+    listed in CHANGELOG_KEYS (reports use "wid:task_id").
+    """
+    rows = db.execute(
+        "SELECT seq, tbl, op, row_key, ts FROM changelog"
+        " WHERE seq > ? ORDER BY seq ASC LIMIT ?",
+        (int(seq), int(limit)),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_changelog_range(db):
+    """Return (oldest_seq, newest_seq) in the changelog; (0, 0) if empty.
+
+    A consumer whose cursor is below oldest_seq - 1 has missed pruned
+    entries and must resynchronize from the base tables.
+    """
+    # Two subqueries: each is a single b-tree probe, while MIN() and MAX()
+    # in one SELECT make SQLite scan the whole table.
+    row = db.execute(
+        "SELECT (SELECT MIN(seq) FROM changelog),"
+        " (SELECT MAX(seq) FROM changelog)"
+    ).fetchone()
+    return (row[0] or 0, row[1] or 0)
+
+
+# ---------------------------------------------------------------------------
+# Full-text search
+# ---------------------------------------------------------------------------
+
+# trigram tokens are 3 characters; shorter terms cannot use the index.
+SEARCH_MIN_TERM = 3
+
+# (fts table, base table, SELECT list, indexed columns) for each
+# searchable table.  "rank" is bm25() (lower is better); snippet() column
+# -1 picks the best matching column.  Terms shorter than SEARCH_MIN_TERM
+# are matched against the indexed columns of the base table with instr().
+_SEARCH_SOURCES = {
+    "activity": (
+        "activity_fts", "activity",
+        "b.id AS key, b.agent AS agent, b.ts AS ts, b.task_id AS task_id,"
+        " b.status AS status",
+        ("action",),
+    ),
+    "task": (
+        "tasks_fts", "tasks",
+        "b.task_id AS key, b.wid AS agent, b.ts AS ts,"
+        " b.task_id AS task_id, b.status AS status",
+        ("desc", "target_path"),
+    ),
+    "report": (
+        "reports_fts", "reports",
+        "b.wid || ':' || b.task_id AS key, b.wid AS agent, b.ts AS ts,"
+        " b.task_id AS task_id, b.status AS status",
+        ("result",),
+    ),
+}
+
+
+def _fts_query(text):
+    """Split free text into a safe FTS5 query and the shorter terms.
+
+    Returns (query, short_terms): query is the AND of the quoted terms of
+    at least SEARCH_MIN_TERM characters, short_terms the rest (the
+    trigram index cannot match them).  Raises ValueError if there is no
+    term of at least SEARCH_MIN_TERM characters.
+    """
+    terms = text.split()
+    long_terms = [t for t in terms if len(t) >= SEARCH_MIN_TERM]
+    if not long_terms:
+        raise ValueError(
+            f"At least one search term needs {SEARCH_MIN_TERM}+ characters"
+        )
+    query = " ".join('"' + t.replace('"', '""') + '"' for t in long_terms)
+    return query, [t for t in terms if len(t) < SEARCH_MIN_TERM]
+
+
+def search(db, text, limit=20, offset=0, sources=None, mark=("[[", "]]")):
+    """Ranked full-text search over activity, tasks and reports.
+
+    *sources* restricts the search to a subset of "activity", "task",
+    "report".  Matches are wrapped in *mark* inside a snippet of at most
+    24 tokens.  Returns {"results": [...], "has_more": bool}; each result
+    has source, key, agent, ts, task_id, status, snippet and rank.
+    Raises ValueError for unusable queries.
+    """
+    query, short_terms = _fts_query(text)
+    selects = []
+    params = []
+    for source in (sources or _SEARCH_SOURCES):
+        if source not in _SEARCH_SOURCES:
+            raise ValueError(f"Unknown search source: {source}")
+        fts, base, columns, indexed = _SEARCH_SOURCES[source]
+        # Case-insensitive (ASCII) like the trigram tokenizer.
+        short_sql = "".join(
+            " AND (" + " OR ".join(
+                f"instr(lower(coalesce(b.\"{col}\", '')), lower(?)) > 0"
+                for col in indexed) + ")"
+            for _ in short_terms
+        )
+        selects.append(
+            f"SELECT '{source}' AS source, {columns},"
+            f" snippet({fts}, -1, ?, ?, '…', 24) AS snippet,"
+            f" bm25({fts}) AS rank"
+            f" FROM {fts} JOIN {base} b ON b.rowid = {fts}.rowid"
+            f" WHERE {fts} MATCH ?{short_sql}"
+        )
+        params.extend([mark[0], mark[1], query])
+        for term in short_terms:
+            params.extend([term] * len(indexed))
+    sql = (" UNION ALL ".join(selects)
+           + " ORDER BY rank ASC, ts DESC LIMIT ? OFFSET ?")
+    params.extend([limit + 1, offset])
+    rows = [dict(row) for row in db.execute(sql, params).fetchall()]
+    return {"results": rows[:limit], "has_more": len(rows) > limit}
+
+
 def kv_get(db, key):
     """Get a value from the key-value store."""
     row = db.execute(
@@ -329,8 +1642,147 @@ def kv_get(db, key):
 def kv_set(db, key, value):
     """Set a value in the key-value store."""
     db.execute(
-        """INSERT OR REPLACE INTO kv_store (key, value, updated_at)
-           VALUES (?, ?, ?)""",
+        """INSERT INTO kv_store (key, value, updated_at)
+           VALUES (?, ?, ?)
+           ON CONFLICT(key) DO UPDATE SET
+               value = excluded.value, updated_at = excluded.updated_at""",
         (key, value, _now_iso()),
     )
-    db.commit()
+    _commit(db)
+
+
+# ---------------------------------------------------------------------------
+# Group commit (write-behind)
+# ---------------------------------------------------------------------------
+
+class GroupCommitWriter:
+    """Write-behind buffer that commits queued writes in groups.
+
+    submit() queues a single-row write (any of the upsert_* / insert_*
+    helpers above) and returns immediately.  A background thread applies
+    queued writes on its own connection inside one transaction() as soon
+    as *max_rows* are pending or the oldest pending write is
+    *max_delay_ms* old, so N writes cost one COMMIT instead of N.
+
+    Writes are durable only after flush() returns (or the group has been
+    committed); callers that need read-your-writes should call flush().
+    If a group fails, its writes are replayed one transaction each so
+    only the failing ones are dropped; flush() then returns False.
+
+    Usage:
+        writer = GroupCommitWriter(workspace_dir, max_rows=200, max_delay_ms=50)
+        writer.submit(insert_activity, {"agent": "kobito1", "action": "..."})
+        writer.flush()
+        writer.close()
+    """
+
+    def __init__(self, workspace_dir, max_rows=100, max_delay_ms=50):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000.0
+        self._conn = _connect(workspace_dir, check_same_thread=False)
+        self._cond = threading.Condition()
+        self._pending = []              # [(fn, entry)]
+        self._first_pending_at = None   # monotonic time of oldest pending
+        self._submitted = 0
+        self._committed = 0             # writes applied (or dropped on error)
+        self._last_failed = 0           # number of the last dropped write
+        self._flushed = 0               # writes covered by a finished flush()
+        self._closing = False
+        self._stats = {"groups": 0, "rows": 0, "errors": 0,
+                       "last_error": None}
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="db-group-commit",
+        )
+        self._thread.start()
+
+    def submit(self, fn, entry):
+        """Queue fn(db, entry) for the next group commit."""
+        with self._cond:
+            if self._closing:
+                raise sqlite3.ProgrammingError("GroupCommitWriter is closed")
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.append((fn, entry))
+            self._submitted += 1
+            if len(self._pending) >= self.max_rows:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until every write submitted so far has been committed.
+
+        Returns False if *timeout* expired first, or if one of the writes
+        submitted since the previous flush() failed and was dropped (see
+        stats()["last_error"]).
+        """
+        with self._cond:
+            target = self._submitted
+            self._first_pending_at = (
+                float("-inf") if self._pending else self._first_pending_at
+            )
+            self._cond.notify_all()
+            if not self._cond.wait_for(
+                    lambda: self._committed >= target, timeout):
+                return False
+            failed = self._flushed < self._last_failed <= target
+            self._flushed = max(self._flushed, target)
+            return not failed
+
+    def close(self):
+        """Flush pending writes, stop the thread and close the connection."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._conn.close()
+
+    def stats(self):
+        """Return a snapshot of group-commit counters."""
+        with self._cond:
+            data = dict(self._stats)
+            data["pending"] = len(self._pending)
+        return data
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        due = self._first_pending_at + self.max_delay
+                        remaining = due - time.monotonic()
+                        if (self._closing or remaining <= 0
+                                or len(self._pending) >= self.max_rows):
+                            break
+                        self._cond.wait(remaining)
+                    elif self._closing:
+                        return
+                    else:
+                        self._cond.wait()
+                batch = self._pending[:self.max_rows]
+                del self._pending[:self.max_rows]
+                if not self._pending:
+                    self._first_pending_at = None
+
+            failed = []                 # [(index in batch, error)]
+            try:
+                with transaction(self._conn):
+                    for fn, entry in batch:
+                        fn(self._conn, entry)
+            except Exception:
+                # The group was rolled back: replay it one write per
+                # transaction so only the failing writes are dropped.
+                for i, (fn, entry) in enumerate(batch):
+                    try:
+                        with transaction(self._conn):
+                            fn(self._conn, entry)
+                    except Exception as e:
+                        failed.append((i, e))
+
+            with self._cond:
+                if failed:
+                    self._last_failed = self._committed + failed[-1][0] + 1
+                    self._stats["errors"] += len(failed)
+                    self._stats["last_error"] = str(failed[-1][1])
+                self._committed += len(batch)
+                self._stats["groups"] += 1
+                self._stats["rows"] += len(batch) - len(failed)
+                self._cond.notify_all()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""Rakuen workspace file watcher.
+
+Watches the workspace root (dashboard.md, rakuen.db-wal), the YAML
+queue directories under <workspace>/queue and the pane logs under
+<workspace>/logs and reports changes as typed events:
+
+    "db"         rakuen.db / rakuen.db-wal written (any process)
+    "dashboard"  dashboard.md rewritten
+    "queue"      a queue/**.yaml file created, written, moved or deleted
+    "pane_log"   a logs/*.log file written (tmux pipe-pane output)
+
+On Linux the kernel's inotify API is used through ctypes, so an idle
+workspace costs no CPU and a change is reported within a few
+milliseconds.  Elsewhere (or when inotify is unavailable) the watcher
+falls back to stat()-polling the same files once per poll interval.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+KIND_DB = "db"
+KIND_DASHBOARD = "dashboard"
+KIND_QUEUE = "queue"
+KIND_PANE_LOG = "pane_log"
+
+_DB_FILES = ("rakuen.db", "rakuen.db-wal")
+_DASHBOARD_FILE = "dashboard.md"
+_QUEUE_DIR = "queue"
+_YAML_EXTS = (".yaml", ".yml")
+_LOGS_DIR = "logs"
+_LOG_EXT = ".log"
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+               | _IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+
+def classify(workspace_dir, path):
+    """Return the event kind for *path*, or None if it is not watched."""
+    rel = os.path.relpath(path, workspace_dir)
+    if rel in _DB_FILES:
+        return KIND_DB
+    if rel == _DASHBOARD_FILE:
+        return KIND_DASHBOARD
+    parts = rel.split(os.sep)
+    if len(parts) > 1 and parts[0] == _QUEUE_DIR \
+            and rel.endswith(_YAML_EXTS):
+        return KIND_QUEUE
+    if len(parts) == 2 and parts[0] == _LOGS_DIR and rel.endswith(_LOG_EXT):
+        return KIND_PANE_LOG
+    return None
+
+
+def _load_inotify():
+    """Return libc with the inotify functions, or None if unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32,
+        ]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class WorkspaceWatcher:
+    """Background watcher calling *on_change* with coalesced events.
+
+    on_change receives {kind: set(paths)} from the watcher thread.  Bursts
+    of events are coalesced for *debounce* seconds (at most *max_delay*),
+    so an agent rewriting a file in several writes causes one callback.
+
+    Usage:
+        watcher = WorkspaceWatcher(ws, on_change)
+        watcher.start()
+        ...
+        watcher.stop()
+    """
+
+    def __init__(self, workspace_dir, on_change, debounce=0.005,
+                 max_delay=0.05, poll_interval=1.0, use_inotify=True):
+        self.workspace_dir = os.path.abspath(workspace_dir)
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._libc = _load_inotify() if use_inotify else None
+        self.backend = "inotify" if self._libc else "polling"
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake_r = self._wake_w = None
+        self._fd = None
+        self._wd_paths = {}      # wd -> directory
+        self._events = 0
+        self._callbacks = 0
+        self._overflows = 0
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self):
+        """Start the watcher thread (inotify, or polling as a fallback)."""
+        if self._libc:
+            try:
+                self._open_inotify()
+            except OSError:
+                self._libc = None
+                self.backend = "polling"
+        target = self._run_inotify if self._libc else self._run_polling
+        self._thread = threading.Thread(
+            target=target, daemon=True, name="fswatch",
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread and release the inotify descriptor."""
+        self._stop.set()
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"x")
+            except OSError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=2)
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._fd = self._wake_r = self._wake_w = None
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        return {
+            "backend": self.backend,
+            "watches": len(self._wd_paths),
+            "events": self._events,
+            "callbacks": self._callbacks,
+            "overflows": self._overflows,
+        }
+
+    # -- dispatch -----------------------------------------------------------
+
+    def _dispatch(self, changes):
+        if not changes:
+            return
+        self._callbacks += 1
+        try:
+            self.on_change(changes)
+        except Exception:
+            pass
+
+    def _all_kinds(self):
+        """Changes to report when events may have been lost."""
+        return {
+            KIND_DB: {os.path.join(self.workspace_dir, _DB_FILES[1])},
+            KIND_DASHBOARD: {os.path.join(self.workspace_dir,
+                                          _DASHBOARD_FILE)},
+            KIND_QUEUE: {os.path.join(self.workspace_dir, _QUEUE_DIR)},
+            KIND_PANE_LOG: {os.path.join(self.workspace_dir, _LOGS_DIR)},
+        }
+
+    # -- inotify backend ----------------------------------------------------
+
+    def _open_inotify(self):
+        fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._wake_r, self._wake_w = os.pipe()
+        self._add_watch(self.workspace_dir)
+        self._add_tree(os.path.join(self.workspace_dir, _QUEUE_DIR))
+        self._add_watch(os.path.join(self.workspace_dir, _LOGS_DIR))
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), _WATCH_MASK,
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, os.strerror(err), path)
+        self._wd_paths[wd] = path
+
+    def _add_tree(self, root):
+        """Watch *root* and every directory below it (if it exists)."""
+        for dirpath, _dirs, _files in os.walk(root):
+            self._add_watch(dirpath)
+
+    def _read_events(self, changes):
+        """Drain the inotify fd into *changes*. Returns False on EOF."""
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            self._events += 1
+
+            if mask & _IN_Q_OVERFLOW:
+                self._overflows += 1
+                for kind, paths in self._all_kinds().items():
+                    changes.setdefault(kind, set()).update(paths)
+                continue
+            if mask & _IN_IGNORED:
+                self._wd_paths.pop(wd, None)
+                continue
+            base = self._wd_paths.get(wd)
+            if base is None:
+                continue
+            path = os.path.join(base, os.fsdecode(name)) if name else base
+
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # queue/ (or a subdirectory) appeared: watch it and report
+                # the files that may already have been written into it.
+                if classify(self.workspace_dir,
+                            os.path.join(path, "x.yaml")) == KIND_QUEUE:
+                    try:
+                        self._add_tree(path)
+                    except OSError:
+                        pass   # e.g. max_user_watches reached
+                    changes.setdefault(KIND_QUEUE, set()).add(path)
+                continue
+            kind = classify(self.workspace_dir, path)
+            if kind:
+                changes.setdefault(kind, set()).add(path)
+        return True
+
+    def _run_inotify(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        poller.register(self._wake_r, select.POLLIN)
+        while not self._stop.is_set():
+            try:
+                ready = poller.poll()          # blocks: no CPU while idle
+            except InterruptedError:
+                continue
+            if self._stop.is_set():
+                break
+            if not any(fd == self._fd for fd, _ in ready):
+                continue
+            changes = {}
+            if not self._read_events(changes):
+                break
+            # Coalesce the rest of the burst.
+            deadline = time.monotonic() + self.max_delay
+            while True:
+                timeout = min(self.debounce, deadline - time.monotonic())
+                if timeout <= 0 or not poller.poll(timeout * 1000):
+                    break
+                if self._stop.is_set() or not self._read_events(changes):
+                    break
+            self._dispatch(changes)
+
+    # -- polling backend ----------------------------------------------------
+
+    def _snapshot(self):
+        """Return {path: (mtime_ns, size)} for every watched file."""
+        snap = {}
+        for name in _DB_FILES + (_DASHBOARD_FILE,):
+            path = os.path.join(self.workspace_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snap[path] = (st.st_mtime_ns, st.st_size)
+        queue_dir = os.path.join(self.workspace_dir, _QUEUE_DIR)
+        for dirpath, _dirs, files in os.walk(queue_dir):
+            for name in files:
+                if not name.endswith(_YAML_EXTS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snap[path] = (st.st_mtime_ns, st.st_size)
+        logs_dir = os.path.join(self.workspace_dir, _LOGS_DIR)
+        try:
+            names = os.listdir(logs_dir)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(_LOG_EXT):
+                continue
+            path = os.path.join(logs_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snap[path] = (st.st_mtime_ns, st.st_size)
+        return snap
+
+    def _run_polling(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            changes = {}
+            for path in set(previous) | set(current):
+                if previous.get(path) != current.get(path):
+                    self._events += 1
+                    kind = classify(self.workspace_dir, path)
+                    if kind:
+                        changes.setdefault(kind, set()).add(path)
+            previous = current
+            self._dispatch(changes)
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""Rakuen YAML queue -> SQLite ingestion.
+
+Maps the YAML queue files agents write under <workspace>/queue to rows
+of rakuen.db:
+
+    user_to_uichan.yaml     -> user_inputs
+    uichan_to_aichan.yaml   -> commands
+    tasks/<wid>.yaml        -> tasks    (wid defaults to the file name)
+    reports/*.yaml          -> reports
+    activity/<agent>.yaml   -> activity (agent defaults to the file name)
+
+Every table is written with its upsert (ON CONFLICT DO UPDATE ... WHERE
+changed), so re-reading a file is idempotent and unchanged items cost no
+write.  YamlIngester remembers each file's (st_mtime_ns, st_size) and
+re-parses only files that changed, writing one transaction per batch.
+If the batch fails, its files are written one transaction each; a file
+that still cannot be written is logged and skipped until it changes.
+It runs as a thread of the Web UI (settings.yaml database.ingest_yaml)
+or in the foreground via ``migrate_yaml_to_db.py --follow``.
+
+Items removed from a YAML file are not deleted from the database.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from db import (
+    get_db,
+    insert_activity_many,
+    transaction,
+    upsert_command,
+    upsert_report,
+    upsert_tasks_many,
+    upsert_user_input,
+)
+from yaml_loader import extract_items
+
+
+INGEST_RESCAN_INTERVAL = 60   # seconds between full rescans (safety net)
+
+# Tables in the order they are written within a batch.
+TABLES = ("user_inputs", "commands", "tasks", "reports", "activity")
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def parse_yaml_file(filepath):
+    """Parse a YAML file and return a flat list of dicts."""
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return extract_items(f.read())
+    except (OSError, UnicodeDecodeError):
+        return []
+
+
+# ---------------------------------------------------------------------------
+# Item -> row mapping
+# ---------------------------------------------------------------------------
+
+def _scalar(value):
+    """Return *value* as something SQLite can bind.
+
+    Mappings and lists (e.g. a structured ``result:``) are stored as
+    JSON, other non-scalar values (dates, ...) as str().
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def _queue_row(item, _default):
+    """user_inputs / commands share one shape."""
+    entry = {
+        "id": item.get("id", ""),
+        "ts": item.get("timestamp", ""),
+        "command": item.get("command", ""),
+        "project": item.get("project"),
+        "priority": item.get("priority", "medium"),
+        "status": item.get("status", "pending"),
+    }
+    entry = {k: _scalar(v) for k, v in entry.items()}
+    return entry if entry["id"] and entry["ts"] else None
+
+
+def _task_row(item, wid):
+    entry = {
+        "task_id": item.get("task_id", ""),
+        "parent_cmd": item.get("parent_cmd"),
+        "wid": item.get("worker_id", wid),
+        "desc": item.get("description", ""),
+        "target_path": item.get("target_path"),
+        "status": item.get("status", "idle"),
+        "ts": item.get("timestamp", ""),
+    }
+    entry = {k: _scalar(v) for k, v in entry.items()}
+    return entry if entry["task_id"] else None
+
+
+def _report_row(item, _default):
+    entry = {
+        "wid": item.get("worker_id", ""),
+        "task_id": item.get("task_id", ""),
+        "ts": item.get("timestamp", ""),
+        "status": item.get("status", "idle"),
+        "result": item.get("result"),
+        "sc": item.get("skill_candidate"),
+    }
+    entry = {k: _scalar(v) for k, v in entry.items()}
+    return entry if entry["wid"] else None
+
+
+def _activity_row(item, agent):
+    entry = {
+        "id": item.get("id", ""),
+        "agent": item.get("agent", agent),
+        "ts": item.get("timestamp", ""),
+        "action": item.get("action", ""),
+        "status": item.get("status"),
+        "task_id": item.get("task_id"),
+    }
+    entry = {k: _scalar(v) for k, v in entry.items()}
+    return entry if entry["id"] and entry["ts"] else None
+
+
+_ROW_BUILDERS = {
+    "user_inputs": _queue_row,
+    "commands": _queue_row,
+    "tasks": _task_row,
+    "reports": _report_row,
+    "activity": _activity_row,
+}
+
+
+def queue_target(queue_dir, path):
+    """Return (table, default) for a queue file, or None if not ingested.
+
+    *default* is the worker id (tasks) or agent (activity) taken from the
+    file name.
+    """
+    rel = os.path.relpath(path, queue_dir)
+    if not rel.endswith(".yaml"):
+        return None
+    if rel == "user_to_uichan.yaml":
+        return "user_inputs", None
+    if rel == "uichan_to_aichan.yaml":
+        return "commands", None
+    subdir, sep, fname = rel.partition(os.sep)
+    if not sep or os.sep in fname:
+        return None
+    name = fname[:-len(".yaml")]
+    if subdir == "tasks":
+        return "tasks", name
+    if subdir == "reports":
+        return "reports", None
+    if subdir == "activity":
+        return "activity", name
+    return None
+
+
+def list_queue_files(queue_dir):
+    """Return every ingestible queue file, sorted."""
+    paths = []
+    for name in ("user_to_uichan.yaml", "uichan_to_aichan.yaml"):
+        paths.append(os.path.join(queue_dir, name))
+    for subdir in ("tasks", "reports", "activity"):
+        directory = os.path.join(queue_dir, subdir)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        paths.extend(os.path.join(directory, n) for n in names
+                     if n.endswith(".yaml"))
+    return [p for p in paths if os.path.isfile(p)]
+
+
+def _file_rows(queue_dir, path):
+    """Return {table: [row]} for the items of one queue file."""
+    rows = {table: [] for table in TABLES}
+    target = queue_target(queue_dir, path)
+    if target is None:
+        return rows
+    table, default = target
+    build = _ROW_BUILDERS[table]
+    for item in parse_yaml_file(path):
+        entry = build(item, default)
+        if entry is not None:
+            rows[table].append(entry)
+    return rows
+
+
+def _write_rows(db, rows):
+    """Upsert {table: [row]} in one transaction."""
+    with transaction(db):
+        for entry in rows["user_inputs"]:
+            upsert_user_input(db, entry)
+        for entry in rows["commands"]:
+            upsert_command(db, entry)
+        upsert_tasks_many(db, rows["tasks"])
+        for entry in rows["reports"]:
+            upsert_report(db, entry)
+        insert_activity_many(db, rows["activity"])
+
+
+def ingest_files(db, queue_dir, paths):
+    """Upsert the items of queue files *paths*.
+
+    All files are written in one transaction.  If that fails because of
+    their contents, each file is written in its own transaction so one
+    bad file does not hold back the others.  sqlite3.OperationalError
+    (database locked, disk I/O) is raised: the batch should be retried.
+
+    Returns ({table: items_written}, [(path, error)]) where the list
+    holds the files that could not be written.
+    """
+    files = []
+    failed = []
+    for path in paths:
+        try:
+            files.append((path, _file_rows(queue_dir, path)))
+        except Exception as e:
+            failed.append((path, e))
+
+    rows = {table: [] for table in TABLES}
+    for _path, file_rows in files:
+        for table in TABLES:
+            rows[table].extend(file_rows[table])
+    try:
+        _write_rows(db, rows)
+        return {table: len(entries) for table, entries in rows.items()}, failed
+    except sqlite3.OperationalError:
+        raise
+    except (sqlite3.Error, ValueError, TypeError):
+        pass
+
+    counts = dict.fromkeys(TABLES, 0)
+    for path, file_rows in files:
+        try:
+            _write_rows(db, file_rows)
+        except sqlite3.OperationalError:
+            raise
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            failed.append((path, e))
+            continue
+        for table in TABLES:
+            counts[table] += len(file_rows[table])
+    return counts, failed
+
+
+# ---------------------------------------------------------------------------
+# Continuous ingestion
+# ---------------------------------------------------------------------------
+
+class YamlIngester:
+    """Tail the queue YAML files into SQLite.
+
+    notify() (typically fed by fswatch.WorkspaceWatcher queue events)
+    wakes the loop for the given paths; every *interval* seconds all queue
+    files are stat()ed as a safety net.  Only files whose signature
+    changed since they were last ingested are parsed.
+
+    Usage:
+        ingester = YamlIngester(ws)
+        ingester.start()                 # background thread
+        ingester.notify(changed_paths)
+        ...
+        ingester.stop()
+    """
+
+    def __init__(self, workspace_dir, interval=INGEST_RESCAN_INTERVAL):
+        self.workspace_dir = workspace_dir
+        self.queue_dir = os.path.join(workspace_dir, "queue")
+        self.interval = interval
+        self._sigs = {}            # path -> (st_mtime_ns, st_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._scans = 0
+        self._files = 0
+        self._rows = dict.fromkeys(TABLES, 0)
+        self._errors = 0
+        self._last_error = None
+
+    # -- scanning -----------------------------------------------------------
+
+    def _changed(self, paths):
+        """Return [(path, sig)] of *paths* that changed since ingestion."""
+        changed = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._sigs.pop(path, None)
+                continue
+            sig = (st.st_mtime_ns, st.st_size)
+            if self._sigs.get(path) != sig:
+                changed.append((path, sig))
+        return changed
+
+    def scan(self, db, paths=None, on_error=None):
+        """Ingest changed queue files; all of them when *paths* is None.
+
+        Directories in *paths* (e.g. a newly created queue/ subdirectory)
+        trigger a full scan.  A file that cannot be written is counted as
+        an error, passed to *on_error* ("<path>: <error>") and skipped
+        until it changes again.  Returns {table: items_written} ({} when
+        nothing changed).
+        """
+        if paths is None or any(os.path.isdir(p) for p in paths):
+            candidates = list_queue_files(self.queue_dir)
+        else:
+            candidates = sorted(
+                p for p in paths
+                if queue_target(self.queue_dir, p) is not None
+            )
+        changed = self._changed(candidates)
+        if not changed:
+            return {}
+        counts, failed = ingest_files(db, self.queue_dir,
+                                      [p for p, _ in changed])
+        # Signatures are recorded after the commit: a batch that raised is
+        # retried by the next scan.  Files that failed on their own keep
+        # their signature too, so they are not retried until rewritten.
+        for path, e in failed:
+            self._errors += 1
+            self._last_error = f"{path}: {e}"
+            if on_error:
+                on_error(self._last_error)
+        for path, sig in changed:
+            self._sigs[path] = sig
+        self._scans += 1
+        self._files += len(changed) - len(failed)
+        for table, n in counts.items():
+            self._rows[table] += n
+        return counts
+
+    # -- loop ---------------------------------------------------------------
+
+    def notify(self, paths):
+        """Queue *paths* (changed queue files or directories) for ingestion."""
+        if not paths:
+            return
+        with self._lock:
+            self._pending.update(paths)
+        self._wake.set()
+
+    def run(self, report=None):
+        """Ingest until stop() is called.
+
+        *report*, if given, is called with {"files", "rows"} after every
+        batch that wrote something and with {"error"} on failure (of the
+        batch, or of one file that is then skipped).
+        """
+        on_error = (lambda error: report({"error": error})) if report else None
+        db = get_db(self.workspace_dir)
+        try:
+            paths = None               # first pass: everything
+            while not self._stop.is_set():
+                try:
+                    files = self._files
+                    counts = self.scan(db, paths, on_error)
+                    if counts and report:
+                        report({"files": self._files - files, "rows": counts})
+                except Exception as e:
+                    self._errors += 1
+                    self._last_error = str(e)
+                    if report:
+                        report({"error": str(e)})
+                    if paths is not None:
+                        self.notify(paths)     # retry this batch (database)
+                        self._stop.wait(1.0)
+                woke = self._wake.wait(self.interval)
+                self._wake.clear()
+                with self._lock:
+                    pending, self._pending = self._pending, set()
+                paths = pending if woke else None
+        finally:
+            db.close()
+
+    def start(self, report=None):
+        """Run the ingestion loop in a daemon thread."""
+        self._thread = threading.Thread(
+            target=self.run, args=(report,), daemon=True, name="yaml-ingest",
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the ingestion loop."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        return {
+            "files_tracked": len(self._sigs),
+            "batches": self._scans,
+            "files_ingested": self._files,
+            "rows": dict(self._rows),
+            "errors": self._errors,
+            "last_error": self._last_error,
+        }
@@ -0,0 +1,778 @@
+#!/usr/bin/env python3
+"""Rakuen in-memory pane buffers fed by tmux pipe-pane.
+
+rakuen-launch pipes every agent pane into <workspace>/logs/<agent>.log
+(``tmux pipe-pane -o "cat >> ..."``).  PaneStreams tails those files and
+replays the output into one PaneScreen per agent: a small terminal model
+-- the pane's screen plus a history ring capped by lines and bytes --
+that follows what interactive programs write (carriage returns, cursor
+movement, erase line / screen, insert / delete, autowrap, wide
+characters) and drops colors, titles and other escape sequences.
+PaneScreen.capture() returns the text ``tmux capture-pane -p -S -<lines>``
+would print, from memory.
+
+A pane is seeded from one capture-pane (with its cursor position) and
+re-seeded when it changes identity or size, when its log is truncated
+or falls too far behind, after a sequence the model does not implement
+(scroll regions, terminal reset, leaving the alternate screen), and
+every PANE_VERIFY_INTERVAL seconds as a safety net.  A pane without a
+pipe gets rakuen-launch's pipe-pane command.
+
+PaneStreams.capture() returns None while a pane is not streamed (no
+tmux session, no log file, alternate screen shown), and callers fall
+back to capturing the pane with tmux.
+
+Every change to a pane bumps its sequence number (seq), which starts
+from the current time in milliseconds so numbers handed out by an
+earlier server process are never reused.  PaneStreams.delta() answers
+"what changed since seq N": the history lines appended since then plus
+the current screen rows, or a reset (the full history) when N is
+unknown, the history was cleared (``ESC [3J``) or the pane was
+re-seeded with different contents.  The last PANE_SEQ_MARKS seqs of a
+pane are remembered.
+"""
+
+import codecs
+import collections
+import itertools
+import os
+import re
+import shlex
+import threading
+import time
+import unicodedata
+
+
+PANE_HISTORY_LINES = 1000       # history rows kept per pane
+PANE_HISTORY_BYTES = 512 * 1024  # history bytes kept per pane (UTF-8)
+PANE_POLL_INTERVAL = 1.0        # seconds between log stat()s without events
+PANE_CHECK_INTERVAL = 5         # seconds between tmux pane checks
+PANE_RESEED_DELAY = 1.0         # minimum seconds between re-seed attempts
+PANE_VERIFY_INTERVAL = 60       # seconds between re-seeds of a live pane
+PANE_READ_CHUNK = 256 * 1024    # bytes read from a log at a time
+PANE_RESYNC_BYTES = 1024 * 1024  # a larger backlog is re-seeded, not replayed
+PANE_SEQ_MARKS = 1024           # seqs per pane a delta can start from
+PANE_PUSH_INTERVAL = 0.5        # minimum seconds between on_update calls
+
+_PANE_FORMAT = ("#{session_name}:#{window_index}.#{pane_index}"
+                " #{pane_id} #{pane_pipe} #{pane_width} #{pane_height}")
+_CURSOR_FORMAT = ("#{pane_width} #{pane_height} #{cursor_x} #{cursor_y}"
+                  " #{alternate_on}")
+
+_CONTROL = re.compile("[\x00-\x1f\x7f-\x9f]")
+_ESC_SEQ = re.compile(
+    r"\x1b(?:"
+    r"\[(?P<params>[0-?]*)[ -/]*(?P<final>[@-~])"   # CSI
+    r"|\][^\x07\x1b]*(?:\x07|\x1b\\)"               # OSC (title, link)
+    r"|[PX^_][^\x1b]*\x1b\\"                        # DCS / SOS / PM / APC
+    r"|[()*+\-./#][\s\S]"                           # charsets, DEC tests
+    r"|(?P<esc>[^\[\]PX^_()*+\-./#])"               # two-character escapes
+    r")"
+)
+# A prefix of an escape sequence cut at the end of a read.
+_ESC_PARTIAL = re.compile(
+    r"\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*\x1b?|[PX^_][^\x1b]*\x1b?"
+    r"|[()*+\-./#])?\Z"
+)
+_MAX_PARTIAL = 4096
+_ALT_SCREEN_MODES = {"47", "1047", "1049"}
+
+
+def _char_width(ch):
+    """Columns taken by *ch* (as tmux's wcwidth: 0, 1 or 2)."""
+    if ch < "\u0300":
+        return 1
+    if unicodedata.combining(ch) or unicodedata.category(ch) in ("Mn", "Me",
+                                                                  "Cf"):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+
+
+def _cells(text):
+    """Split a captured row into cells ("" is the right half of a wide char)."""
+    cells = []
+    for ch in text:
+        width = _char_width(ch)
+        if width == 0 and cells:
+            cells[-1] += ch
+        else:
+            cells.append(ch)
+            if width == 2:
+                cells.append("")
+    return cells
+
+
+def _fix_wide(row):
+    """Blank the halves of wide characters split by a shift or erase."""
+    for i, cell in enumerate(row):
+        if cell == "":
+            if i == 0 or row[i - 1] in ("", " ") or _char_width(
+                    row[i - 1][0]) != 2:
+                row[i] = " "
+        elif cell != " " and _char_width(cell[0]) == 2 and (
+                i + 1 >= len(row) or row[i + 1] != ""):
+            row[i] = " "
+
+
+def _row_text(cells):
+    return "".join(cells).rstrip(" ")
+
+
+class PaneScreen:
+    """Screen and history of one pane, updated from its output bytes."""
+
+    def __init__(self, width, height, history_lines=PANE_HISTORY_LINES,
+                 history_bytes=PANE_HISTORY_BYTES):
+        self.width = max(1, width)
+        self.height = max(1, height)
+        self.history_lines = history_lines
+        self.history_bytes = history_bytes
+        self.history = collections.deque()
+        self._bytes = 0
+        self.pushed = 0               # lines ever added to the history
+        self.cleared = 0              # history clears (ESC [3J)
+        self.rows = [[] for _ in range(self.height)]
+        # x == width: the last column was written and the next printable
+        # character wraps (as tmux keeps its cursor).
+        self.x = self.y = 0
+        self._saved = (0, 0)
+        self.alternate = False        # alternate screen shown: not modeled
+        self.needs_sync = False       # state diverged: re-seed from tmux
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._partial = ""
+
+    # -- seeding / output ---------------------------------------------------
+
+    def seed(self, text, cursor_x, cursor_y, alternate=False):
+        """Replace the contents with a capture-pane of this pane."""
+        lines = text.split("\n")
+        if text.endswith("\n"):
+            lines.pop()
+        screen = lines[-self.height:] if len(lines) >= self.height else (
+            lines + [""] * (self.height - len(lines)))
+        self.history.clear()
+        self._bytes = 0
+        for line in lines[:max(0, len(lines) - self.height)]:
+            self._push_history(line)
+        self.rows = [_cells(line) for line in screen]
+        self.x = min(max(0, cursor_x), self.width - 1)
+        self.y = min(max(0, cursor_y), self.height - 1)
+        self._saved = (0, 0)
+        self.alternate = alternate
+        self.needs_sync = False
+        self._decoder.reset()
+        self._partial = ""
+
+    def capture(self, lines):
+        """Return the last *lines* history rows and the screen, like tmux."""
+        rows = itertools.chain(self.history_tail(lines), self.screen_rows())
+        return "".join(row + "\n" for row in rows)
+
+    def history_tail(self, lines):
+        """Return the last *lines* history rows (list of str)."""
+        start = max(0, len(self.history) - lines)
+        return list(itertools.islice(self.history, start, None))
+
+    def screen_rows(self):
+        """Return the screen rows (list of str, trailing blanks stripped)."""
+        return [_row_text(row) for row in self.rows]
+
+    def feed(self, data):
+        """Apply pane output *data* (bytes)."""
+        text = self._partial + self._decoder.decode(data)
+        self._partial = ""
+        pos, end = 0, len(text)
+        while pos < end:
+            m = _CONTROL.search(text, pos)
+            stop = m.start() if m else end
+            if stop > pos:
+                if not self.alternate:
+                    self._put_text(text[pos:stop])
+                pos = stop
+                if m is None:
+                    break
+            ch = text[pos]
+            if ch != "\x1b":
+                if not self.alternate:
+                    self._control(ch)
+                pos += 1
+                continue
+            seq = _ESC_SEQ.match(text, pos)
+            if seq is None:
+                if (end - pos < _MAX_PARTIAL
+                        and _ESC_PARTIAL.match(text, pos)):
+                    self._partial = text[pos:]
+                    break
+                pos += 1              # malformed: drop the ESC
+                continue
+            if seq.group("final"):
+                self._csi(seq.group("params"), seq.group("final"))
+            elif seq.group("esc") and not self.alternate:
+                self._escape(seq.group("esc"))
+            pos = seq.end()
+
+    # -- history ------------------------------------------------------------
+
+    def _push_history(self, line):
+        self.history.append(line)
+        self.pushed += 1
+        self._bytes += len(line.encode("utf-8")) + 1
+        while self.history and (len(self.history) > self.history_lines
+                                or self._bytes > self.history_bytes):
+            old = self.history.popleft()
+            self._bytes -= len(old.encode("utf-8")) + 1
+
+    # -- text ---------------------------------------------------------------
+
+    def _row(self):
+        row = self.rows[self.y]
+        if len(row) < self.x:
+            row.extend(" " * (self.x - len(row)))
+        return row
+
+    def _put_text(self, text):
+        if text.isascii():
+            while text:
+                if self.x >= self.width:
+                    self._newline_wrap()
+                n = min(len(text), self.width - self.x)
+                self._overwrite(list(text[:n]))
+                text = text[n:]
+            return
+        for ch in text:
+            width = _char_width(ch)
+            if width == 0:
+                row = self.rows[self.y]
+                col = min(self.x, self.width) - 1
+                if 0 <= col < len(row):
+                    row[col] += ch
+                continue
+            if self.x + width > self.width:
+                self._newline_wrap()
+            self._overwrite([ch, ""] if width == 2 else [ch])
+
+    def _overwrite(self, cells):
+        """Write *cells* at the cursor (they fit before the right margin)."""
+        row = self._row()
+        x, n = self.x, len(cells)
+        if x < len(row) and row[x] == "" and x > 0:
+            row[x - 1] = " "          # overwrote half of a wide character
+        if x + n < len(row) and row[x + n] == "":
+            row[x + n] = " "
+        row[x:x + n] = cells
+        self.x = x + n
+
+    def _newline_wrap(self):
+        self.x = 0
+        self._linefeed()
+
+    # -- control characters -------------------------------------------------
+
+    def _linefeed(self):
+        if self.y == self.height - 1:
+            self._scroll_up(1)
+        else:
+            self.y += 1
+
+    def _scroll_up(self, n):
+        for _ in range(min(n, self.height)):
+            self._push_history(_row_text(self.rows.pop(0)))
+            self.rows.append([])
+
+    def _control(self, ch):
+        if ch == "\r":
+            self.x = 0
+        elif ch in "\n\x0b\x0c":
+            self._linefeed()
+        elif ch == "\b":
+            if self.x > 0:
+                self.x = min(self.x, self.width) - 1
+        elif ch == "\t":
+            if self.x < self.width - 1:
+                self.x = min(self.width - 1, (self.x // 8 + 1) * 8)
+        # BEL, SO / SI, NUL and C1 controls change nothing visible.
+
+    def _escape(self, ch):
+        if ch == "7":
+            self._saved = (self.x, self.y)
+        elif ch == "8":
+            self.x, self.y = self._saved
+        elif ch == "D":
+            self._linefeed()
+        elif ch == "E":
+            self.x = 0
+            self._linefeed()
+        elif ch == "M":               # reverse index
+            if self.y == 0:
+                self.rows.insert(0, [])
+                self.rows.pop()
+            else:
+                self.y -= 1
+        elif ch == "c":               # full reset
+            self.needs_sync = True
+
+    # -- CSI ----------------------------------------------------------------
+
+    def _csi(self, params, final):
+        if params.startswith(("?", ">", "<", "=")):
+            if params[0] == "?" and final in "hl":
+                modes = set(params[1:].split(";"))
+                if modes & _ALT_SCREEN_MODES:
+                    if final == "l" and self.alternate:
+                        self.needs_sync = True
+                    self.alternate = final == "h"
+            return
+        if self.alternate:
+            return
+        args = [int(p) if p.isdigit() else 0
+                for p in params.split(";")] if params else []
+
+        def arg(i=0, default=1):
+            value = args[i] if i < len(args) else 0
+            return value or default
+
+        handler = self._CSI.get(final)
+        if handler is not None:
+            handler(self, args, arg)
+
+    def _cursor_up(self, _args, arg):
+        self.y = max(0, self.y - arg())
+
+    def _cursor_down(self, _args, arg):
+        self.y = min(self.height - 1, self.y + arg())
+
+    def _cursor_right(self, _args, arg):
+        self.x = min(self.width - 1, self.x + arg())
+
+    def _cursor_left(self, _args, arg):
+        self.x = max(0, min(self.x, self.width) - arg())
+
+    def _next_line(self, _args, arg):
+        self.x = 0
+        self._cursor_down(_args, arg)
+
+    def _prev_line(self, _args, arg):
+        self.x = 0
+        self._cursor_up(_args, arg)
+
+    def _column(self, _args, arg):
+        self.x = min(self.width - 1, arg() - 1)
+
+    def _line(self, _args, arg):
+        self.y = min(self.height - 1, arg() - 1)
+
+    def _position(self, _args, arg):
+        self.y = min(self.height - 1, arg(0) - 1)
+        self.x = min(self.width - 1, arg(1) - 1)
+
+    def _erase_display(self, args, _arg):
+        mode = args[0] if args else 0
+        if mode == 0:
+            self._erase_line([0], None)
+            for i in range(self.y + 1, self.height):
+                self.rows[i] = []
+        elif mode == 1:
+            for i in range(self.y):
+                self.rows[i] = []
+            self._erase_line([1], None)
+        elif mode == 2:
+            # tmux (scroll-on-clear) keeps the cleared lines as history.
+            used = [i for i, row in enumerate(self.rows) if _row_text(row)]
+            if used:
+                for row in self.rows[:used[-1] + 1]:
+                    self._push_history(_row_text(row))
+            self.rows = [[] for _ in range(self.height)]
+        elif mode == 3:
+            self.history.clear()
+            self._bytes = 0
+            self.cleared += 1
+
+    def _erase_line(self, args, _arg):
+        mode = args[0] if args else 0
+        row = self.rows[self.y]
+        x = self.x
+        if mode == 0:
+            if 0 < x < len(row) and row[x] == "":
+                row[x - 1] = " "
+            del row[x:]
+        elif mode == 1:
+            n = min(x + 1, len(row))
+            row[:n] = [" "] * n
+            if n < len(row) and row[n] == "":
+                row[n] = " "
+        elif mode == 2:
+            self.rows[self.y] = []
+
+    def _erase_chars(self, _args, arg):
+        row = self._row()
+        n = min(arg(), len(row) - self.x)
+        if n > 0:
+            row[self.x:self.x + n] = [" "] * n
+            _fix_wide(row)
+
+    def _delete_chars(self, _args, arg):
+        row = self.rows[self.y]
+        del row[self.x:self.x + arg()]
+        _fix_wide(row)
+
+    def _insert_chars(self, _args, arg):
+        row = self.rows[self.y]
+        if self.x < len(row):
+            row[self.x:self.x] = [" "] * arg()
+            cut = row[self.width:self.width + 1]
+            del row[self.width:]
+            if cut == [""]:
+                row.append("")        # tmux keeps a wide char cut at the margin
+            _fix_wide(row)
+
+    def _insert_lines(self, _args, arg):
+        for _ in range(min(arg(), self.height - self.y)):
+            self.rows.insert(self.y, [])
+            self.rows.pop()
+        self.x = 0
+
+    def _delete_lines(self, _args, arg):
+        for _ in range(min(arg(), self.height - self.y)):
+            del self.rows[self.y]
+            self.rows.append([])
+        self.x = 0
+
+    def _scroll_up_csi(self, _args, arg):
+        self._scroll_up(arg())
+
+    def _scroll_down_csi(self, _args, arg):
+        for _ in range(min(arg(), self.height)):
+            self.rows.insert(0, [])
+            self.rows.pop()
+
+    def _scroll_region(self, args, arg):
+        if args and (arg(0) != 1 or arg(1, self.height) < self.height):
+            self.needs_sync = True    # partial scroll regions: not modeled
+        self.x = self.y = 0
+
+    def _save_cursor(self, _args, _arg):
+        self._saved = (self.x, self.y)
+
+    def _restore_cursor(self, _args, _arg):
+        self.x, self.y = self._saved
+
+    _CSI = {
+        "A": _cursor_up, "B": _cursor_down, "e": _cursor_down,
+        "C": _cursor_right, "a": _cursor_right, "D": _cursor_left,
+        "E": _next_line, "F": _prev_line, "G": _column, "`": _column,
+        "d": _line, "H": _position, "f": _position,
+        "J": _erase_display, "K": _erase_line, "X": _erase_chars,
+        "P": _delete_chars, "@": _insert_chars,
+        "L": _insert_lines, "M": _delete_lines,
+        "S": _scroll_up_csi, "T": _scroll_down_csi,
+        "r": _scroll_region, "s": _save_cursor, "u": _restore_cursor,
+    }
+
+
+class _Pane:
+    """Streaming state of one agent pane."""
+
+    def __init__(self, agent, target, path):
+        self.agent = agent
+        self.target = target
+        self.path = path
+        self.screen = None            # PaneScreen once seeded
+        self.offset = 0               # log bytes already applied
+        self.pane_id = None
+        self.size = None              # (width, height) from tmux
+        self.live = False             # pane exists and is piped
+        self.seeded_at = 0.0
+        self.seq = int(time.time() * 1000)
+        self.epoch = 0                # bumped when the screen is replaced
+        self.marks = {}               # seq -> (epoch, cleared, pushed)
+        self.pushed_seq = self.seq    # last seq passed to on_update
+
+    def advance(self):
+        """Give the current contents a new seq (caller holds the lock)."""
+        self.seq += 1
+        screen = self.screen
+        self.marks[self.seq] = (self.epoch, screen.cleared, screen.pushed)
+        if len(self.marks) > PANE_SEQ_MARKS:
+            del self.marks[next(iter(self.marks))]
+
+
+class PaneStreams:
+    """Tail the agents' pipe-pane logs into PaneScreens.
+
+    notify() (fed by fswatch.WorkspaceWatcher pane_log events) wakes the
+    loop at once; the logs are also stat()ed every PANE_POLL_INTERVAL
+    seconds, and tmux is asked every PANE_CHECK_INTERVAL seconds which
+    panes exist and are piped.
+
+    *on_update*, if given, is called from the loop thread with
+    {agent: seq} of the panes whose seq changed, at most every
+    PANE_PUSH_INTERVAL seconds.
+
+    Usage:
+        streams = PaneStreams(agent_map, log_dir, tmux_client)
+        streams.start()
+        text = streams.capture("kobito1", 300)   # None: capture via tmux
+        delta = streams.delta("kobito1", 300, seq)
+        ...
+        streams.stop()
+    """
+
+    def __init__(self, agent_map, log_dir, tmux,
+                 history_lines=PANE_HISTORY_LINES,
+                 history_bytes=PANE_HISTORY_BYTES, on_update=None):
+        self.log_dir = log_dir
+        self.tmux = tmux
+        self.on_update = on_update
+        self.history_lines = history_lines
+        self.history_bytes = history_bytes
+        self._panes = {
+            agent: _Pane(agent, target, os.path.join(log_dir, f"{agent}.log"))
+            for agent, target in agent_map.items()
+        }
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._bytes_read = 0
+        self._seeds = 0
+        self._drift = 0
+        self._pipes_started = 0
+        self._hits = 0
+        self._misses = 0
+        self._deltas = 0
+        self._resets = 0
+        self._errors = 0
+        self._last_error = None
+
+    # -- reading ------------------------------------------------------------
+
+    def capture(self, agent, lines):
+        """Return *agent*'s pane text like capture-pane, or None."""
+        pane = self._panes.get(agent)
+        with self._lock:
+            screen = pane.screen if pane is not None and pane.live else None
+            if (screen is None or screen.alternate or screen.needs_sync):
+                self._misses += 1
+                return None
+            self._hits += 1
+            return screen.capture(lines)
+
+    def delta(self, agent, lines, since=None):
+        """Return *agent*'s pane changes since seq *since*, or None.
+
+        None means the pane is not streamed (see capture()).  Otherwise
+        returns a dict:
+
+            {"seq": <current seq>, "reset": bool,
+             "append": [history lines], "screen": [rows] or None}
+
+        With reset False, *append* are the history lines added since
+        *since* and *screen* the current screen (None: nothing changed).
+        With reset True (*since* None, unknown or too old, history
+        cleared or rewritten, more than *lines* new lines), *append* is
+        the whole history -- its last *lines* rows.
+        """
+        pane = self._panes.get(agent)
+        with self._lock:
+            screen = pane.screen if pane is not None and pane.live else None
+            if (screen is None or screen.alternate or screen.needs_sync):
+                self._misses += 1
+                return None
+            self._hits += 1
+            if since == pane.seq:
+                return {"seq": pane.seq, "reset": False, "append": [],
+                        "screen": None}
+            mark = pane.marks.get(since)
+            new = screen.pushed - mark[2] if mark else -1
+            if (mark is not None and mark[:2] == (pane.epoch, screen.cleared)
+                    and new <= min(lines, len(screen.history))):
+                self._deltas += 1
+                append = screen.history_tail(new)
+                reset = False
+            else:
+                self._resets += 1
+                append = screen.history_tail(lines)
+                reset = True
+            return {"seq": pane.seq, "reset": reset, "append": append,
+                    "screen": screen.screen_rows()}
+
+    # -- tmux ---------------------------------------------------------------
+
+    def _check(self, now):
+        """Refresh pane identity / pipes and seed what needs it."""
+        ok, text = self.tmux.run(["list-panes", "-a", "-F", _PANE_FORMAT])
+        found = {}
+        if ok:
+            for line in text.splitlines():
+                parts = line.split(" ")
+                if len(parts) == 5:
+                    found[parts[0]] = parts[1:]
+        for pane in self._panes.values():
+            info = found.get(pane.target)
+            if info is None:
+                with self._lock:
+                    pane.live = False
+                    pane.screen = None
+                continue
+            pane_id, piped, width, height = info
+            if piped != "1":
+                # rakuen-launch's command; -o would close an existing pipe.
+                self.tmux.run(["pipe-pane", "-o", "-t", pane.target,
+                               f"cat >> {shlex.quote(pane.path)}"])
+                self._pipes_started += 1
+            size = (int(width), int(height))
+            self._tail(pane)
+            if (pane.screen is None or pane.pane_id != pane_id
+                    or pane.size != size or pane.screen.needs_sync
+                    or now - pane.seeded_at >= PANE_VERIFY_INTERVAL):
+                self._seed(pane, pane_id, now)
+
+    def _seed(self, pane, pane_id, now):
+        """Take a capture-pane snapshot of *pane* and tail from there."""
+        try:
+            offset = os.stat(pane.path).st_size
+        except OSError:
+            with self._lock:          # no log (yet): not streamed
+                pane.live = False
+                pane.screen = None
+            return
+        (ok_cur, cursor), (ok_cap, text) = self.tmux.run_many([
+            ["display-message", "-p", "-t", pane.target, _CURSOR_FORMAT],
+            ["capture-pane", "-p", "-t", pane.target,
+             "-S", f"-{self.history_lines}"],
+        ])
+        fields = cursor.split()
+        if not (ok_cur and ok_cap and len(fields) == 5
+                and all(f.isdigit() for f in fields)):
+            return
+        width, height, cursor_x, cursor_y, alternate = map(int, fields)
+        screen = PaneScreen(width, height, self.history_lines,
+                            self.history_bytes)
+        screen.seed(text, cursor_x, cursor_y, alternate == 1)
+        with self._lock:
+            old = pane.screen
+            same = (old is not None and pane.pane_id == pane_id
+                    and not old.needs_sync and not old.alternate
+                    and not screen.alternate)
+            if same and old.capture(self.history_lines) != text:
+                self._drift += 1
+                same = False
+            if not same:
+                # New contents: deltas from earlier seqs become resets.
+                pane.screen = screen
+                pane.epoch += 1
+                pane.advance()
+            pane.offset = offset
+            pane.pane_id = pane_id
+            pane.size = (width, height)
+            pane.live = True
+            pane.seeded_at = now
+            self._seeds += 1
+
+    # -- tailing ------------------------------------------------------------
+
+    def _tail(self, pane):
+        """Apply what was appended to *pane*'s log since the last read."""
+        if pane.screen is None:
+            return
+        try:
+            size = os.stat(pane.path).st_size
+        except OSError:
+            size = -1
+        if size < pane.offset or size - pane.offset > PANE_RESYNC_BYTES:
+            pane.screen.needs_sync = True     # truncated / too far behind
+            return
+        if size == pane.offset:
+            return
+        try:
+            with open(pane.path, "rb") as f:
+                f.seek(pane.offset)
+                while pane.offset < size:
+                    data = f.read(min(PANE_READ_CHUNK, size - pane.offset))
+                    if not data:
+                        break
+                    with self._lock:
+                        pane.screen.feed(data)
+                        pane.advance()
+                    pane.offset += len(data)
+                    self._bytes_read += len(data)
+        except OSError:
+            pane.screen.needs_sync = True
+
+    # -- loop ---------------------------------------------------------------
+
+    def notify(self, paths):
+        """Wake the loop for changed log files."""
+        if paths:
+            self._wake.set()
+
+    def _push(self):
+        """Call on_update with the panes changed since the last call."""
+        changed = [p for p in self._panes.values() if p.seq != p.pushed_seq]
+        if not changed:
+            return
+        for pane in changed:
+            pane.pushed_seq = pane.seq
+        self.on_update({pane.agent: pane.seq for pane in changed})
+
+    def run(self):
+        """Stream until stop() is called."""
+        next_check = last_check = next_push = 0.0
+        while not self._stop.is_set():
+            try:
+                now = time.monotonic()
+                resync = any(p.screen is not None and p.screen.needs_sync
+                             for p in self._panes.values())
+                if now >= next_check or (
+                        resync and now - last_check >= PANE_RESEED_DELAY):
+                    next_check = now + PANE_CHECK_INTERVAL
+                    last_check = now
+                    self._check(now)
+                for pane in self._panes.values():
+                    self._tail(pane)
+                if self.on_update and now >= next_push:
+                    next_push = now + PANE_PUSH_INTERVAL
+                    self._push()
+            except Exception as e:
+                self._errors += 1
+                self._last_error = str(e)
+                self._stop.wait(1.0)
+            timeout = PANE_POLL_INTERVAL
+            if self.on_update and any(p.seq != p.pushed_seq
+                                      for p in self._panes.values()):
+                timeout = max(0.0, min(timeout, next_push - time.monotonic()))
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def start(self):
+        """Run the streaming loop in a daemon thread."""
+        self._thread = threading.Thread(
+            target=self.run, daemon=True, name="pane-stream",
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the streaming loop."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            panes = [p for p in self._panes.values() if p.screen is not None]
+            return {
+                "panes_streamed": sum(1 for p in panes if p.live),
+                "history_bytes": sum(p.screen._bytes for p in panes),
+                "bytes_read": self._bytes_read,
+                "seeds": self._seeds,
+                "drift": self._drift,
+                "pipes_started": self._pipes_started,
+                "memory_reads": self._hits,
+                "tmux_fallbacks": self._misses,
+                "deltas": self._deltas,
+                "delta_resets": self._resets,
+                "errors": self._errors,
+                "last_error": self._last_error,
+            }
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Rakuen retention, archival and vacuum maintenance.
+
+Keeps the hot workspace database (rakuen.db) small enough to live in the
+page cache.  Rows older than the configured policy (settings.yaml
+``database.retention``) are moved into monthly archive databases
+(<workspace>/archive/rakuen-archive-YYYYMM.db), which remain queryable
+by ATTACHing them (see open_with_archives()).  The changelog is trimmed
+to ``database.changelog_max_rows`` entries.  Freed pages are returned
+to the filesystem with PRAGMA incremental_vacuum and the WAL file is
+truncated with PRAGMA wal_checkpoint(TRUNCATE).
+"""
+
+import contextlib
+import datetime
+import glob
+import os
+import re
+
+from db import (
+    ACTIVE_TASK_STATUSES,
+    _connect,
+    init_archive_db,
+    load_db_settings,
+    transaction,
+)
+
+
+ARCHIVE_PREFIX = "rakuen-archive-"
+
+# Tables subject to retention and their columns (in schema order).
+_TABLE_COLUMNS = {
+    "activity": ("id", "agent", "ts", "action", "status", "task_id"),
+    "tasks": ("task_id", "parent_cmd", "wid", "desc", "target_path",
+              "status", "ts"),
+    "reports": ("wid", "task_id", "ts", "status", "result", "sc"),
+}
+
+# Rows moved per transaction; keeps the write lock short for agents.
+_CHUNK_ROWS = 5000
+
+# SQLite allows 10 attached databases by default (main is not counted).
+_MAX_ATTACHED = 10
+
+_MONTH_RE = re.compile(r"^(\d{4})-(\d{2})")
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _archive_dir(workspace_dir, settings):
+    path = settings.get("archive_dir") or "archive"
+    return os.path.join(workspace_dir, os.path.expanduser(path))
+
+
+def archive_path(workspace_dir, month, settings=None):
+    """Return the archive file for *month* ("YYYYMM")."""
+    settings = settings or load_db_settings(workspace_dir)
+    return os.path.join(_archive_dir(workspace_dir, settings),
+                        f"{ARCHIVE_PREFIX}{month}.db")
+
+
+def list_archives(workspace_dir, settings=None):
+    """Return archive file paths, newest month first."""
+    settings = settings or load_db_settings(workspace_dir)
+    pattern = os.path.join(_archive_dir(workspace_dir, settings),
+                           f"{ARCHIVE_PREFIX}[0-9]*.db")
+    return sorted(glob.glob(pattern), reverse=True)
+
+
+def _month_of(ts, fallback):
+    m = _MONTH_RE.match(ts or "")
+    return m.group(1) + m.group(2) if m else fallback
+
+
+def _candidate_sql(table, policy, cutoff):
+    """Return (sql, params) selecting rowid, ts of rows to retire."""
+    conds = []
+    params = []
+    retire_if = []
+    if policy.get("max_age_days") is not None:
+        retire_if.append("ts < ?")
+        params.append(cutoff)
+    max_rows = policy.get("max_rows")
+    if max_rows is not None:
+        # Everything older than the max_rows-th newest row.
+        retire_if.append(
+            f"rowid NOT IN (SELECT rowid FROM {table}"
+            f" ORDER BY ts DESC, rowid DESC LIMIT ?)"
+        )
+        params.append(int(max_rows))
+    if not retire_if:
+        return None, None
+    conds.append("(" + " OR ".join(retire_if) + ")")
+
+    if table == "tasks":
+        marks = ", ".join("?" for _ in ACTIVE_TASK_STATUSES)
+        conds.append(f"status NOT IN ({marks})")
+        params.extend(ACTIVE_TASK_STATUSES)
+    elif table == "reports":
+        # Never archive a worker's latest report (get_report_by_worker).
+        conds.append(
+            "rowid NOT IN (SELECT (SELECT r2.rowid FROM reports r2"
+            " WHERE r2.wid = r1.wid ORDER BY r2.ts DESC LIMIT 1)"
+            " FROM reports r1 GROUP BY r1.wid)"
+        )
+    sql = (f"SELECT rowid, ts FROM {table} WHERE "
+           + " AND ".join(conds) + " ORDER BY rowid")
+    return sql, params
+
+
+# ---------------------------------------------------------------------------
+# Archival
+# ---------------------------------------------------------------------------
+
+def _move_rows(conn, table, rowids, path):
+    """Copy *rowids* of *table* into the archive at *path*, then delete them.
+
+    Runs in one transaction.  In WAL mode a multi-database commit is
+    atomic per file but not across files, so rows are written to the
+    archive before they are deleted: a crash in between leaves a
+    duplicate that the next run overwrites (INSERT OR REPLACE), never a
+    lost row.
+    """
+    cols = ", ".join(_TABLE_COLUMNS[table])
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        conn.execute("DELETE FROM temp._retire")
+        conn.executemany("INSERT INTO temp._retire (rid) VALUES (?)",
+                         ((rid,) for rid in rowids))
+        with transaction(conn):
+            conn.execute(
+                f"INSERT OR REPLACE INTO archive.{table} ({cols})"
+                f" SELECT {cols} FROM main.{table}"
+                f" WHERE rowid IN (SELECT rid FROM temp._retire)"
+            )
+            conn.execute(
+                f"DELETE FROM main.{table}"
+                f" WHERE rowid IN (SELECT rid FROM temp._retire)"
+            )
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+
+def archive_table(conn, workspace_dir, table, policy, now=None,
+                  settings=None):
+    """Move rows of *table* matching *policy* into monthly archives.
+
+    Returns {"YYYYMM": rows_moved}.
+    """
+    settings = settings or load_db_settings(workspace_dir)
+    now = now or datetime.datetime.now()
+    cutoff = ""
+    if policy.get("max_age_days") is not None:
+        cutoff = (now - datetime.timedelta(days=policy["max_age_days"])
+                  ).strftime("%Y-%m-%dT%H:%M:%S")
+    sql, params = _candidate_sql(table, policy, cutoff)
+    if sql is None:
+        return {}
+
+    by_month = {}
+    current = now.strftime("%Y%m")
+    for row in conn.execute(sql, params):
+        by_month.setdefault(_month_of(row[1], current), []).append(row[0])
+    if not by_month:
+        return {}
+
+    os.makedirs(_archive_dir(workspace_dir, settings), exist_ok=True)
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS _retire (rid INTEGER PRIMARY KEY)"
+    )
+    moved = {}
+    for month, rowids in sorted(by_month.items()):
+        path = archive_path(workspace_dir, month, settings)
+        init_archive_db(path)
+        for i in range(0, len(rowids), _CHUNK_ROWS):
+            chunk = rowids[i:i + _CHUNK_ROWS]
+            _move_rows(conn, table, chunk, path)
+            moved[month] = moved.get(month, 0) + len(chunk)
+    return moved
+
+
+# ---------------------------------------------------------------------------
+# Changelog / vacuum / checkpoint
+# ---------------------------------------------------------------------------
+
+def ensure_incremental_vacuum(conn):
+    """Switch a database created without auto_vacuum to INCREMENTAL.
+
+    New databases get it from db._connect(); older workspaces need a
+    one-time VACUUM for the setting to take effect.  Returns True if a
+    conversion was performed.
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def incremental_vacuum(conn, pages):
+    """Release up to *pages* free pages. Returns the remaining freelist."""
+    # executescript() steps the PRAGMA to completion; execute() would stop
+    # after the first step and free a single page.
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def prune_changelog(conn, keep_rows):
+    """Delete all but the newest *keep_rows* changelog entries.
+
+    Returns the number of entries removed.
+    """
+    if keep_rows is None:
+        return 0
+    with transaction(conn):
+        cur = conn.execute(
+            "DELETE FROM changelog"
+            " WHERE seq <= (SELECT MAX(seq) FROM changelog) - ?",
+            (int(keep_rows),),
+        )
+    return cur.rowcount
+
+
+def checkpoint(conn, mode="TRUNCATE"):
+    """Run a WAL checkpoint. Returns (busy, wal_pages, checkpointed)."""
+    row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return tuple(row)
+
+
+# ---------------------------------------------------------------------------
+# Entry points
+# ---------------------------------------------------------------------------
+
+def run_maintenance(workspace_dir, now=None, vacuum=True):
+    """Apply retention policies, then vacuum and checkpoint.
+
+    Returns a summary dict suitable for logging / YAML output.
+    """
+    settings = load_db_settings(workspace_dir)
+    retention = settings.get("retention") or {}
+    conn = _connect(workspace_dir)
+    try:
+        archived = {}
+        for table in _TABLE_COLUMNS:
+            policy = retention.get(table) or {}
+            moved = archive_table(conn, workspace_dir, table, policy,
+                                  now=now, settings=settings)
+            if moved:
+                archived[table] = moved
+
+        summary = {
+            "archived": archived,
+            "changelog_pruned": prune_changelog(
+                conn, settings.get("changelog_max_rows"),
+            ),
+        }
+        if vacuum:
+            summary["vacuum_converted"] = ensure_incremental_vacuum(conn)
+            summary["freelist_remaining"] = incremental_vacuum(
+                conn, settings.get("vacuum_pages") or 0,
+            )
+        summary["checkpoint"] = list(checkpoint(conn))
+        return summary
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def open_with_archives(workspace_dir, months=None):
+    """Yield a connection with archive databases attached.
+
+    Attaches the newest archives (or only *months*, a list of "YYYYMM")
+    as a0, a1, ... and creates TEMP views activity_all, tasks_all and
+    reports_all that UNION ALL the hot table with every attached archive,
+    so history queries can run against one name.
+    """
+    settings = load_db_settings(workspace_dir)
+    paths = list_archives(workspace_dir, settings)
+    if months is not None:
+        wanted = {archive_path(workspace_dir, m, settings) for m in months}
+        paths = [p for p in paths if p in wanted]
+    paths = paths[:_MAX_ATTACHED]
+
+    conn = _connect(workspace_dir)
+    try:
+        aliases = []
+        for i, path in enumerate(paths):
+            alias = f"a{i}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            aliases.append(alias)
+        for table, columns in _TABLE_COLUMNS.items():
+            cols = ", ".join(columns)
+            selects = [f"SELECT {cols} FROM main.{table}"]
+            selects += [f"SELECT {cols} FROM {a}.{table}" for a in aliases]
+            conn.execute(f"DROP VIEW IF EXISTS temp.{table}_all")
+            conn.execute(
+                f"CREATE TEMP VIEW {table}_all AS "
+                + " UNION ALL ".join(selects)
+            )
+        yield conn
+    finally:
+        conn.close()
@@ -1,13 +1,46 @@
 // API client with fetch wrappers
 
+// Last response per GET URL: {etag, data}.  Requests are revalidated with
+// If-None-Match; on 304 Not Modified the cached object itself is returned,
+// so callers can skip re-rendering with an identity check.
+const _etagCache = new Map();
+const ETAG_CACHE_MAX = 64;
+
+/**
+ * Conditional GET returning parsed JSON.
+ * @param {string} url
+ * @returns {Promise<Object>}
+ */
+async function getJSON(url) {
+  const cached = _etagCache.get(url);
+  const headers = cached ? { "If-None-Match": cached.etag } : {};
+  const res = await fetch(url, { headers, cache: "no-store" });
+  if (res.status === 304 && cached) {
+    return cached.data;
+  }
+  const data = await res.json();
+  const etag = res.headers.get("ETag");
+  _etagCache.delete(url);
+  if (res.ok && etag) {
+    if (_etagCache.size >= ETAG_CACHE_MAX) {
+      _etagCache.delete(_etagCache.keys().next().value);
+    }
+    _etagCache.set(url, { etag, data });
+  }
+  return data;
+}
+
 /**
  * GET /api/activity
+ * @param {Object} [params] - optional {before, after, limit, agent, task_id}
  * @returns {Promise<Object>}
  */
-export async function fetchActivity() {
+export async function fetchActivity(params = {}) {
   try {
-    const res = await fetch("/api/activity");
-    return await res.json();
+    const query = new URLSearchParams(
+      Object.entries(params).filter(([, v]) => v !== undefined && v !== null)
+    ).toString();
+    return await getJSON(query ? `/api/activity?${query}` : "/api/activity");
   } catch (err) {
     console.error("fetchActivity failed:", err);
     return { error: err.message };
@@ -15,28 +48,46 @@ export async function fetchActivity() {
 }
 
 /**
- * GET /api/panes?lines={lines}
+ * GET /api/panes?lines={lines}[&since={since}]
  * @param {number} lines
+ * @param {string} [since] - "agent:seq,..." to get deltas (see panes.js)
  * @returns {Promise<Object>}
  */
-export async function fetchPanes(lines = 300) {
+export async function fetchPanes(lines = 300, since) {
   try {
-    const res = await fetch(`/api/panes?lines=${lines}`);
-    return await res.json();
+    const query = since === undefined ? "" : `&since=${encodeURIComponent(since)}`;
+    return await getJSON(`/api/panes?lines=${lines}${query}`);
   } catch (err) {
     console.error("fetchPanes failed:", err);
     return { error: err.message };
   }
 }
 
+/**
+ * GET /api/pane?agent={agent}&lines={lines}[&since={since}]
+ * @param {string} agent
+ * @param {number} lines
+ * @param {number|null} [since] - seq of the pane contents held
+ * @returns {Promise<Object>}
+ */
+export async function fetchPane(agent, lines = 300, since) {
+  try {
+    const query = since === undefined ? "" : `&since=${since ?? ""}`;
+    return await getJSON(
+      `/api/pane?agent=${encodeURIComponent(agent)}&lines=${lines}${query}`);
+  } catch (err) {
+    console.error("fetchPane failed:", err);
+    return { error: err.message };
+  }
+}
+
 /**
  * GET /api/status
  * @returns {Promise<Object>}
  */
 export async function fetchStatus() {
   try {
-    const res = await fetch("/api/status");
-    return await res.json();
+    return await getJSON("/api/status");
   } catch (err) {
     console.error("fetchStatus failed:", err);
     return { error: err.message };
@@ -49,8 +100,7 @@ export async function fetchStatus() {
  */
 export async function fetchPresets() {
   try {
-    const res = await fetch("/api/presets");
-    return await res.json();
+    return await getJSON("/api/presets");
   } catch (err) {
     console.error("fetchPresets failed:", err);
     return { error: err.message };
@@ -63,8 +113,7 @@ export async function fetchPresets() {
  */
 export async function fetchDashboard() {
   try {
-    const res = await fetch("/api/dashboard");
-    return await res.json();
+    return await getJSON("/api/dashboard");
   } catch (err) {
     console.error("fetchDashboard failed:", err);
     return { error: err.message };
@@ -91,8 +140,7 @@ export async function sendEscape() {
  */
 export async function fetchAgentHealth() {
   try {
-    const res = await fetch("/api/agents/health");
-    return await res.json();
+    return await getJSON("/api/agents/health");
   } catch (err) {
     console.error("fetchAgentHealth failed:", err);
     return { error: err.message };
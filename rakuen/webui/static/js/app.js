@@ -1,5 +1,6 @@
 import * as state from './state.js';
 import * as api from './api.js';
+import * as panes from './panes.js';
 import { loadSettings, getSettings, applyTheme, applyFontSize } from './settings.js';
 import { initHeader } from './components/header.js';
 import { initFooter, updatePresets } from './components/footer.js';
@@ -13,6 +14,18 @@ let eventSource = null;
 let sseErrorCount = 0;
 const SSE_MAX_ERRORS = 3;
 
+// Response object last applied per state key.  api.js returns the same
+// object for a 304 Not Modified, which is then not re-rendered.
+const lastApplied = new Map();
+
+function setIfFresh(key, response, value) {
+  if (lastApplied.get(key) === response) {
+    return;
+  }
+  lastApplied.set(key, response);
+  state.set(key, value);
+}
+
 function startPolling() {
   stopPolling();
   const settings = getSettings();
@@ -62,30 +75,58 @@ async function fetchAndUpdateActiveTab() {
   if (activeTab === 'activity') {
     try {
       const activityData = await api.fetchActivity();
-      state.set('activityEntries', activityData.entries);
+      setIfFresh('activityEntries', activityData, activityData.entries);
     } catch (e) {
       console.error('Failed to fetch activity:', e);
     }
     try {
       const dashboardData = await api.fetchDashboard();
-      state.set('dashboardContent', dashboardData.content);
+      setIfFresh('dashboardContent', dashboardData, dashboardData.content);
     } catch (e) {
       console.error('Failed to fetch dashboard:', e);
     }
   } else if (activeTab === 'tmux') {
     try {
-      const panesData = await api.fetchPanes(settings.logLines);
-      state.set('panes', panesData.panes);
+      const lines = settings.logLines;
+      const panesData = await api.fetchPanes(lines, panes.sinceParam(lines));
+      if (panesData.panes && lastApplied.get('panes') !== panesData) {
+        lastApplied.set('panes', panesData);
+        for (const entry of Object.values(panesData.panes)) {
+          panes.applyEntry(entry);
+        }
+        state.set('panes', panes.snapshot());
+      }
     } catch (e) {
       console.error('Failed to fetch panes:', e);
     }
   }
 }
 
+// Refetch one pane whose SSE deltas cannot be applied (missed or reset).
+const paneRefetches = new Set();
+
+async function refetchPane(agent) {
+  if (paneRefetches.has(agent)) return;
+  paneRefetches.add(agent);
+  try {
+    const lines = getSettings().logLines;
+    const held = state.get('panes')[agent];
+    const since = held && held.lines === lines ? held.seq : null;
+    const entry = await api.fetchPane(agent, lines, since);
+    if (entry.agent && panes.applyEntry(entry)) {
+      state.set('panes', panes.snapshot());
+    }
+  } catch (e) {
+    console.error('Failed to fetch pane:', e);
+  } finally {
+    paneRefetches.delete(agent);
+  }
+}
+
 async function fetchAndUpdateStatus() {
   try {
     const data = await api.fetchStatus();
-    state.set('status', data);
+    setIfFresh('status', data, data);
   } catch (e) {
     console.error('Failed to fetch status:', e);
   }
@@ -95,7 +136,7 @@ async function fetchAndUpdateAgentHealth() {
   try {
     const data = await api.fetchAgentHealth();
     if (data.agents) {
-      state.set('agentHealth', data.agents);
+      setIfFresh('agentHealth', data, data.agents);
     }
   } catch (e) {
     console.error('Failed to fetch agent health:', e);
@@ -159,11 +200,25 @@ function initSSE() {
         if (newEntries.length > 0) {
           state.set('activityEntries', [...existing, ...newEntries]);
         }
+      } else if (data.type === 'change' || data.type === 'resync' ||
+                 data.type === 'queue') {
+        // Tasks, reports, commands or YAML queue files changed
+        // (or events were missed)
+        fetchAndUpdateActiveTab();
+      } else if (data.type === 'pane') {
+        // Pane delta pushed by the server (only rendered on the tmux tab)
+        if (state.get('activeTab') === 'tmux') {
+          if (panes.applyEvent(data)) {
+            state.set('panes', panes.snapshot());
+          } else {
+            refetchPane(data.agent);
+          }
+        }
       } else if (data.type === 'agent_health' && data.data) {
-        state.set('agentHealth', data.data);
+        setIfFresh('agentHealth', data, data.data);
       } else if (data.type === 'dashboard') {
         // Dashboard changed, refetch content
-        api.fetchDashboard().then(d => state.set('dashboardContent', d.content));
+        api.fetchDashboard().then(d => setIfFresh('dashboardContent', d, d.content));
       }
     },
     (err) => {
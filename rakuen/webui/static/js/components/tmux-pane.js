@@ -104,7 +104,11 @@ export function createPane(agentName, opts = {}) {
     widget.appendChild(inputBar);
   }
 
+  let lastText = null;
+
   function update(text) {
+    if (text === lastText) return;
+    lastText = text;
     const scrollThreshold = 40;
     const wasAtBottom = output.scrollHeight - output.scrollTop - output.clientHeight < scrollThreshold;
     const prevScrollTop = output.scrollTop;
@@ -0,0 +1,89 @@
+// Pane contents kept up to date from deltas (/api/panes?since=, SSE)
+//
+// The server numbers every change of a streamed pane (seq).  For each
+// pane the last seq applied is kept with its history and screen rows;
+// requests then ask only for what changed after it.  A pane entry with
+// "text" is a full capture (seq null: the pane is not streamed).
+
+const _panes = new Map();  // agent -> {seq, lines, history, screen, text}
+
+function render(pane) {
+  if (pane.text === null) {
+    pane.text = pane.history.concat(pane.screen).map(row => row + '\n').join('');
+  }
+  return pane.text;
+}
+
+/**
+ * Value of the ?since= parameter for panes shown with *lines* lines.
+ * @param {number} lines
+ * @returns {string} "agent:seq,..." (may be empty)
+ */
+export function sinceParam(lines) {
+  const parts = [];
+  for (const [agent, pane] of _panes) {
+    if (pane.seq !== null && pane.lines === lines) {
+      parts.push(`${agent}:${pane.seq}`);
+    }
+  }
+  return parts.join(',');
+}
+
+/**
+ * Apply one /api/pane(s) entry.
+ * @param {Object} entry
+ * @returns {boolean} false if it is a delta for another seq (refetch)
+ */
+export function applyEntry(entry) {
+  const { agent, lines } = entry;
+  const pane = _panes.get(agent);
+  if (entry.text !== undefined) {
+    // Full capture; not split into history / screen, so the next
+    // request asks for a reset.
+    _panes.set(agent, { seq: null, lines, history: [], screen: [], text: entry.text });
+  } else if (entry.reset) {
+    _panes.set(agent, {
+      seq: entry.seq, lines, history: entry.append,
+      screen: entry.screen || [], text: null,
+    });
+  } else if (!pane || pane.seq === null || pane.seq !== entry.since) {
+    // A delta from another seq (e.g. a response overtaken by SSE).
+    return pane !== undefined && pane.seq === entry.seq;
+  } else if (entry.seq !== pane.seq) {
+    if (entry.append.length) {
+      pane.history = pane.history.concat(entry.append);
+      if (pane.history.length > pane.lines) {
+        pane.history = pane.history.slice(pane.history.length - pane.lines);
+      }
+    }
+    if (entry.screen) pane.screen = entry.screen;
+    pane.seq = entry.seq;
+    pane.text = null;
+  }
+  return true;
+}
+
+/**
+ * Apply an SSE "pane" event (a delta, or a reset without contents).
+ * @param {Object} event - {agent, since, seq, reset, append, screen}
+ * @returns {boolean} false if the pane must be refetched
+ */
+export function applyEvent(event) {
+  const pane = _panes.get(event.agent);
+  if (!pane || event.reset) {
+    return pane !== undefined && pane.seq === event.seq;
+  }
+  return applyEntry({ ...event, lines: pane.lines });
+}
+
+/**
+ * Current pane texts, as stored in state 'panes'.
+ * @returns {Object} {agent: {agent, lines, text, seq}}
+ */
+export function snapshot() {
+  const out = {};
+  for (const [agent, pane] of _panes) {
+    out[agent] = { agent, lines: pane.lines, text: render(pane), seq: pane.seq };
+  }
+  return out;
+}
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Rakuen in-memory static assets with content-hashed URLs.
+
+StaticAssets reads webui/static into memory once and fingerprints every
+asset: ``/static/js/app.js`` is also served as ``/static/js/app.<hash>.js``,
+where the hash covers the file and every module it imports (transitively),
+so changing state.js changes the URL of each module that imports it.
+
+References are rewritten to the hashed URLs:
+
+  - index.html: ``href="/static/..."`` / ``src="/static/..."`` attributes
+  - JS modules: relative specifiers of ``import ... from '...'``,
+    ``export ... from '...'``, ``import '...'`` and ``import('...')``
+
+Hashed URLs never change content and are served with
+``Cache-Control: immutable``; plain URLs (index.html above all) are
+revalidated with their ETag.  Compressible assets are gzip-encoded once
+at load time.
+
+With dev=True the files are re-stat()ed (at most every DEV_CHECK_INTERVAL
+seconds) and reloaded when one changed, added or removed.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+
+from compress import GZIP_MIN_SIZE, GZIP_STATIC_LEVEL, is_compressible
+
+
+URL_PREFIX = "/static/"
+HASH_LENGTH = 12              # hex digits of the content hash in URLs
+DEV_CHECK_INTERVAL = 0.5      # seconds between file checks in dev mode
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_JS_IMPORT = re.compile(
+    r"""(\bfrom\s*|\bimport\s*\(?\s*)(['"])(\.{1,2}/[^'"\n]+|/static/[^'"\n]+)\2"""
+)
+_HTML_REF = re.compile(r"""(\b(?:href|src)=)(["'])(/static/[^"']+)\2""")
+
+
+class Asset:
+    """One static file held in memory."""
+
+    __slots__ = ("path", "content_type", "body", "gzip", "etag", "url")
+
+    def __init__(self, path, content_type, body, gzip_body, url):
+        self.path = path              # relative to the static dir (posix)
+        self.content_type = content_type
+        self.body = body
+        self.gzip = gzip_body         # None: not compressible / not smaller
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.url = url                # hashed URL, or None (index.html)
+
+
+def _hashed_name(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+class StaticAssets:
+    """Preloaded, fingerprinted contents of a static directory.
+
+    Usage:
+        assets = StaticAssets(static_dir, mime_types)
+        found = assets.lookup("/static/js/app.1a2b3c4d5e6f.js")
+        if found:
+            asset, immutable = found
+    """
+
+    def __init__(self, static_dir, mime_types=None, dev=False, stats=None):
+        self.static_dir = static_dir
+        self.mime_types = mime_types or {}
+        self.dev = dev
+        self._stats = stats           # compress.GzipStats (CPU accounting)
+        self._lock = threading.Lock()
+        self._urls = {}               # URL -> (Asset, immutable)
+        self._sigs = {}               # rel path -> (st_mtime_ns, st_size)
+        self._checked = 0.0
+        self._loads = 0
+        self._bytes = 0
+        self.load()
+
+    # -- loading ------------------------------------------------------------
+
+    def _scan(self):
+        """Return {rel path: (abs path, sig)} of every regular file."""
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(self.static_dir):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for name in sorted(filenames):
+                if name.startswith("."):
+                    continue
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                rel = os.path.relpath(full, self.static_dir).replace(os.sep, "/")
+                found[rel] = (full, (st.st_mtime_ns, st.st_size))
+        return found
+
+    def _content_type(self, rel):
+        ext = posixpath.splitext(rel)[1].lower()
+        return (self.mime_types.get(ext)
+                or mimetypes.guess_type(rel)[0]
+                or "application/octet-stream")
+
+    @staticmethod
+    def _resolve(base, spec):
+        """Resolve an import specifier of *base* to a static rel path."""
+        if spec.startswith(URL_PREFIX):
+            return posixpath.normpath(spec[len(URL_PREFIX):])
+        return posixpath.normpath(
+            posixpath.join(posixpath.dirname(base), spec))
+
+    def load(self):
+        """(Re)read every file and rebuild the URL table."""
+        files = self._scan()
+        raw = {}
+        for rel, (full, _sig) in files.items():
+            try:
+                with open(full, "rb") as f:
+                    raw[rel] = f.read()
+            except OSError:
+                pass
+
+        # Imports of each JS module (only those naming a known file).
+        deps = {}
+        for rel, body in raw.items():
+            if rel.endswith(".js"):
+                text = body.decode("utf-8", "replace")
+                deps[rel] = sorted({
+                    target for target in (
+                        self._resolve(rel, m.group(3))
+                        for m in _JS_IMPORT.finditer(text))
+                    if target in raw
+                })
+
+        # The hash of a file covers everything it reaches through imports,
+        # computed from the raw contents so import cycles need no ordering.
+        urls = {}
+        for rel in raw:
+            if rel == "index.html":
+                continue
+            reach, todo = {rel}, [rel]
+            while todo:
+                for dep in deps.get(todo.pop(), ()):
+                    if dep not in reach:
+                        reach.add(dep)
+                        todo.append(dep)
+            h = hashlib.sha256()
+            for path in sorted(reach):
+                h.update(path.encode("utf-8") + b"\0")
+                h.update(hashlib.sha256(raw[path]).digest())
+            urls[rel] = URL_PREFIX + _hashed_name(
+                rel, h.hexdigest()[:HASH_LENGTH])
+
+        def rewrite(rel, pattern):
+            def sub(m):
+                target = self._resolve(rel, m.group(3))
+                url = urls.get(target)
+                if url is None:
+                    return m.group(0)
+                return m.group(1) + m.group(2) + url + m.group(2)
+            text = raw[rel].decode("utf-8")
+            return pattern.sub(sub, text).encode("utf-8")
+
+        table = {}
+        total = 0
+        cpu = 0.0
+        for rel in raw:
+            body = raw[rel]
+            try:
+                if rel.endswith(".js"):
+                    body = rewrite(rel, _JS_IMPORT)
+                elif rel.endswith(".html"):
+                    body = rewrite(rel, _HTML_REF)
+            except UnicodeDecodeError:
+                pass
+            content_type = self._content_type(rel)
+            gzip_body = None
+            if is_compressible(content_type) and len(body) >= GZIP_MIN_SIZE:
+                start = time.thread_time()
+                gzip_body = gzip.compress(
+                    body, compresslevel=GZIP_STATIC_LEVEL, mtime=0)
+                cpu += time.thread_time() - start
+                if len(gzip_body) >= len(body):
+                    gzip_body = None
+            asset = Asset(rel, content_type, body, gzip_body, urls.get(rel))
+            table[URL_PREFIX + rel] = (asset, False)
+            if asset.url:
+                table[asset.url] = (asset, True)
+            total += len(body) + len(gzip_body or b"")
+        index = table.get(URL_PREFIX + "index.html")
+        if index:
+            table["/"] = table["/index.html"] = index
+        if self._stats is not None:
+            self._stats.add_cpu(cpu)
+
+        with self._lock:
+            self._urls = table
+            self._sigs = {rel: sig for rel, (_full, sig) in files.items()}
+            self._bytes = total
+            self._loads += 1
+            self._checked = time.monotonic()
+
+    def _check(self):
+        """Reload if a file changed (dev mode, rate limited)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < DEV_CHECK_INTERVAL:
+                return
+            self._checked = now
+            sigs = self._sigs
+        current = {rel: sig for rel, (_full, sig) in self._scan().items()}
+        if current != sigs:
+            self.load()
+
+    # -- lookup -------------------------------------------------------------
+
+    def lookup(self, url_path):
+        """Return (Asset, immutable) for *url_path*, or None."""
+        if self.dev:
+            self._check()
+        with self._lock:
+            return self._urls.get(url_path)
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            return {
+                "files": len(self._sigs),
+                "bytes": self._bytes,
+                "loads": self._loads,
+                "dev": self.dev,
+            }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Rakuen in-memory activity timeline.
+
+Keeps the newest activity rows of rakuen.db (already rendered to JSON by
+SQLite) in a bounded, sorted buffer that is updated incrementally from
+the changelog, plus an index of the YAML / dashboard fallback entries
+built by k-way merging the per-file lists.  /api/activity answers the
+newest page and ``after=`` / ``since=`` polls from memory with binary
+search, so a poll costs O(new entries) instead of a query and a sort of
+the whole page.
+
+Requests the buffer cannot answer exactly (``before=`` pages older than
+the buffer, agent / task_id filters) return None from page() and are
+served by SQLite as before; the YAML index is used on both paths.
+"""
+
+import bisect
+import heapq
+import threading
+
+from db import (
+    encode_cursor,
+    get_activity_json_rows,
+    get_changelog_range,
+    get_changes_since,
+)
+
+
+TIMELINE_CAPACITY = 5000      # activity rows kept in memory
+_CHANGES_BATCH = 500          # changelog entries read per query
+
+
+class TimelineStore:
+    """Bounded, incrementally maintained activity timeline.
+
+    DB rows are held as parallel lists sorted by (ts, rowid): _keys for
+    bisect and _rows of (ts, task_id, json_text, id).  When the buffer
+    grows past its capacity the oldest rows are dropped and _low records
+    the oldest key still covered; older cursors fall back to SQLite.
+
+    Usage:
+        store = TimelineStore(fields)
+        with pool.connection() as db:
+            store.refresh(db)
+        page = store.page(after, after_key, limit)   # None -> use SQLite
+    """
+
+    def __init__(self, fields, capacity=TIMELINE_CAPACITY, field_params=()):
+        self.fields = fields
+        self.field_params = tuple(field_params)
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._seq = 0
+        self._keys = []
+        self._rows = []
+        self._by_id = {}          # activity id -> (ts, rowid)
+        self._low = None          # None: every row of the table is held
+        # YAML / dashboard side index
+        self._sources = []        # source lists last merged (by identity)
+        self._sorted = {}         # rank -> (source list, sorted entries)
+        self._side_ts = []        # ts of each dated side entry (bisect)
+        self._side = []           # (ts, rank, idx, entry), sorted
+        self._undated = []        # (rank, idx, entry), source order
+        self._hits = 0
+        self._fallbacks = 0
+        self._reloads = 0
+        self._changes = 0
+        self._side_rebuilds = 0
+
+    # -- DB rows ------------------------------------------------------------
+
+    def refresh(self, db):
+        """Apply changelog entries written since the last refresh.
+
+        Reloads the buffer when it has never been loaded, when entries it
+        needs were pruned from the changelog or when the database was
+        reset (its newest seq went backwards).
+        """
+        with self._lock:
+            oldest, newest = get_changelog_range(db)
+            if (not self._loaded or self._seq > newest
+                    or (oldest and self._seq < oldest - 1)):
+                self._reload(db, newest)
+                return
+            while self._seq < newest:
+                changes = get_changes_since(db, self._seq, _CHANGES_BATCH)
+                if not changes:
+                    break
+                self._apply(db, changes)
+                self._seq = changes[-1]["seq"]
+
+    def _reload(self, db, seq):
+        # The seq is read before the rows: a change that lands in between
+        # is replayed by the next refresh, which is idempotent.
+        rows = get_activity_json_rows(
+            db, self.fields, limit=self.capacity,
+            field_params=self.field_params,
+        )
+        self._keys = [(ts, rowid) for _id, rowid, ts, _tid, _json in rows]
+        self._rows = [(ts, tid, text, aid)
+                      for aid, _rowid, ts, tid, text in rows]
+        self._by_id = {row[0]: key for row, key in zip(rows, self._keys)}
+        self._low = self._keys[0] if len(rows) >= self.capacity else None
+        self._seq = seq
+        self._loaded = True
+        self._reloads += 1
+
+    def _apply(self, db, changes):
+        ids = list(dict.fromkeys(
+            c["row_key"] for c in changes if c["tbl"] == "activity"
+        ))
+        if not ids:
+            return
+        self._changes += len(ids)
+        for aid in ids:
+            self._remove(aid)
+        # Re-read the current state of every touched row: a row deleted
+        # again later in the batch is simply not found.
+        for aid, rowid, ts, tid, text in get_activity_json_rows(
+                db, self.fields, ids=ids, field_params=self.field_params):
+            self._insert(aid, rowid, ts, tid, text)
+        self._trim()
+
+    def _insert(self, aid, rowid, ts, task_id, text):
+        key = (ts, rowid)
+        if self._low is not None and key < self._low:
+            return   # older than the buffer: SQLite serves that range
+        if not self._keys or key > self._keys[-1]:
+            i = len(self._keys)   # the usual case: a new newest row
+        else:
+            i = bisect.bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._rows.insert(i, (ts, task_id, text, aid))
+        self._by_id[aid] = key
+
+    def _remove(self, aid):
+        key = self._by_id.pop(aid, None)
+        if key is None:
+            return
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+            del self._rows[i]
+
+    def _trim(self):
+        # Drop in batches of capacity/8 so the list shift is amortized.
+        if len(self._keys) <= self.capacity + self.capacity // 8:
+            return
+        drop = len(self._keys) - self.capacity
+        for row in self._rows[:drop]:
+            self._by_id.pop(row[3], None)
+        del self._keys[:drop]
+        del self._rows[:drop]
+        self._low = self._keys[0]
+
+    def page(self, after=None, after_key=None, limit=100):
+        """Return the newest page, or the page after *after_key*.
+
+        The result has the shape of db.get_activity_page_json() (rows
+        are (ts, task_id, json_text, id)), or is None when the buffer
+        does not cover the requested range.
+        """
+        with self._lock:
+            n = len(self._keys)
+            if after_key is None:
+                if n <= limit and self._low is not None:
+                    self._fallbacks += 1
+                    return None
+                start = max(0, n - limit)
+                end = n
+                has_more = start > 0 or self._low is not None
+            else:
+                if self._low is not None and after_key < self._low:
+                    self._fallbacks += 1
+                    return None
+                start = bisect.bisect_right(self._keys, after_key)
+                end = min(n, start + limit)
+                has_more = n - start > limit
+            self._hits += 1
+            rows = self._rows[start:end]
+            if rows:
+                before_cursor = encode_cursor(*self._keys[start])
+                after_cursor = encode_cursor(*self._keys[end - 1])
+            else:
+                before_cursor, after_cursor = None, after
+        return {
+            "rows": rows,
+            "has_more": has_more,
+            "before": before_cursor,
+            "after": after_cursor,
+        }
+
+    # -- YAML / dashboard side index ----------------------------------------
+
+    def set_side_sources(self, sources):
+        """Index the fallback entry lists *sources* (in priority order).
+
+        Each list is sorted once when it changes (lists are compared by
+        identity, as returned by the parse cache) and all of them are
+        k-way merged into one timeline ordered by (ts, rank, index).
+        """
+        with self._lock:
+            if len(sources) == len(self._sources) and all(
+                    a is b or (not a and not b)
+                    for a, b in zip(sources, self._sources)):
+                return
+            runs = []
+            undated = []
+            for rank, entries in enumerate(sources):
+                cached = self._sorted.get(rank)
+                if cached is None or cached[0] is not entries:
+                    dated = []
+                    for idx, e in enumerate(entries):
+                        ts = e.get("timestamp")
+                        if ts is not None:
+                            dated.append((str(ts), rank, idx, e))
+                    dated.sort(key=lambda item: item[:3])
+                    cached = (entries, dated)
+                    self._sorted[rank] = cached
+                runs.append(cached[1])
+                undated.extend((rank, idx, e) for idx, e in enumerate(entries)
+                               if e.get("timestamp") is None)
+            self._side = list(heapq.merge(*runs, key=lambda item: item[:3]))
+            self._side_ts = [item[0] for item in self._side]
+            self._undated = undated
+            self._sources = list(sources)
+            self._side_rebuilds += 1
+
+    def side_window(self, lo=None, hi=None, include_undated=True,
+                    agent=None, task_id=None, seen=()):
+        """Return [(ts, entry)] of side entries inside (lo, hi).
+
+        lo / hi are (ts, inclusive) bounds or None for an open end.
+        Entries whose task_id is in *seen* are dropped; of the remaining
+        entries sharing a task_id only the one from the highest-priority
+        source is kept.  Dated entries come first in time order, then the
+        undated ones (if *include_undated*).
+        """
+        with self._lock:
+            start, end = 0, len(self._side_ts)
+            if lo:
+                bound = bisect.bisect_left if lo[1] else bisect.bisect_right
+                start = bound(self._side_ts, lo[0])
+            if hi:
+                bound = bisect.bisect_right if hi[1] else bisect.bisect_left
+                end = bound(self._side_ts, hi[0], start)
+            dated = self._side[start:end]
+            undated = self._undated if include_undated else []
+
+        candidates = dated + [(None, rank, idx, e)
+                              for rank, idx, e in undated]
+        if agent or task_id:
+            candidates = [
+                c for c in candidates
+                if (not agent or c[3].get("from") == agent)
+                and (not task_id or c[3].get("task_id") == task_id)
+            ]
+        best = {}
+        for ts, rank, idx, e in candidates:
+            tid = e.get("task_id")
+            if tid and tid not in seen:
+                if tid not in best or (rank, idx) < best[tid]:
+                    best[tid] = (rank, idx)
+        return [
+            (ts, e) for ts, rank, idx, e in candidates
+            if not e.get("task_id") or best.get(e["task_id"]) == (rank, idx)
+        ]
+
+    # -- versioning ---------------------------------------------------------
+
+    def version(self):
+        """Return a value that changes whenever any page could change.
+
+        It combines the changelog seq applied by the last refresh() with
+        the reload and side index rebuild counts; /api/activity uses it
+        as its ETag stamp.
+        """
+        with self._lock:
+            return self._seq, self._reloads, self._side_rebuilds
+
+    # -- metrics ------------------------------------------------------------
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            total = self._hits + self._fallbacks
+            return {
+                "rows": len(self._keys),
+                "capacity": self.capacity,
+                "complete": self._low is None,
+                "seq": self._seq,
+                "side_entries": len(self._side) + len(self._undated),
+                "hits": self._hits,
+                "fallbacks": self._fallbacks,
+                "hit_rate": round(self._hits / total, 3) if total else None,
+                "reloads": self._reloads,
+                "changes_applied": self._changes,
+                "side_rebuilds": self._side_rebuilds,
+            }
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""Rakuen tmux control-mode client.
+
+TmuxClient keeps one ``tmux -C attach-session`` process and sends every
+tmux command (capture-pane, display-message, send-keys, ...) as a line on
+its stdin, so a command costs a pipe round trip instead of a fork/exec of
+the tmux binary.  tmux answers the commands of a client in order, each
+with one block:
+
+    %begin <time> <number> <flags>
+    ...output lines...
+    %end <time> <number> <flags>        (or %error on failure)
+
+so replies are matched to requests first-in first-out.  Blocks with
+flags 0 (the attach command itself) and notifications outside blocks
+(%session-changed, %window-add, ...) are ignored.  The client attaches
+with ``-f ignore-size,no-output`` (tmux >= 3.2): it never resizes the
+agents' windows and receives no %output stream.
+
+The control process is started on first use and restarted after it
+exits (tmux server restarted, its session killed).  A command without a
+reply within its timeout raises TimeoutError and drops the connection;
+commands still waiting for a reply then fail.  While no control
+connection can be made (no tmux server, tmux < 3.2) commands fall back
+to one ``tmux`` subprocess each, and attaching is retried at most every
+RECONNECT_INTERVAL seconds.
+
+Usage:
+    client = TmuxClient()
+    ok, text = client.run(["capture-pane", "-t", "rakuen:0.0", "-p"])
+"""
+
+import collections
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+TMUX_TIMEOUT = 5              # seconds to wait for a command's reply
+CONNECT_TIMEOUT = 3           # seconds to wait for the attach to finish
+RECONNECT_INTERVAL = 5        # seconds between failed attach attempts
+
+ATTACH_FLAGS = "ignore-size,no-output"
+
+_BLOCK = re.compile(rb"%(begin|end|error) (\d+) (\d+) (\d+)\Z")
+_SAFE_ARG = re.compile(r"[A-Za-z0-9_.,:/@+=%-]+\Z")
+_CONTROL_CHARS = re.compile(r"[\x00-\x1f\x7f]")
+
+
+def quote(arg):
+    """Quote *arg* for tmux's command parser (one control-mode line)."""
+    # A bare word starting with % is a directive (%if, %hidden, ...).
+    if _SAFE_ARG.match(arg) and not arg.startswith("%"):
+        return arg
+    if "'" not in arg and not _CONTROL_CHARS.search(arg):
+        return "'" + arg + "'"
+    out = []
+    for ch in arg:
+        if ch in '\\"$':
+            out.append("\\" + ch)
+        elif ch < " " or ch == "\x7f":
+            out.append("\\%03o" % ord(ch))
+        else:
+            out.append(ch)
+    return '"' + "".join(out) + '"'
+
+
+def _decode(data):
+    return data.decode("utf-8", "replace")
+
+
+class _Connection:
+    """One ``tmux -C`` process and the reader thread parsing its output."""
+
+    def __init__(self, client):
+        self._client = client
+        self.proc = subprocess.Popen(
+            ["tmux", "-C", "attach-session", "-f", ATTACH_FLAGS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        self.pending = collections.deque()   # Futures awaiting a reply
+        self.attached = False
+        self.ready = threading.Event()       # attached or closed
+        self.closed = False
+        self._thread = threading.Thread(
+            target=self._read, daemon=True, name="tmux-control")
+        self._thread.start()
+
+    def send(self, lines):
+        """Write command lines in one write (caller holds the client lock).
+
+        Returns one Future per line.
+        """
+        futures = [Future() for _ in lines]
+        self.pending.extend(futures)
+        self.proc.stdin.write("".join(line + "\n" for line in lines)
+                              .encode("utf-8"))
+        self.proc.stdin.flush()
+        return futures
+
+    def close(self):
+        """Terminate the control process (the reader fails what is pending)."""
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            self.proc.terminate()
+
+    def _read(self):
+        block = None                  # (number, ours, lines) inside a block
+        try:
+            for raw in self.proc.stdout:
+                line = raw.rstrip(b"\n")
+                if block is not None:
+                    m = _BLOCK.match(line)
+                    if m and m.group(1) != b"begin" and m.group(3) == block[0]:
+                        if block[1]:
+                            self._reply(m.group(1) == b"end", block[2])
+                        elif m.group(1) == b"end":
+                            self.attached = True
+                            self.ready.set()
+                        else:
+                            break             # attach failed: no sessions
+                        block = None
+                    else:
+                        block[2].append(line)
+                    continue
+                m = _BLOCK.match(line)
+                if m and m.group(1) == b"begin":
+                    block = (m.group(3), int(m.group(4)) & 1, [])
+                elif line.startswith(b"%exit"):
+                    break
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._client._disconnected(self)
+            self.close()
+            try:
+                self.proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    def _reply(self, ok, lines):
+        with self._client._lock:
+            future = self.pending.popleft() if self.pending else None
+        if future is None:
+            return
+        if ok:
+            text = "".join(_decode(line) + "\n" for line in lines)
+        else:
+            text = "\n".join(_decode(line) for line in lines).strip()
+        if not future.done():
+            future.set_result((ok, text))
+
+
+class TmuxClient:
+    """Thread-safe tmux command runner over a control-mode connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self._next_attempt = 0.0
+        self._connects = 0
+        self._commands = 0
+        self._fallbacks = 0
+        self._timeouts = 0
+        self._disconnects = 0
+
+    # -- connection ---------------------------------------------------------
+
+    def _connection(self):
+        """Return a live connection, attaching if needed (or None)."""
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                if time.monotonic() < self._next_attempt:
+                    return None
+                self._next_attempt = time.monotonic() + RECONNECT_INTERVAL
+                try:
+                    conn = self._conn = _Connection(self)
+                except OSError:       # tmux not installed
+                    return None
+                self._connects += 1
+        # Concurrent callers wait for the same attach.
+        if conn.ready.wait(CONNECT_TIMEOUT) and not conn.closed:
+            return conn
+        conn.close()
+        return None
+
+    def _disconnected(self, conn):
+        """Forget *conn* and fail its unanswered commands (reader thread)."""
+        with self._lock:
+            conn.closed = True
+            if self._conn is conn:
+                self._conn = None
+                if conn.attached:
+                    self._disconnects += 1
+                    self._next_attempt = 0.0
+            pending, conn.pending = list(conn.pending), collections.deque()
+        conn.ready.set()
+        for future in pending:
+            if not future.done():
+                future.set_result((False, "tmux control connection closed"))
+
+    def close(self):
+        """Detach the control client."""
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+    # -- commands -----------------------------------------------------------
+
+    def run(self, args, timeout=TMUX_TIMEOUT):
+        """Run the tmux command *args* (list of str).
+
+        Returns (ok, text): the command's output when ok, else tmux's
+        error message.  Raises TimeoutError when tmux does not answer
+        within *timeout* seconds and FileNotFoundError when tmux is not
+        installed.
+        """
+        return self.run_many([args], timeout)[0]
+
+    def run_many(self, commands, timeout=TMUX_TIMEOUT):
+        """Run several tmux commands, sent to tmux in a single write.
+
+        tmux runs the commands of one write back to back, without pane
+        output being processed in between, so e.g. a cursor position and
+        a capture-pane describe the same moment.  Returns a list of
+        (ok, text) like run(); raises like run().
+        """
+        lines = [" ".join(quote(arg) for arg in args) for args in commands]
+        conn = self._connection()
+        futures = None
+        if conn is not None:
+            with self._lock:
+                if not conn.closed:
+                    try:
+                        futures = conn.send(lines)
+                        self._commands += len(lines)
+                    except (OSError, ValueError):
+                        futures = None
+        if futures is None:
+            return [self._run_subprocess(args, timeout) for args in commands]
+        deadline = time.monotonic() + timeout
+        try:
+            return [future.result(max(0.0, deadline - time.monotonic()))
+                    for future in futures]
+        except FutureTimeout:
+            with self._lock:
+                self._timeouts += 1
+            conn.close()
+            raise TimeoutError(f"tmux {commands[0][0]} timed out") from None
+
+    def _run_subprocess(self, args, timeout):
+        with self._lock:
+            self._fallbacks += 1
+        try:
+            result = subprocess.run(
+                ["tmux", *args], capture_output=True, timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"tmux {args[0]} timed out") from None
+        if result.returncode != 0:
+            return False, _decode(result.stderr).strip()
+        return True, _decode(result.stdout)
+
+    # -- metrics ------------------------------------------------------------
+
+    def stats(self):
+        """Return counters for /api/metrics."""
+        with self._lock:
+            conn = self._conn
+            return {
+                "connected": conn is not None and conn.attached,
+                "connect_attempts": self._connects,
+                "disconnects": self._disconnects,
+                "commands": self._commands,
+                "in_flight": len(conn.pending) if conn is not None else 0,
+                "subprocess_fallbacks": self._fallbacks,
+                "timeouts": self._timeouts,
+            }
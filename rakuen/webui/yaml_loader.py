@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""Rakuen YAML loader for agent queue files.
+
+load() returns exactly what yaml.safe_load() would, faster:
+
+  1. A restricted line parser handles the block-style files agents write
+     (mappings, lists of mappings, plain / simply quoted scalars, short
+     keys such as ts / cmd / wid / desc / sc / st).  Scalars are resolved
+     and constructed by PyYAML's own resolver and SafeConstructor, so
+     ints, bools, nulls and unquoted timestamps come out identical.
+  2. Anything else -- block scalars (| >), flow collections, anchors,
+     tags, escapes, multi-line scalars, tabs, documents markers -- makes
+     the fast parser give up, and the file is parsed by yaml.CSafeLoader
+     (libyaml) when available, else by the pure-Python SafeLoader.
+
+extract_items() applies the queue file conventions (container unwrap,
+short-key normalization) on top of load().
+"""
+
+import re
+import threading
+
+import yaml
+from yaml.nodes import ScalarNode
+
+try:
+    from yaml import CSafeLoader as _FullLoader
+    LIBYAML = True
+except ImportError:   # PyYAML built without libyaml
+    from yaml import SafeLoader as _FullLoader
+    LIBYAML = False
+
+
+# Short key -> full key mapping used by agent queue files
+SHORT_KEY_MAP = {
+    "ts": "timestamp",
+    "cmd": "command",
+    "wid": "worker_id",
+    "desc": "description",
+    "sc": "skill_candidate",
+    "st": "status",
+}
+
+# Characters the fast parser leaves to the full parser: tabs, CR and
+# other line breaks, BOM, and everything YAML does not allow unescaped.
+_UNSUPPORTED_CHARS = re.compile(
+    "[^\n\x20-\x7e\xa0-\u2027\u202a-\ud7ff\ue000-\ufefe\uff00-\ufffd"
+    "\U00010000-\U0010ffff]"
+)
+_KEY_LINE = re.compile(r"([A-Za-z0-9_][A-Za-z0-9_.\-/]*):(?: +(.*))?$")
+# A plain scalar may not start with an indicator character.
+_INDICATORS = frozenset("-?:,[]{}#&*!|>'\"%@`")
+
+_resolver = yaml.resolver.Resolver()
+_constructor = yaml.constructor.SafeConstructor()
+_constructor_lock = threading.Lock()
+
+# Resolved plain scalars (keys and repeated values such as statuses).
+# Constructed values are immutable, so they can be shared.
+_PLAIN_CACHE_MAX = 4096
+_plain_cache = {}
+
+
+class _Unsupported(Exception):
+    """Input outside the fast parser's subset: use the full parser."""
+
+
+# ---------------------------------------------------------------------------
+# Fast parser
+# ---------------------------------------------------------------------------
+
+def _plain(text):
+    """Resolve and construct a plain scalar like SafeLoader does."""
+    try:
+        return _plain_cache[text]
+    except KeyError:
+        pass
+    value = _construct_plain(text)
+    if len(_plain_cache) >= _PLAIN_CACHE_MAX:
+        _plain_cache.clear()
+    _plain_cache[text] = value
+    return value
+
+
+def _construct_plain(text):
+    if (text[0] in _INDICATORS or ": " in text or text.endswith(":")
+            or " #" in text):
+        raise _Unsupported(text)
+    tag = _resolver.resolve(ScalarNode, text, (True, False))
+    if tag == "tag:yaml.org,2002:str":
+        return text
+    construct = _constructor.yaml_constructors.get(tag)
+    if construct is None:
+        raise _Unsupported(text)                # e.g. "=" (value tag)
+    with _constructor_lock:
+        return construct(_constructor, ScalarNode(tag, text))
+
+
+def _value(text):
+    """Parse the scalar text after "key: " or "- " (comments allowed)."""
+    quote = text[0]
+    if quote == '"' or quote == "'":
+        end = 1
+        while True:
+            end = text.find(quote, end)
+            if end < 0:
+                raise _Unsupported(text)        # multi-line quoted
+            if quote == "'" and text.startswith("''", end):
+                end += 2
+                continue
+            break
+        inner = text[1:end]
+        rest = text[end + 1:].lstrip(" ")
+        if rest and not rest.startswith("#"):
+            raise _Unsupported(text)
+        if quote == '"':
+            if "\\" in inner:
+                raise _Unsupported(text)        # escapes
+            return inner
+        return inner.replace("''", "'")
+    if text.startswith("#"):
+        return None
+    cut = text.find(" #")
+    if cut >= 0:
+        text = text[:cut]
+    text = text.rstrip(" ")
+    if text == "[]":
+        return []
+    if text == "{}":
+        return {}
+    return _plain(text)
+
+
+def _is_seq(content):
+    return content[0] == "-" and (len(content) == 1 or content[1] == " ")
+
+
+def _parse_node(lines, i, indent):
+    if _is_seq(lines[i][1]):
+        return _parse_seq(lines, i, indent)
+    return _parse_map(lines, i, indent)
+
+
+def _parse_map(lines, i, indent):
+    result = {}
+    n = len(lines)
+    while i < n:
+        ind, content = lines[i]
+        if ind < indent:
+            break
+        if ind > indent:
+            raise _Unsupported(content)
+        m = _KEY_LINE.match(content)
+        if not m:
+            if _is_seq(content):
+                break           # end of a same-indent sequence value
+            raise _Unsupported(content)
+        key = _plain(m.group(1))
+        rest = m.group(2)
+        i += 1
+        if rest and not rest.startswith("#"):
+            result[key] = _value(rest)
+        elif i < n and lines[i][0] > indent:
+            result[key], i = _parse_node(lines, i, lines[i][0])
+        elif i < n and lines[i][0] == indent and _is_seq(lines[i][1]):
+            # key:
+            # - item      (sequence at the parent's indentation)
+            result[key], i = _parse_seq(lines, i, indent)
+        else:
+            result[key] = None
+    return result, i
+
+
+def _parse_seq(lines, i, indent):
+    result = []
+    n = len(lines)
+    while i < n:
+        ind, content = lines[i]
+        if ind < indent:
+            break
+        if ind > indent:
+            raise _Unsupported(content)
+        if not _is_seq(content):
+            break
+        rest = content[1:]
+        stripped = rest.lstrip(" ")
+        if not stripped or stripped.startswith("#"):
+            i += 1
+            if i < n and lines[i][0] > indent:
+                item, i = _parse_node(lines, i, lines[i][0])
+            else:
+                item = None
+        elif _is_seq(stripped):
+            raise _Unsupported(content)         # "- - x"
+        elif _KEY_LINE.match(stripped):
+            # "- key: value": a mapping whose keys align with "key"
+            col = indent + 1 + len(rest) - len(stripped)
+            lines[i] = (col, stripped)
+            item, i = _parse_map(lines, i, col)
+        else:
+            item = _value(stripped)
+            i += 1
+        result.append(item)
+    return result, i
+
+
+def _fast_load(text):
+    """Parse *text* with the restricted parser (raises _Unsupported)."""
+    if _UNSUPPORTED_CHARS.search(text):
+        raise _Unsupported("characters")
+    lines = []
+    for raw in text.split("\n"):
+        content = raw.lstrip(" ")
+        if not content or content.startswith("#"):
+            continue
+        lines.append((len(raw) - len(content), content.rstrip(" ")))
+    if not lines:
+        return None
+    data, i = _parse_node(lines, 0, lines[0][0])
+    if i != len(lines):
+        raise _Unsupported(lines[i][1])
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+_stats = {"fast": 0, "full": 0}
+
+
+def load(text):
+    """Parse YAML *text* like yaml.safe_load(). Raises yaml.YAMLError."""
+    try:
+        data = _fast_load(text)
+        _stats["fast"] += 1
+        return data
+    except _Unsupported:
+        pass
+    _stats["full"] += 1
+    return yaml.load(text, Loader=_FullLoader)
+
+
+def normalize_keys(item):
+    """Apply short-key to full-key mapping on a dict."""
+    if not isinstance(item, dict):
+        return item
+    result = {}
+    for k, v in item.items():
+        full_key = SHORT_KEY_MAP.get(k, k)
+        if full_key not in result:
+            result[full_key] = v
+    return result
+
+
+def extract_items(text):
+    """Parse YAML text and return a flat list of dicts.
+
+    Handles three structures written by agents:
+      1. List-of-dicts under a key:  queue:\\n  - id: ...
+      2. Single dict under a key:    task:\\n  task_id: ...
+      3. Flat dict (no nesting):     worker_id: ...\\ntask_id: ...
+
+    Returns a list of dicts with short keys normalized to full keys;
+    unparsable text yields an empty list.
+    """
+    if not text or not text.strip():
+        return []
+
+    try:
+        data = load(text)
+    except yaml.YAMLError:
+        return []
+
+    if data is None:
+        return []
+
+    items = []
+
+    if isinstance(data, list):
+        # Top-level list
+        for item in data:
+            if isinstance(item, dict):
+                items.append(normalize_keys(item))
+    elif isinstance(data, dict):
+        if len(data) == 1:
+            # Single top-level key: unwrap container (queue: [...], task: {...})
+            value = next(iter(data.values()))
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        items.append(normalize_keys(item))
+            elif isinstance(value, dict):
+                items.append(normalize_keys(value))
+            else:
+                items.append(normalize_keys(data))
+        else:
+            # Multiple top-level keys: flat dict
+            items.append(normalize_keys(data))
+
+    return items
+
+
+def stats():
+    """Return loader counters (files parsed by each path)."""
+    return {"libyaml": LIBYAML, **_stats}